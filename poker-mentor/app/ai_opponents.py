@@ -2,6 +2,7 @@ import random
 import logging
 from typing import List, Dict, Tuple
 from app.poker_engine import PokerGame, Action, Card, Rank, Suit
+from app.equity import card_to_int, monte_carlo_equity, decision_budget
 
 logger = logging.getLogger(__name__)
 
@@ -12,7 +13,15 @@ class BaseAI:
         self.name = name
         self.aggression = aggression  # 0-1: склонность к рейзам
         self.tightness = tightness    # 0-1: склонность играть только сильные руки
+        self.opponent_stats = None    # PlayerTendencies человека (OpponentTracker)
         
+    def _opponent_stat(self, name: str, default: float, min_hands: int = 20) -> float:
+        """Статистика оппонента, если по нему набралось достаточно рук"""
+        stats = self.opponent_stats
+        if stats is None or stats.tracked_hands < min_hands:
+            return default
+        return getattr(stats, name)
+    
     def decide_action(self, game: PokerGame, player: str) -> Tuple[Action, int]:
         """Принять решение о действии"""
         raise NotImplementedError
@@ -165,6 +174,63 @@ class LAGAI(BaseAI):
         else:
             return Action.CHECK, 0
 
+class EquityAI(BaseAI):
+    """Equity AI - считает эквити Монте-Карло против диапазона оппонента
+    в пределах бюджета времени и выбирает действие по шансам банка и EV"""
+    
+    def __init__(self, budget=None):
+        super().__init__("Equity", aggression=0.6, tightness=0.6)
+        self.budget = budget or decision_budget
+        self.last_equity = 0.5
+        self.last_iterations = 0
+    
+    def decide_action(self, game: PokerGame, player: str) -> Tuple[Action, int]:
+        hole = [card_to_int(card) for card in game.player_cards[player]]
+        board = [card_to_int(card) for card in game.community_cards]
+        
+        equity, iterations = monte_carlo_equity(
+            hole, board,
+            deadline=self.budget.deadline(),
+            range_threshold=self._estimate_opponent_range(game)
+        )
+        
+        self.last_equity = equity
+        self.last_iterations = iterations
+        logger.debug(f"{self.name}: equity={equity:.2f} за {iterations} итераций")
+        return self._choose_action(game, player, equity)
+    
+    def _estimate_opponent_range(self, game: PokerGame) -> float:
+        """Порог силы рук оппонента: после рейза диапазон уже"""
+        if game.current_bet > game.big_blind:
+            # Чем чаще оппонент рейзит, тем шире его рейз-диапазон
+            pfr = self._opponent_stat('pfr', 0.2)
+            return max(0.2, 0.55 - pfr)
+        # Лузовый оппонент входит в банк с широким диапазоном
+        vpip = self._opponent_stat('vpip', 0.5)
+        return max(0.0, 0.4 - vpip * 0.4)
+    
+    def _choose_action(self, game: PokerGame, player: str, equity: float) -> Tuple[Action, int]:
+        """Выбор действия по шансам банка и EV"""
+        to_call = game.current_bet
+        stack = game.player_stacks[player]
+        
+        # Вэлью-рейз с сильным эквити
+        if equity > 0.65 and stack > to_call:
+            raise_amount = max(game.big_blind * 2, int(game.pot * 0.75), to_call * 2)
+            return Action.RAISE, min(raise_amount, stack)
+        
+        if to_call == 0:
+            # Против игрока, часто сбрасывающего на ставку, ставим как блеф
+            if game.community_cards and self._opponent_stat('fold_to_cbet', 0.0) > 0.6 and stack > 0:
+                return Action.RAISE, min(max(game.big_blind, int(game.pot * 0.5)), stack)
+            return Action.CHECK, 0
+        
+        # EV колла: выигрываем банк с вероятностью equity, теряем колл иначе
+        ev_call = equity * game.pot - (1 - equity) * to_call
+        if ev_call >= 0:
+            return Action.CALL, to_call
+        return Action.FOLD, 0
+
 class AIFactory:
     """Фабрика для создания AI оппонентов"""
     
@@ -174,7 +240,8 @@ class AIFactory:
             "fish": FishAI,
             "nit": NitAI,
             "tag": TAGAI,
-            "lag": LAGAI
+            "lag": LAGAI,
+            "equity": EquityAI
         }
         
         if ai_type not in ai_types:
@@ -184,7 +251,7 @@ class AIFactory:
     
     @staticmethod
     def get_ai_types() -> List[str]:
-        return ["fish", "nit", "tag", "lag"]
+        return ["fish", "nit", "tag", "lag", "equity"]
     
     # В ai_opponents.py - ОБНОВИТЬ:
 
@@ -218,6 +285,13 @@ def get_ai_description(ai_type: str) -> str:
 • Частые рейзы и 3-беты
 • Давит слабости
 • 🔥 Тренируйтесь против агрессии
+        """,
+        "equity": """
+🧮 **Equity AI** - Математический оппонент
+• Считает эквити против вашего диапазона
+• Решает по шансам банка и EV
+• Учитывает борд на каждой улице
+• 📐 Тренируйтесь против точной игры
         """
     }
     return descriptions.get(ai_type, "Неизвестный тип AI")
@@ -238,10 +312,16 @@ def test_ai_opponents():
         print(f"{ai.name}: {action.value} {amount}")
 
 class MLEnhancedAI(BaseAI):
+    """Решения модели при уверенности выше порога, иначе - base_ai.
+
+    ml_model - модель с интерфейсом PokerPredictor.predict_action:
+    фичи DataPipeline -> {'action': ..., 'confidence': ...}.
+    """
+    
     def __init__(self, base_ai: BaseAI, ml_model):
+        super().__init__(f"ML-{base_ai.name}", base_ai.aggression, base_ai.tightness)
         self.base_ai = base_ai
         self.ml_model = ml_model
-        self.name = f"ML-{base_ai.name}"
         self.confidence_threshold = 0.7
     
     def decide_action(self, game: PokerGame, player: str) -> Tuple[Action, int]:
@@ -249,14 +329,46 @@ class MLEnhancedAI(BaseAI):
         features = self._extract_ml_features(game, player)
         
         # Получаем предсказание от ML
-        ml_prediction = self.ml_model.predict(features)
-        ml_confidence = self.ml_model.get_confidence(features)
+        ml_prediction = self.ml_model.predict_action(features) if self.ml_model is not None else {}
         
-        if ml_confidence > self.confidence_threshold:
+        if ml_prediction.get('confidence', 0.0) > self.confidence_threshold:
             return self._ml_action_to_game_action(ml_prediction, game)
         else:
             # Fallback на rule-based AI
             return self.base_ai.decide_action(game, player)
+    
+    def _extract_ml_features(self, game: PokerGame, player: str) -> List[float]:
+        """Фичи в раскладке DataPipeline._extract_features"""
+        from app.ml.data_pipeline import ml_data_pipeline
+        
+        street = {0: "preflop", 3: "flop", 4: "turn", 5: "river"}.get(len(game.community_cards), "preflop")
+        opponent = self.opponent_stats
+        game_state = {
+            'hand_strength': ml_data_pipeline.hand_strength([card.code for card in game.player_cards[player]]),
+            'position': ml_data_pipeline.heads_up_position(game.players.index(player)),
+            'stack_ratio': game.player_stacks[player] / 100.0,
+            'pot_ratio': game.pot / 100.0,
+            'effective_stack': min(game.player_stacks.values()) / 100.0,
+            'street': street,
+            'opponent_aggression': opponent.aggression_share if opponent else 0.5,
+            'opponent_tightness': 1 - opponent.vpip if opponent else 0.5,
+        }
+        return ml_data_pipeline._extract_features(game_state)
+    
+    def _ml_action_to_game_action(self, prediction, game: PokerGame) -> Tuple[Action, int]:
+        """Предсказание модели ('fold'/'call'/... или индекс) в действие игры"""
+        if isinstance(prediction, dict):
+            prediction = prediction.get('action', 'fold')
+        if isinstance(prediction, int):
+            prediction = {0: 'fold', 1: 'check', 2: 'call', 3: 'raise'}.get(prediction, 'fold')
+        
+        if prediction == 'raise':
+            return Action.RAISE, max(game.big_blind * 3, int(game.current_bet * 2))
+        if prediction in ('call', 'check'):
+            if game.current_bet > 0:
+                return Action.CALL, game.current_bet
+            return Action.CHECK, 0
+        return Action.FOLD, 0
         
 
 if __name__ == "__main__":
@@ -0,0 +1,53 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+from app.config import config
+from app.database import Database, db
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabase:
+    """Асинхронный фасад над Database.
+
+    Синхронные ORM-запросы выполняются в выделенном пуле потоков, а
+    обработчики бота только ждут результат, так что event loop
+    продолжает обслуживать других пользователей. Публичные методы
+    Database доступны под теми же именами как корутины:
+    await async_db.add_user(...), await async_db.get_user_info(...).
+    """
+
+    def __init__(self, database: Database, max_workers: int = 4):
+        self.database = database
+        # Потоков не больше, чем соединений в пуле engine
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Выполнить произвольную синхронную функцию в пуле потоков БД"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.database, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        async def method(*args, **kwargs):
+            return await self.run(attribute, *args, **kwargs)
+
+        method.__name__ = name
+        method.__doc__ = attribute.__doc__
+        # Кэшируем обертку, следующий доступ не проходит через __getattr__
+        setattr(self, name, method)
+        return method
+
+    def shutdown(self):
+        """Дождаться запросов в работе и остановить пул потоков"""
+        self._executor.shutdown(wait=True)
+
+
+# Глобальный асинхронный доступ к БД
+async_db = AsyncDatabase(db, max_workers=int(config.get('DB_THREADS', 4)))
@@ -1,14 +1,24 @@
+import os
 import logging
+import tempfile
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
 from app.config import config
 from app.database import db
-from app.game_menus import GameMenus, TextTemplates
-from app.game_manager import GameManager
+from app.async_database import async_db
+from app.game_menus import GameMenus, TextTemplates, HistoryMenus
+from app.game_service import GameService
+from app.user_actors import UserActors
 from app.hand_analyzer import hand_analyzer, history_analyzer
 from app.history_manager import history_manager
+from app.hand_index import hand_index, ATTRIBUTES
+from app.hand_archive import run_periodic_archive
+from app import hh_import, export
 from app.statistics import stats_manager
+from app.poker_engine import format_bb
 from app.ml.model_trainer import model_trainer
+from app.ml.data_pipeline import ml_data_pipeline
+from app.equity import decision_budget
 
 # В начале файла добавьте:
 from app.poker_engine import Card, Rank, Suit
@@ -34,41 +44,85 @@ class PokerMentorBot:
         # Инициализируем базу данных
         db.init_db()
         
-        # Инициализируем менеджер игр
-        self.game_manager = GameManager()
+        # Игровой сервис: игры шардированы по процессам-воркерам
+        workers = config.get('GAME_WORKERS')
+        self.game_service = GameService(
+            num_workers=int(workers) if workers is not None else (os.cpu_count() or 1)
+        )
+        
+        # Очереди обновлений по пользователям: порядок внутри пользователя,
+        # параллельность между пользователями
+        self.user_actors = UserActors()
+        # Ожидание ввода карт для анализа: telegram_id -> позиция и сообщение
+        self.waiting_for_cards = {}
         
-        # Создаем приложение Telegram
+        # Создаем приложение Telegram. Обновления обрабатываются параллельно,
+        # поэтому все обработчики выполняются в очереди своего пользователя
         self.token = config.get('TELEGRAM_BOT_TOKEN')
-        self.application = Application.builder().token(self.token).build()
+        self.application = Application.builder().token(self.token).concurrent_updates(True)\
+            .post_init(self._post_init).post_shutdown(self._post_shutdown).build()
         
         # Настраиваем обработчики
         self._setup_handlers()
         logger.info("Poker Mentor Bot инициализирован")
     
+    async def _post_init(self, application: Application):
+        """Фоновые задачи, которым нужен запущенный event loop"""
+        # Монитор лага event loop сжимает бюджет времени equity-ботов под нагрузкой
+        application.create_task(decision_budget.monitor_event_loop())
+        # Пакетная запись last_active пользователей
+        application.create_task(db.run_periodic_activity_flush())
+        # Перенос старых месяцев раздач в колоночный архив
+        application.create_task(run_periodic_archive(db, float(config.get('HAND_ARCHIVE_INTERVAL_HOURS', 24))))
+        # Игровые воркеры (вытеснение простаивающих игр - внутри них)
+        await self.game_service.start()
+    
+    async def _post_shutdown(self, application: Application):
+        """Сохранение буферизованных данных при остановке"""
+        db.flush_activity()
+        await self.game_service.stop()
+        ml_data_pipeline.close()
+        async_db.shutdown()
+    
     def _setup_handlers(self):
         """Настройка обработчиков команд - конструктор функциональности"""
         # Команды
-        self.application.add_handler(CommandHandler("start", self._handle_start))
-        self.application.add_handler(CommandHandler("help", self._handle_help))
-        self.application.add_handler(CommandHandler("settings", self._handle_settings))
+        self.application.add_handler(CommandHandler("start", self._in_user_queue(self._handle_start)))
+        self.application.add_handler(CommandHandler("help", self._in_user_queue(self._handle_help)))
+        self.application.add_handler(CommandHandler("settings", self._in_user_queue(self._handle_settings)))
 
-        self.application.add_handler(CommandHandler("test_game", self._handle_test_game))
-        self.application.add_handler(CommandHandler("choose_ai", self._handle_choose_ai))
+        self.application.add_handler(CommandHandler("test_game", self._in_user_queue(self._handle_test_game)))
+        self.application.add_handler(CommandHandler("choose_ai", self._in_user_queue(self._handle_choose_ai)))
 
-        self.application.add_handler(CommandHandler("analyze", self._handle_analyze))  # ← ДОБАВЬ ЭТУ СТРОКУ
-        self.application.add_handler(CommandHandler("debug", self._handle_debug))
+        self.application.add_handler(CommandHandler("analyze", self._in_user_queue(self._handle_analyze)))  # ← ДОБАВЬ ЭТУ СТРОКУ
+        self.application.add_handler(CommandHandler("debug", self._in_user_queue(self._handle_debug)))
 
-        self.application.add_handler(CommandHandler("history", self._handle_history))
-        self.application.add_handler(CommandHandler("stats", self._handle_stats))
+        self.application.add_handler(CommandHandler("history", self._in_user_queue(self._handle_history)))
+        self.application.add_handler(CommandHandler("stats", self._in_user_queue(self._handle_stats)))
+        self.application.add_handler(CommandHandler("find", self._in_user_queue(self._handle_find)))
+        self.application.add_handler(CommandHandler("export", self._in_user_queue(self._handle_export)))
 
-        self.application.add_handler(CommandHandler("ml_status", self._handle_ml_status))
-        self.application.add_handler(CommandHandler("train_ml", self._handle_train_ml))
+        self.application.add_handler(CommandHandler("ml_status", self._in_user_queue(self._handle_ml_status)))
+        self.application.add_handler(CommandHandler("train_ml", self._in_user_queue(self._handle_train_ml)))
         # Обработчики кнопок и сообщений
         self.application.add_handler(CallbackQueryHandler(self._handle_callback_query))
-        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self._handle_text_message))
-
-        self.application.add_handler(CommandHandler("profile", self._handle_profile))
-        self.application.add_handler(CommandHandler("learning", self._handle_learning))
+        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self._in_user_queue(self._handle_text_message)))
+        self.application.add_handler(MessageHandler(filters.Document.FileExtension("txt"),
+                                                     self._in_user_queue(self._handle_hand_history_file)))
+
+        self.application.add_handler(CommandHandler("profile", self._in_user_queue(self._handle_profile)))
+        self.application.add_handler(CommandHandler("learning", self._in_user_queue(self._handle_learning)))
+    
+    def _in_user_queue(self, handler):
+        """Обработчик, выполняемый в очереди пользователя: его обновления - строго по порядку"""
+        async def queued(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            user = update.effective_user
+            if user is None:
+                await handler(update, context)
+                return
+            if not self.user_actors.submit(str(user.id), None, lambda: handler(update, context)):
+                await update.effective_message.reply_text("⏳ Предыдущий запрос еще обрабатывается")
+        return queued
     
     # ===== ОСНОВНЫЕ ОБРАБОТЧИКИ =====
     
@@ -77,7 +131,7 @@ class PokerMentorBot:
         user = update.effective_user
         
         # Сохраняем пользователя в БД
-        db_user = db.add_user(
+        db_user = await async_db.add_user(
             telegram_id=user.id,
             username=user.username,
             first_name=user.first_name,
@@ -85,7 +139,7 @@ class PokerMentorBot:
         )
         
         # Получаем статистику
-        user_stats = db.get_user_stats(db_user['id'])
+        user_stats = await async_db.get_user_stats(db_user['id'])
         hands_played = user_stats['total_hands_played'] if user_stats else 0
         
         # Отправляем приветствие
@@ -113,12 +167,12 @@ class PokerMentorBot:
         )
     
     async def _handle_test_game(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик команды /test_game"""
-        user_id = str(update.effective_user.id)
-        
-        # Создаем тестовую игру
-        game = self.game_manager.create_game(user_id, "fish")
-        game_state = self.game_manager.get_game_state(user_id)
+        """Обработчик команды /test_game (выполняется в очереди пользователя)"""
+        await self._start_test_game(update, context, str(update.effective_user.id))
+    
+    async def _start_test_game(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: str):
+        """Создать тестовую игру (в очереди пользователя)"""
+        game_state = await self.game_service.create_game(user_id, "fish")
         
         # Отправляем информацию о игре
         game_text = TextTemplates.get_game_start_text(
@@ -144,29 +198,21 @@ class PokerMentorBot:
     async def _handle_callback_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик нажатий на кнопки"""
         query = update.callback_query
-        await query.answer()
-    
         user_id = str(update.effective_user.id)
         callback_data = query.data
+        db.update_user_activity(update.effective_user.id)
+        
+        # Игровая клавиатура одноразовая: на одном сообщении принимается одно
+        # действие. Прочие кнопки отклоняются, только пока нажатие в очереди
+        message_id = query.message.message_id if query.message else None
+        is_game_action = callback_data.startswith("game_")
+        key = (message_id, "game" if is_game_action else callback_data)
+        if not self.user_actors.submit(user_id, key, lambda: self._process_callback(query, user_id, callback_data),
+                                       one_shot=is_game_action):
+            await query.answer("⏳ Действие уже обрабатывается")
+            return
+        await query.answer()
     
-    # Обрабатываем выбор AI
-        if callback_data.startswith("ai_"):
-            ai_type = callback_data[3:]
-            await self._start_game_with_ai(query, user_id, ai_type)
-    
-    # Обрабатываем игровые действия
-        elif callback_data.startswith("game_"):
-            action = callback_data[5:]
-            await self._handle_game_action(query, user_id, action)
-    
-    # Обрабатываем анализ ← ДОБАВЬ ЭТОТ БЛОК
-        elif callback_data.startswith("analyze_"):
-            await self._handle_analysis(query, callback_data[8:])
-    
-    # Обрабатываем выбор позиции ← ДОБАВЬ ЭТОТ БЛОК
-        elif callback_data.startswith("position_"):
-            await self._handle_position_selection(query, callback_data[9:]) 
-
     async def _handle_analysis(self, query, analysis_type: str):
         """Обработчик анализа"""
         from app.game_menus import AnalysisMenus  # ← ДОБАВЬ ЭТОТ ИМПОРТ
@@ -200,8 +246,7 @@ class PokerMentorBot:
             f"Примеры: AKs, QJo, 99, T2s")
     
     # Сохраняем состояние ожидания ввода карт
-        self.waiting_for_cards = {
-            "user_id": query.from_user.id,
+        self.waiting_for_cards[query.from_user.id] = {
             "position": position,
             "message_id": query.message.message_id}
 
@@ -229,7 +274,7 @@ class PokerMentorBot:
         user_id = update.effective_user.id
 
 
-        if hasattr(self, 'waiting_for_cards') and self.waiting_for_cards["user_id"] == user_id:
+        if user_id in self.waiting_for_cards:
             await self._process_hand_input(update, text)
             return
         # Обрабатываем кнопки главного меню
@@ -254,8 +299,7 @@ class PokerMentorBot:
         """Начать игру с выбранным AI"""
         try:
             # Создаем игру
-            game = self.game_manager.create_game(user_id, ai_type)
-            game_state = self.game_manager.get_game_state(user_id)
+            game_state = await self.game_service.create_game(user_id, ai_type)
             
             # Отправляем информацию о игре
             game_text = TextTemplates.get_game_start_text(
@@ -277,7 +321,7 @@ class PokerMentorBot:
     async def _handle_game_action(self, query, user_id: str, action: str):
         """Обработать игровое действие"""
         # Обрабатываем действие через менеджер игр
-        result = self.game_manager.process_player_action(user_id, action)
+        result = await self.game_service.process_player_action(user_id, action)
         
         if "error" in result:
             await query.edit_message_text(result["error"])
@@ -288,8 +332,8 @@ class PokerMentorBot:
         if "ai_message" in result:
             response_text += f"\n{result['ai_message']}"
         
-        response_text += f"\n\n💰 Банк: {result['pot']} BB"
-        response_text += f"\n💵 Ваш стек: {result['player_stack']} BB"
+        response_text += f"\n\n💰 Банк: {format_bb(result['pot'])}"
+        response_text += f"\n💵 Ваш стек: {format_bb(result['player_stack'])}"
         
         # Добавляем информацию о community cards
         if result.get("community_cards"):
@@ -301,7 +345,7 @@ class PokerMentorBot:
             if "winner" in result:
                 response_text += f"\n\n🏆 Победитель: {result['winner']}"
                 response_text += f"\n🎯 Комбинация: {result['winning_hand']}"
-            self.game_manager.end_game(user_id)
+            await self.game_service.end_game(user_id)
             await query.edit_message_text(response_text)
             return
         
@@ -333,7 +377,7 @@ class PokerMentorBot:
             from app.poker_engine import Card, Rank, Suit  # ← ДОБАВЬ ЭТОТ ИМПОРТ
         
         # Получаем сохраненное состояние
-            waiting_data = self.waiting_for_cards
+            waiting_data = self.waiting_for_cards[update.effective_user.id]
             position = waiting_data["position"]
         
         # Парсим ввод руки
@@ -352,12 +396,11 @@ class PokerMentorBot:
             await update.message.reply_text(analysis_text, parse_mode='Markdown')
         
         # Очищаем состояние ожидания
-            del self.waiting_for_cards
+            self.waiting_for_cards.pop(update.effective_user.id, None)
         
         except Exception as e:
             await update.message.reply_text(f"❌ Ошибка анализа: {e}")
-            if hasattr(self, 'waiting_for_cards'):
-                del self.waiting_for_cards
+            self.waiting_for_cards.pop(update.effective_user.id, None)
 
     def _parse_hand_input(self, hand_input: str):
         """Парсить текстовый ввод руки в карты"""
@@ -415,15 +458,9 @@ class PokerMentorBot:
         self.application.run_polling()
 # ДОБАВИТЬ в класс PokerMentorBot:
 
-    async def _handle_callback_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик нажатий на кнопки с улучшенной обработкой ошибок"""
+    async def _process_callback(self, query, user_id: str, callback_data: str):
+        """Обработать нажатие кнопки (в очереди пользователя) с обработкой ошибок"""
         try:
-            query = update.callback_query
-            await query.answer()
-        
-            user_id = str(update.effective_user.id)
-            callback_data = query.data
-
         # Обрабатываем выбор AI
             if callback_data.startswith("ai_"):
                 ai_type = callback_data[3:]
@@ -454,12 +491,15 @@ class PokerMentorBot:
             elif callback_data.startswith("learn_") or callback_data.startswith("lesson_"):
                 await self._handle_learning_callback(query, callback_data)
 
+            elif callback_data.startswith("hist_"):
+                await self._handle_history_callback(query, int(user_id), callback_data[5:])
+
             else:
                 await query.edit_message_text("❌ Неизвестная команда")
 
         except Exception as e:
             logger.error(f"Ошибка в callback: {e}")
-            await update.callback_query.edit_message_text("❌ Произошла ошибка. Попробуйте снова.")
+            await query.edit_message_text("❌ Произошла ошибка. Попробуйте снова.")
 
 
     async def _handle_profile_callback(self, query, action: str):
@@ -510,9 +550,10 @@ class PokerMentorBot:
         try:
             text = update.message.text.strip()
             user_id = update.effective_user.id
+            db.update_user_activity(user_id)
 
             # Проверяем ожидание ввода карт
-            if hasattr(self, 'waiting_for_cards') and self.waiting_for_cards.get("user_id") == user_id:
+            if user_id in self.waiting_for_cards:
                 await self._process_hand_input(update, text)
                 return
             elif text == "⚙️ Настроить игру":
@@ -548,41 +589,192 @@ class PokerMentorBot:
     async def _handle_debug(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда для отладки (/debug)"""
         user_id = update.effective_user.id
+        active_games = await self.game_service.active_game_count()
+        user_count = await async_db.count_users()
+        session_count = await async_db.count_sessions()
         debug_info = f"""
 🔧  **Отладочная информация**
 
     👤 Пользователь: {user_id}
-    🎮 Активных игр: {len(self.game_manager.active_games)}
+    🎮 Активных игр: {active_games}
     💾 База данных: {config.get('DATABASE_URL')}
 
     📊 Статистика:
-    • Пользователей в БД: {self._get_user_count()}
-    • Игровых сессий: {self._get_session_count()}
+    • Пользователей в БД: {user_count}
+    • Игровых сессий: {session_count}
+    • Кэш пользователей: {len(db.user_cache)} записей, попаданий {db.user_cache.hit_rate:.0%}
         """
         await update.message.reply_text(debug_info)
 
     async def _handle_history(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать историю игр"""
         user_id = update.effective_user.id
-        sessions = history_manager.get_recent_sessions(user_id, 5)
+        sessions, next_cursor = await async_db.run(history_manager.get_sessions_page, user_id, 5)
     
         if not sessions:
             await update.message.reply_text("📝 У вас еще нет сыгранных сессий")
             return
     
+        await update.message.reply_text(self._format_sessions(sessions), parse_mode='Markdown',
+                                        reply_markup=HistoryMenus.get_sessions_menu(sessions, next_cursor))
+    
+    def _format_sessions(self, sessions: list) -> str:
+        """Текст страницы сессий"""
         text = "📊 **Последние игры:**\n\n"
         for session in sessions:
             text += f"🕐 **{session['date']}**\n"
             text += f"🤖 Оппонент: {session['opponent']}\n"
             text += f"🎯 Рук: {session['hands_played']} | Результат: {session['result']}\n"
             text += f"⏱️ Длительность: {session['duration']}\n\n"
+        return text
     
+    async def _handle_history_callback(self, query, telegram_id: int, data: str):
+        """Навигация по истории: p_<курсор> - сессии, s_<id>/n_<id>_<номер> - раздачи, h_<id> - раздача"""
+        kind, _, value = data.partition('_')
+        
+        if kind == "p":
+            sessions, next_cursor = await async_db.run(
+                history_manager.get_sessions_page, telegram_id, 5, value or None)
+            if not sessions:
+                await query.edit_message_text("📝 Больше сессий нет")
+                return
+            await query.edit_message_text(self._format_sessions(sessions), parse_mode='Markdown',
+                                          reply_markup=HistoryMenus.get_sessions_menu(sessions, next_cursor))
+        
+        elif kind in ("s", "n"):
+            session_id, _, after = value.partition('_')
+            hands, next_hand = await async_db.run(
+                history_manager.get_session_hands, int(session_id), telegram_id, 10, int(after or 0))
+            if not hands:
+                await query.edit_message_text("📝 В сессии нет сохраненных раздач")
+                return
+            await query.edit_message_text(f"🃏 **Раздачи сессии #{session_id}:**", parse_mode='Markdown',
+                                          reply_markup=HistoryMenus.get_hands_menu(int(session_id), hands, next_hand))
+        
+        elif kind == "h":
+            hand = await async_db.run(history_manager.get_hand, int(value), telegram_id)
+            if not hand:
+                await query.edit_message_text("❌ Раздача не найдена")
+                return
+            await query.edit_message_text(self._format_hand(hand),
+                                          reply_markup=HistoryMenus.get_hand_menu(hand['session_id']))
+    
+    def _format_hand(self, hand: dict) -> str:
+        """Текст одной раздачи"""
+        player = hand['player']
+        result = hand['result'] or {}
+        net = (result.get('net') or {}).get(player, 0)
+        text = f"🃏 Раздача #{hand['hand_number']}\n\n"
+        text += f"🎪 Позиция: {(hand['positions'] or {}).get(player, '?')}\n"
+        text += f"🂠 Ваши карты: {' '.join((hand['hole_cards'] or {}).get(player) or [])}\n"
+        text += f"🃏 Борд: {' '.join(hand['community_cards'] or []) or '—'}\n\n"
+        for event in hand['actions'] or []:
+            who = "Вы" if event['player'] == player else "AI"
+            amount = f" {format_bb(event['amount'])}" if event['amount'] else ""
+            text += f"• {event['street']}: {who} {event['action']}{amount}\n"
+        text += f"\n💰 Банк: {format_bb(result.get('pot', 0))} | Результат: {format_bb(net, signed=True)}\n"
+        if result.get('winning_hand'):
+            text += f"🏆 Комбинация: {result['winning_hand']}\n"
+        mistakes = (hand['analysis'] or {}).get('mistakes') or []
+        if mistakes:
+            text += "\n⚠️ Ошибки: " + "; ".join(mistakes)
+        return text
+
+    async def _handle_find(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Поиск раздач: /find hand=AKs,AQs ip=oop board=monotone action=river_call"""
+        user_id = update.effective_user.id
+        conditions = {}
+        for arg in context.args or []:
+            attribute, _, values = arg.partition('=')
+            if values:
+                conditions[attribute.lower()] = values.split(',')
+        
+        if not conditions:
+            values = await async_db.run(hand_index.values, user_id)
+            text = "🔎 Поиск раздач: /find признак=значение[,значение] ...\n"
+            text += "Признаки объединяются через И, значения одного признака - через ИЛИ.\n\n"
+            for attribute in ATTRIBUTES:
+                known = sorted(values.get(attribute, {}))
+                text += f"• {attribute}: {', '.join(known[:15]) or '—'}\n"
+            text += "\nПример: /find hand=AKs ip=oop board=monotone action=river_call"
+            await update.message.reply_text(text)
+            return
+        
+        try:
+            total, hand_ids = await async_db.run(hand_index.search, user_id, conditions, 10)
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}. Доступны: {', '.join(ATTRIBUTES)}")
+            return
+        
+        if not total:
+            await update.message.reply_text("🔎 Раздач не найдено")
+            return
+        hands = await async_db.run(history_manager.get_hands, hand_ids, user_id)
+        await update.message.reply_text(f"🔎 Найдено раздач: {total}. Последние:",
+                                        reply_markup=HistoryMenus.get_found_hands_menu(hands))
+
+    async def _handle_hand_history_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Импорт присланного файла истории раздач (PokerStars и совместимые)"""
+        user_id = update.effective_user.id
+        document = update.message.document
+        await update.message.reply_text(f"📥 Импортирую {document.file_name}...")
+        
+        fd, path = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+        try:
+            telegram_file = await document.get_file()
+            await telegram_file.download_to_drive(path)
+            totals = await async_db.run(hh_import.import_files, db, [path], user_id,
+                                        int(config.get('HH_IMPORT_WORKERS', 1)))
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}. Используйте /start")
+            return
+        except Exception as e:
+            logger.error(f"Ошибка импорта истории раздач: {e}")
+            await update.message.reply_text("❌ Не удалось импортировать файл")
+            return
+        finally:
+            os.remove(path)
+        
+        text = f"✅ Импортировано раздач: {totals['hands']}"
+        if totals['duplicates']:
+            text += f"\n♻️ Уже были импортированы: {totals['duplicates']}"
+        if totals['errors']:
+            text += f"\n⚠️ Не разобрано: {totals['errors']}"
+        text += "\n\n_Используйте /stats и /history для просмотра_"
         await update.message.reply_text(text, parse_mode='Markdown')
 
+    async def _handle_export(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Выгрузка своих данных файлом: /export [hands|stats|daily] [csv|jsonl]"""
+        user_id = update.effective_user.id
+        args = [arg.lower() for arg in context.args or []]
+        kind = next((arg for arg in args if arg in export.KINDS), 'hands')
+        fmt = next((arg for arg in args if arg in export.FORMATS), 'csv')
+        await update.message.reply_text(f"📤 Готовлю выгрузку {kind} ({fmt})...")
+        
+        fd, path = tempfile.mkstemp(suffix=f'.{fmt}.gz')
+        os.close(fd)
+        try:
+            _, rows = await async_db.run(export.export, db, kind, path, fmt, user_id, True)
+            if not rows:
+                await update.message.reply_text("📭 Нет данных для выгрузки")
+                return
+            with open(path, 'rb') as f:
+                await update.message.reply_document(
+                    f, filename=os.path.basename(export.default_path(kind, fmt, user_id, True)),
+                    caption=f"✅ Строк: {rows}")
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}. Используйте /start")
+        except Exception as e:
+            logger.error(f"Ошибка выгрузки: {e}")
+            await update.message.reply_text("❌ Не удалось выгрузить данные")
+        finally:
+            os.remove(path)
+
     async def _handle_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать статистику"""
         user_id = update.effective_user.id
-        stats = stats_manager.get_user_stats(user_id)
+        stats = await async_db.run(stats_manager.get_user_stats, user_id)
     
         text = "📈 **Ваша статистика:**\n\n"
         text += f"🎓 **Уровень:** {stats['level'].title()}\n"
@@ -591,16 +783,16 @@ class PokerMentorBot:
         text += f"🎯 **VPIP/PFR:** {stats['vpip']}/{stats['pfr']}\n"
         text += f"⚡ **Агрессия:** {stats['aggression']}\n\n"
     
-        text += "⭐ **Лучшая рука:** {stats['best_hand']}\n"
-        text += "💡 **Основная утечка:** {stats['worst_leak']}\n"
-        text += "📈 **Прогресс за месяц:** {stats['monthly_progress']}\n\n"
+        text += f"⭐ **Лучшая рука:** {stats['best_hand']}\n"
+        text += f"💡 **Основная утечка:** {stats['worst_leak']}\n"
+        text += f"📈 **Прогресс за месяц:** {stats['monthly_progress']}\n\n"
     
         text += "_Используйте /history для просмотра последних игр_"
     
         await update.message.reply_text(text, parse_mode='Markdown')
     async def _handle_ml_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Статус ML системы"""
-        status = model_trainer.get_training_status()
+        status = await async_db.run(model_trainer.get_training_status)
     
         text = "🤖 **Статус ML системы:**\n\n"
         text += f"📊 **Данных собрано:** {status['data_collected']}\n"
@@ -614,7 +806,7 @@ class PokerMentorBot:
 
     async def _handle_train_ml(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Запуск обучения ML модели"""
-        result = model_trainer.start_training()
+        result = await async_db.run(model_trainer.start_training)
     
         text = "🎯 **Результат обучения ML:**\n\n"
     
@@ -677,7 +869,7 @@ class PokerMentorBot:
 
     async def _handle_profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик профиля пользователя"""
-        user_info = db.get_user_info(update.effective_user.id)
+        user_info = await async_db.get_user_info(update.effective_user.id)
     
         profile_text = f"""
         👤 **Ваш профиль**
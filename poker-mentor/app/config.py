@@ -43,6 +43,13 @@ DATABASE_URL=sqlite:///poker_mentor.db
 # Настройки игры
 DEFAULT_STAKE=1/2
 DEFAULT_GAME_TYPE=cash
+
+# Хранилище активных игр
+GAME_STORE_MAX_GAMES=5000
+GAME_STORE_IDLE_TTL=1800
+
+# Число процессов с играми (0 - игры в процессе бота)
+GAME_WORKERS=2
 """
         try:
             with open(self.config_file, 'w', encoding='utf-8') as f:
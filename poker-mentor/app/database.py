@@ -1,33 +1,258 @@
+import time
 import logging
-from sqlalchemy import create_engine
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from sqlalchemy import case, create_engine, event, inspect, text, update
 from sqlalchemy.orm import sessionmaker
-from app.models import Base, User, GameSession, HandHistory, UserStats
+from sqlalchemy.sql import func
+from app.models import Base, User, GameSession, HandHistory, UserStats, UserDailyStats
 from app.config import config
-from datetime import datetime
+from datetime import datetime, timedelta
 from app.models import UserLevel, GameType, SessionStatus
 
 logger = logging.getLogger(__name__)
 
+# Раздачи против одного AI с перерывом меньше этого объединяются в сессию
+SESSION_GAP = timedelta(minutes=30)
+
+# PRAGMA для каждого нового SQLite-соединения пула
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+)
+
+class ActivityBuffer:
+    """Последняя активность пользователей в памяти до пакетной записи"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dirty = {}
+    
+    def __len__(self):
+        return len(self._dirty)
+    
+    def touch(self, telegram_id, timestamp=None):
+        """Запомнить время активности (перезаписывает предыдущее)"""
+        with self._lock:
+            self._dirty[telegram_id] = timestamp or datetime.utcnow()
+    
+    def take_dirty(self):
+        """Забрать накопленные отметки для записи в БД"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        return dirty
+    
+    def restore_dirty(self, dirty):
+        """Вернуть отметки после неудачной записи, не затирая более новые"""
+        with self._lock:
+            for telegram_id, timestamp in dirty.items():
+                current = self._dirty.get(telegram_id)
+                if current is None or current < timestamp:
+                    self._dirty[telegram_id] = timestamp
+
+class UserCache:
+    """Ограниченный LRU-кэш профиля и статистики по telegram_id.
+    
+    Пишущие методы Database обновляют или сбрасывают записи. Игровые
+    воркеры пишут в свою копию Database и присылают боту telegram_id
+    измененных пользователей (on_invalidate); TTL остается страховкой
+    от изменений, о которых никто не сообщил.
+    """
+    
+    def __init__(self, max_size=10000, ttl=60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # telegram_id -> {часть: (значение, срок)}
+        self._telegram_ids = {}  # users.id -> telegram_id
+        # Вызывается при каждом сбросе: on_invalidate(telegram_id, part)
+        self.on_invalidate = None
+        self.hits = 0
+        self.misses = 0
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+    
+    def telegram_id_for(self, user_id):
+        return self._telegram_ids.get(user_id)
+    
+    def get(self, telegram_id, part):
+        """Копия закэшированной части записи или None"""
+        with self._lock:
+            entry = self._entries.get(telegram_id)
+            cached = entry.get(part) if entry is not None else None
+            if cached is not None and cached[1] < time.monotonic():
+                self._drop_part(telegram_id, part)
+                cached = None
+            if cached is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(telegram_id)
+            self.hits += 1
+            return dict(cached[0])
+    
+    def put(self, telegram_id, part, value):
+        """Сохранить часть записи (info или stats), срок жизни части - заново"""
+        with self._lock:
+            entry = self._entries.get(telegram_id)
+            if entry is None:
+                entry = self._entries[telegram_id] = {}
+            entry[part] = (dict(value), time.monotonic() + self.ttl)
+            if part == 'info':
+                self._telegram_ids[value['id']] = telegram_id
+            self._entries.move_to_end(telegram_id)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+    
+    def invalidate(self, telegram_id, part=None):
+        """Сбросить запись целиком или одну ее часть"""
+        with self._lock:
+            if telegram_id in self._entries:
+                if part is None:
+                    self._drop(telegram_id)
+                else:
+                    self._drop_part(telegram_id, part)
+        if self.on_invalidate is not None:
+            self.on_invalidate(telegram_id, part)
+    
+    def stats(self):
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate}
+    
+    def _drop(self, telegram_id):
+        entry = self._entries.pop(telegram_id)
+        info = entry.get('info')
+        if info is not None:
+            self._telegram_ids.pop(info[0]['id'], None)
+    
+    def _drop_part(self, telegram_id, part):
+        entry = self._entries[telegram_id]
+        if part == 'info' and 'info' in entry:
+            self._telegram_ids.pop(entry['info'][0]['id'], None)
+        entry.pop(part, None)
+        if not entry:
+            del self._entries[telegram_id]
+
 class Database:
+    # Размер одного UPDATE ... CASE при сбросе активности: 3 параметра на
+    # пользователя (WHEN, THEN, IN) - меньше лимита 999 старых SQLite
+    ACTIVITY_CHUNK = 300
+    
     def __init__(self):
         self.database_url = config.get('DATABASE_URL', 'sqlite:///poker_mentor.db')
-        self.engine = create_engine(self.database_url)
+        self.is_sqlite = self.database_url.startswith('sqlite')
+        
+        engine_options = {
+            'pool_pre_ping': True,
+            # Кэш скомпилированных SQL-выражений SQLAlchemy
+            'query_cache_size': 1000,
+        }
+        if self.is_sqlite and ':memory:' not in self.database_url:
+            engine_options.update(
+                pool_size=int(config.get('DB_POOL_SIZE', 5)),
+                max_overflow=int(config.get('DB_MAX_OVERFLOW', 10)),
+                connect_args={
+                    # Соединения пула используются из пула потоков и фоновых писателей
+                    'check_same_thread': False,
+                    'timeout': 30,
+                    # Кэш подготовленных выражений sqlite3 на соединение
+                    'cached_statements': 512,
+                },
+            )
+        self.engine = create_engine(self.database_url, **engine_options)
+        if self.is_sqlite:
+            event.listen(self.engine, "connect", self._configure_sqlite)
         self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.activity = ActivityBuffer()
+        self.user_cache = UserCache(
+            max_size=int(config.get('USER_CACHE_SIZE', 10000)),
+            ttl=float(config.get('USER_CACHE_TTL', 60))
+        )
+    
+    @staticmethod
+    def _configure_sqlite(dbapi_connection, connection_record):
+        """Настройка нового SQLite-соединения"""
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in SQLITE_PRAGMAS:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
         
     def init_db(self):
         """Инициализация базы данных - создание таблиц"""
         try:
             Base.metadata.create_all(bind=self.engine)
+            self._add_missing_columns()
+            self._add_missing_indexes()
             logger.info("База данных инициализирована")
             print("✅ База данных создана успешно")
         except Exception as e:
             logger.error(f"Ошибка инициализации БД: {e}")
             raise
     
+    def _add_missing_columns(self):
+        """Добавить в существующие таблицы колонки, появившиеся в моделях"""
+        inspector = inspect(self.engine)
+        with self.engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue
+                existing = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing:
+                        continue
+                    column_type = column.type.compile(dialect=self.engine.dialect)
+                    ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                    if isinstance(default, (int, float)):
+                        ddl += f" DEFAULT {default}"
+                    conn.execute(text(ddl))
+                    logger.info(f"Добавлена колонка {table.name}.{column.name}")
+    
+    def _add_missing_indexes(self):
+        """Создать индексы моделей, которых нет в существующей БД (см. migrations/)"""
+        with self.engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+    
     def get_session(self):
         """Получить сессию БД"""
         return self.SessionLocal()
     
+    @contextmanager
+    def session_scope(self):
+        """Сессия с commit при успехе и rollback при ошибке"""
+        session = self.SessionLocal()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+    
+    @contextmanager
+    def raw_connection(self):
+        """DB-API соединение из общего пула (для sqlite3-кода ML модулей)"""
+        connection = self.engine.raw_connection()
+        try:
+            yield connection
+        finally:
+            # Возврат в пул, а не закрытие
+            connection.close()
+    
     def add_user(self, telegram_id, username=None, first_name=None, last_name=None):
         """Добавить нового пользователя"""
         session = self.get_session()
@@ -35,19 +260,12 @@ class Database:
             # Проверяем, существует ли пользователь
             existing_user = session.query(User).filter(User.telegram_id == telegram_id).first()
             if existing_user:
-                # Обновляем время активности
-                existing_user.last_active = datetime.utcnow()
-                session.commit()
+                # Время активности запишется пачкой (flush_activity)
+                self.activity.touch(telegram_id)
                 # Возвращаем копию данных, а не сам объект
-                return {
-                    'id': existing_user.id,
-                    'telegram_id': existing_user.telegram_id,
-                    'username': existing_user.username,
-                    'first_name': existing_user.first_name,
-                    'last_name': existing_user.last_name,
-                    'level': existing_user.level.value,
-                    'created_at': existing_user.created_at
-                }
+                user_info = self._user_to_dict(existing_user)
+                self.user_cache.put(telegram_id, 'info', user_info)
+                return user_info
             
             # Создаем нового пользователя
             new_user = User(
@@ -69,15 +287,10 @@ class Database:
             logger.info(f"Создан новый пользователь: {new_user}")
             
             # Возвращаем копию данных, а не сам объект
-            return {
-                'id': new_user.id,
-                'telegram_id': new_user.telegram_id,
-                'username': new_user.username,
-                'first_name': new_user.first_name,
-                'last_name': new_user.last_name,
-                'level': new_user.level.value,
-                'created_at': new_user.created_at
-            }
+            user_info = self._user_to_dict(new_user)
+            self.user_cache.put(telegram_id, 'info', user_info)
+            self.user_cache.put(telegram_id, 'stats', self._stats_to_dict(user_stats))
+            return user_info
             
         except Exception as e:
             session.rollback()
@@ -86,21 +299,42 @@ class Database:
         finally:
             session.close()
     
+    @staticmethod
+    def _user_to_dict(user):
+        return {
+            'id': user.id,
+            'telegram_id': user.telegram_id,
+            'username': user.username,
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'level': user.level.value,
+            'created_at': user.created_at
+        }
+    
+    @staticmethod
+    def _stats_to_dict(stats):
+        from app.opponent_tracker import COUNTER_FIELDS
+        user_stats = {
+            'total_hands_played': stats.total_hands_played or 0,
+            'total_sessions': stats.total_sessions or 0,
+            'total_profit': stats.total_profit or 0
+        }
+        # Счетчики стиля игры (их пишут игровые воркеры)
+        user_stats.update({field: getattr(stats, field) or 0 for field in COUNTER_FIELDS})
+        return user_stats
+    
     def get_user_info(self, telegram_id):
-        """Получить информацию о пользователе без detached объектов"""
+        """Получить информацию о пользователе без detached объектов (через кэш)"""
+        cached = self.user_cache.get(telegram_id, 'info')
+        if cached is not None:
+            return cached
         session = self.get_session()
         try:
             user = session.query(User).filter(User.telegram_id == telegram_id).first()
             if user:
-                return {
-                    'id': user.id,
-                    'telegram_id': user.telegram_id,
-                    'username': user.username,
-                    'first_name': user.first_name,
-                    'last_name': user.last_name,
-                    'level': user.level.value,
-                    'created_at': user.created_at
-                }
+                user_info = self._user_to_dict(user)
+                self.user_cache.put(telegram_id, 'info', user_info)
+                return user_info
             return None
         except Exception as e:
             logger.error(f"Ошибка получения пользователя: {e}")
@@ -109,16 +343,24 @@ class Database:
             session.close()
     
     def get_user_stats(self, user_id):
-        """Получить статистику пользователя"""
+        """Получить статистику пользователя (через кэш)"""
+        telegram_id = self.user_cache.telegram_id_for(user_id)
+        if telegram_id is not None:
+            cached = self.user_cache.get(telegram_id, 'stats')
+            if cached is not None:
+                return cached
         session = self.get_session()
         try:
-            stats = session.query(UserStats).filter(UserStats.user_id == user_id).first()
-            if stats:
-                return {
-                    'total_hands_played': stats.total_hands_played,
-                    'total_sessions': stats.total_sessions,
-                    'total_profit': stats.total_profit
-                }
+            row = session.query(UserStats, User.telegram_id)\
+                .join(User, User.id == UserStats.user_id)\
+                .filter(UserStats.user_id == user_id).first()
+            if row:
+                stats, telegram_id = row
+                user_stats = self._stats_to_dict(stats)
+                # Без info запись не найти по users.id, кэшируем только вместе с ней
+                if self.user_cache.telegram_id_for(user_id) is not None:
+                    self.user_cache.put(telegram_id, 'stats', user_stats)
+                return user_stats
             return None
         except Exception as e:
             logger.error(f"Ошибка получения статистики: {e}")
@@ -127,16 +369,199 @@ class Database:
             session.close()
     
     def update_user_activity(self, telegram_id):
-        """Обновить время последней активности"""
-        session = self.get_session()
+        """Обновить время последней активности (в памяти, без обращения к БД)"""
+        self.activity.touch(telegram_id)
+    
+    def flush_activity(self):
+        """Записать накопленную активность пакетными UPDATE, вернуть число пользователей"""
+        dirty = self.activity.take_dirty()
+        if not dirty:
+            return 0
+        items = list(dirty.items())
         try:
-            user = session.query(User).filter(User.telegram_id == telegram_id).first()
-            if user:
-                user.last_active = datetime.utcnow()
-                session.commit()
+            with self.session_scope() as session:
+                for start in range(0, len(items), self.ACTIVITY_CHUNK):
+                    chunk = dict(items[start:start + self.ACTIVITY_CHUNK])
+                    session.execute(
+                        update(User)
+                        .where(User.telegram_id.in_(list(chunk)))
+                        .values(last_active=case(chunk, value=User.telegram_id))
+                        .execution_options(synchronize_session=False)
+                    )
+            logger.debug(f"Активность {len(dirty)} пользователей записана в БД")
+            return len(dirty)
         except Exception as e:
             logger.error(f"Ошибка обновления активности: {e}")
+            self.activity.restore_dirty(dirty)
+            return 0
+    
+    async def run_periodic_activity_flush(self, interval=5.0):
+        """Фоновая задача: сброс активности в пуле потоков"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            if len(self.activity):
+                await loop.run_in_executor(None, self.flush_activity)
+
+    def count_users(self):
+        """Число пользователей"""
+        with self.session_scope() as session:
+            return session.query(func.count(User.id)).scalar()
+    
+    def count_sessions(self):
+        """Число игровых сессий"""
+        with self.session_scope() as session:
+            return session.query(func.count(GameSession.id)).scalar()
+    
+    def load_player_tendencies(self, telegram_id):
+        """Загрузить счетчики стиля игры пользователя"""
+        from app.opponent_tracker import COUNTER_FIELDS
+        session = self.get_session()
+        try:
+            stats = session.query(UserStats).join(User, User.id == UserStats.user_id)\
+                .filter(User.telegram_id == telegram_id).first()
+            if stats:
+                return {field: getattr(stats, field) or 0 for field in COUNTER_FIELDS}
+            return None
+        finally:
+            session.close()
+    
+    def apply_tendency_deltas(self, deltas):
+        """Применить приращения счетчиков для многих пользователей одной транзакцией"""
+        session = self.get_session()
+        try:
+            users = session.query(User.id, User.telegram_id)\
+                .filter(User.telegram_id.in_(list(deltas.keys()))).all()
+            for user_id, telegram_id in users:
+                delta = deltas[telegram_id]
+                values = {
+                    getattr(UserStats, field): func.coalesce(getattr(UserStats, field), 0) + value
+                    for field, value in delta.items()
+                }
+                session.query(UserStats).filter(UserStats.user_id == user_id)\
+                    .update(values, synchronize_session=False)
+            session.commit()
+            for telegram_id in deltas:
+                self.user_cache.invalidate(telegram_id, 'stats')
+        except Exception:
             session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def get_daily_totals(self, telegram_id, since):
+        """Суммы дневных итогов пользователя с даты since (не больше строк, чем дней)"""
+        from app.rollups import COUNTER_COLUMNS
+        with self.session_scope() as session:
+            row = session.query(*[func.coalesce(func.sum(getattr(UserDailyStats, column)), 0)
+                                  for column in COUNTER_COLUMNS])\
+                .join(User, User.id == UserDailyStats.user_id)\
+                .filter(User.telegram_id == telegram_id, UserDailyStats.day >= since).one()
+            return dict(zip(COUNTER_COLUMNS, row))
+    
+    def get_user_hand_rows(self, telegram_id, after_id=0):
+        """Логи раздач пользователя для StatsEngine: (id, ai_type, hole_cards, actions, result).
+        
+        after_id - только раздачи с большим id (дозагрузка новых). Показатели
+        не зависят от порядка раздач, ORDER BY не нужен.
+        """
+        with self.session_scope() as session:
+            user_id = session.query(User.id).filter(User.telegram_id == telegram_id).scalar()
+            if user_id is None:
+                return []
+            return session.query(HandHistory.id, GameSession.ai_opponent_type, HandHistory.hole_cards,
+                                 HandHistory.actions, HandHistory.result)\
+                .join(HandHistory, HandHistory.session_id == GameSession.id)\
+                .filter(GameSession.user_id == user_id, HandHistory.id > after_id).all()
+
+    def save_hands(self, hands):
+        """Сохранить пачку завершенных раздач и приращения UserStats одной транзакцией"""
+        from app.stats_aggregator import StatsAggregator, analyze_hand
+        from app.rollups import DailyRollup
+        from app.hand_index import HandIndexer
+        session = self.get_session()
+        aggregator = StatsAggregator()
+        rollup = DailyRollup()
+        indexer = HandIndexer()
+        try:
+            telegram_ids = {hand['telegram_id'] for hand in hands}
+            users = dict(session.query(User.telegram_id, User.id)
+                         .filter(User.telegram_id.in_(telegram_ids)).all())
+            open_sessions = {}
+            saved = []
+            skipped = 0
+            for hand in hands:
+                user_id = users.get(hand['telegram_id'])
+                if user_id is None:
+                    skipped += 1
+                    continue
+                
+                key = (user_id, hand['ai_type'])
+                game_session = open_sessions.get(key)
+                if game_session is None:
+                    game_session = session.query(GameSession)\
+                        .filter(GameSession.user_id == user_id,
+                                GameSession.ai_opponent_type == hand['ai_type'])\
+                        .order_by(GameSession.id.desc()).first()
+                new_session = game_session is None or game_session.completed_at is None \
+                    or hand['created_at'] - game_session.completed_at > SESSION_GAP
+                if new_session:
+                    rollup.add_session(user_id, hand['created_at'].date())
+                    game_session = GameSession(
+                        user_id=user_id,
+                        ai_opponent_type=hand['ai_type'],
+                        status=SessionStatus.COMPLETED,
+                        created_at=hand['created_at'],
+                        hands_played=0,
+                        net_profit=0
+                    )
+                    session.add(game_session)
+                    session.flush()
+                else:
+                    # Разность целых длительностей: секунды не теряются на коротких раздачах
+                    started = game_session.created_at
+                    rollup.add_session_time(user_id, started.date(),
+                                            int((hand['created_at'] - started).total_seconds())
+                                            - int((game_session.completed_at - started).total_seconds()))
+                open_sessions[key] = game_session
+                
+                game_session.hands_played = (game_session.hands_played or 0) + 1
+                game_session.net_profit = (game_session.net_profit or 0) + \
+                    hand['result']['net'].get(f"user_{hand['telegram_id']}", 0)
+                game_session.completed_at = hand['created_at']
+                analysis = analyze_hand(hand)
+                aggregator.add_hand(user_id, hand, new_session, analysis)
+                rollup.add_hand(user_id, hand['created_at'].date(), hand['ai_type'],
+                                hand['result']['net'].get(f"user_{hand['telegram_id']}", 0))
+                history = HandHistory(
+                    session_id=game_session.id,
+                    hand_number=game_session.hands_played,
+                    positions=hand['positions'],
+                    hole_cards=hand['hole_cards'],
+                    community_cards=hand['community_cards'],
+                    actions=hand['actions'],
+                    result=hand['result'],
+                    analysis=analysis,
+                    created_at=hand['created_at']
+                )
+                session.add(history)
+                saved.append((user_id, history, hand))
+            # id раздач нужны битовому индексу
+            session.flush()
+            for user_id, history, hand in saved:
+                indexer.add_hand(user_id, history.id, hand)
+            aggregator.apply(session)
+            rollup.apply(session)
+            indexer.apply(session)
+            session.commit()
+            for telegram_id in telegram_ids:
+                self.user_cache.invalidate(telegram_id, 'stats')
+            if skipped:
+                logger.warning(f"Пропущено раздач незарегистрированных пользователей: {skipped}")
+        except Exception:
+            session.rollback()
+            raise
         finally:
             session.close()
 
@@ -1,16 +1,19 @@
 from app.database import db
+from app.models import User
 
 def show_users():
-    """Показать всех пользователей в БД"""
+    """Показать всех пользователей в БД (курсором, без загрузки всей таблицы)"""
     session = db.get_session()
     try:
-        users = session.query(db.User).all()
+        count = 0
         print("📊 Пользователи в базе данных:")
-        for user in users:
-            print(f"ID: {user.id}, Telegram: {user.telegram_id}, Username: {user.username}")
-        return users
+        for user_id, telegram_id, username in session.query(User.id, User.telegram_id, User.username)\
+                .order_by(User.id).yield_per(1000):
+            print(f"ID: {user_id}, Telegram: {telegram_id}, Username: {username}")
+            count += 1
+        return count
     finally:
         session.close()
 
 if __name__ == "__main__":
-    show_users()
\ No newline at end of file
+    show_users()
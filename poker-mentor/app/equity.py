@@ -0,0 +1,200 @@
+import random
+import time
+import logging
+from typing import List, Tuple, Optional, Callable
+from app.poker_engine import Card, Rank, Suit
+
+logger = logging.getLogger(__name__)
+
+# Карта кодируется одним int: rank * 4 + suit (0..51)
+RANKS = list(Rank)
+SUITS = list(Suit)
+FULL_DECK = list(range(52))
+
+# Бит-маски стритов: от A-high до wheel (A-2-3-4-5)
+_STRAIGHT_MASKS = [(0b11111 << i, i + 4) for i in range(8, -1, -1)] + [(0b1000000001111, 3)]
+
+
+def card_to_int(card: Card) -> int:
+    """Конвертация Card в компактный int"""
+    return RANKS.index(card.rank) * 4 + SUITS.index(card.suit)
+
+
+def int_to_card(value: int) -> Card:
+    """Обратная конвертация int в Card"""
+    return Card(RANKS[value // 4], SUITS[value % 4])
+
+
+def _straight_high(rank_mask: int) -> int:
+    """Старшая карта стрита или -1"""
+    for mask, high in _STRAIGHT_MASKS:
+        if rank_mask & mask == mask:
+            return high
+    return -1
+
+
+def _pack(category: int, ranks: List[int]) -> int:
+    """Упаковка категории и кикеров в одно сравнимое число"""
+    value = category
+    for i in range(5):
+        value = (value << 4) | (ranks[i] if i < len(ranks) else 0)
+    return value
+
+
+def evaluate_cards(cards: List[int]) -> int:
+    """Быстрая оценка лучшей 5-карточной руки из 5-7 карт.
+
+    Категории совпадают с HandType.value (без отдельного роял-флеша),
+    больше - сильнее.
+    """
+    rank_counts = [0] * 13
+    suit_masks = [0, 0, 0, 0]
+    rank_mask = 0
+    for card in cards:
+        rank, suit = card >> 2, card & 3
+        rank_counts[rank] += 1
+        suit_masks[suit] |= 1 << rank
+        rank_mask |= 1 << rank
+
+    # Флеш / стрит-флеш
+    for mask in suit_masks:
+        if bin(mask).count("1") >= 5:
+            high = _straight_high(mask)
+            if high >= 0:
+                return _pack(9, [high])
+            flush_ranks = [r for r in range(12, -1, -1) if mask >> r & 1][:5]
+            return _pack(6, flush_ranks)
+
+    quads, trips, pairs, singles = [], [], [], []
+    for rank in range(12, -1, -1):
+        count = rank_counts[rank]
+        if count == 4:
+            quads.append(rank)
+        elif count == 3:
+            trips.append(rank)
+        elif count == 2:
+            pairs.append(rank)
+        elif count == 1:
+            singles.append(rank)
+
+    if quads:
+        kicker = max(trips + pairs + singles + quads[1:])
+        return _pack(8, [quads[0], kicker])
+    if trips and (len(trips) > 1 or pairs):
+        pair = max(trips[1:] + pairs)
+        return _pack(7, [trips[0], pair])
+
+    high = _straight_high(rank_mask)
+    if high >= 0:
+        return _pack(5, [high])
+
+    if trips:
+        return _pack(4, [trips[0]] + singles[:2])
+    if len(pairs) >= 2:
+        kicker = max(pairs[2:] + singles) if pairs[2:] or singles else 0
+        return _pack(3, [pairs[0], pairs[1], kicker])
+    if pairs:
+        return _pack(2, [pairs[0]] + singles[:3])
+    return _pack(1, singles[:5])
+
+
+def preflop_strength(hole: Tuple[int, int]) -> float:
+    """Грубая сила стартовой руки (0-1) для фильтра диапазона"""
+    r1, r2 = hole[0] >> 2, hole[1] >> 2
+    high, low = max(r1, r2), min(r1, r2)
+    if r1 == r2:
+        return 0.5 + high / 12 * 0.5
+    suited = (hole[0] & 3) == (hole[1] & 3)
+    gap = high - low
+    strength = high / 12 * 0.45 + low / 12 * 0.25
+    strength += 0.08 if suited else 0.0
+    strength += max(0.0, 0.06 - gap * 0.015)
+    return min(strength, 0.95)
+
+
+def monte_carlo_equity(hole: List[int], board: List[int], deadline: float,
+                       range_threshold: float = 0.0, batch_size: int = 16,
+                       max_iterations: int = 20000,
+                       clock: Callable[[], float] = time.perf_counter) -> Tuple[float, int]:
+    """Эквити руки против оценочного диапазона оппонента до дедлайна.
+
+    Оппонентские руки ниже range_threshold отбрасываются (rejection
+    sampling). Дедлайн проверяется между батчами, поэтому перерасход
+    ограничен временем одного батча. Возвращает (equity, iterations).
+    """
+    dead = set(hole) | set(board)
+    stub = [c for c in FULL_DECK if c not in dead]
+    missing = 5 - len(board)
+    wins = 0.0
+    iterations = 0
+    rejected = 0
+
+    while iterations < max_iterations:
+        for _ in range(batch_size):
+            sample = random.sample(stub, 2 + missing)
+            opp = (sample[0], sample[1])
+            # Ограничиваем отбраковку, чтобы узкий диапазон не съел весь бюджет
+            if range_threshold > 0 and rejected < iterations * 4 + 64:
+                if preflop_strength(opp) < range_threshold:
+                    rejected += 1
+                    continue
+            runout = board + sample[2:]
+            hero_value = evaluate_cards(hole + runout)
+            opp_value = evaluate_cards(list(opp) + runout)
+            if hero_value > opp_value:
+                wins += 1.0
+            elif hero_value == opp_value:
+                wins += 0.5
+            iterations += 1
+        if clock() >= deadline:
+            break
+
+    if iterations == 0:
+        return 0.5, 0
+    return wins / iterations, iterations
+
+
+class DecisionBudget:
+    """Адаптивный бюджет времени на одно решение AI.
+
+    Базовый бюджет сжимается, когда event loop запаздывает (лаг
+    измеряется монитором, в игровом воркере - задержкой запросов в
+    очереди шарда). Решения синхронны, поэтому число решений
+    в работе не учитывается: в процессе их всегда не больше одного.
+    """
+
+    def __init__(self, base_ms: float = 50.0, min_ms: float = 5.0,
+                 lag_threshold_ms: float = 10.0, smoothing: float = 0.2):
+        self.base_ms = base_ms
+        self.min_ms = min_ms
+        self.lag_threshold_ms = lag_threshold_ms
+        self.smoothing = smoothing
+        self.loop_lag_ms = 0.0
+
+    def record_loop_lag(self, lag_ms: float):
+        """Обновить сглаженный лаг event loop (EWMA)"""
+        self.loop_lag_ms += self.smoothing * (max(0.0, lag_ms) - self.loop_lag_ms)
+
+    def current_ms(self) -> float:
+        """Текущий бюджет в миллисекундах"""
+        budget = self.base_ms
+        if self.loop_lag_ms > self.lag_threshold_ms:
+            budget *= self.lag_threshold_ms / self.loop_lag_ms
+        return max(self.min_ms, budget)
+
+    def deadline(self, clock: Callable[[], float] = time.perf_counter) -> float:
+        """Абсолютный дедлайн для решения, начинающегося сейчас"""
+        return clock() + self.current_ms() / 1000.0
+
+    async def monitor_event_loop(self, interval: float = 0.1):
+        """Фоновая задача: измеряет запаздывание event loop"""
+        import asyncio
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag_ms = (time.perf_counter() - started - interval) * 1000.0
+            self.record_loop_lag(lag_ms)
+
+
+# Общий бюджет для всех equity-ботов процесса
+decision_budget = DecisionBudget()
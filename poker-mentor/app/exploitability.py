@@ -0,0 +1,291 @@
+"""
+Оценка эксплуатируемости rule-based ботов.
+
+Абстрактная игра: heads-up, одна улица торговли (префлоп) с шоудауном,
+руки сгруппированы в бакеты по эквити против случайной руки. Для
+каждого бота строится таблица его политики по бакетам, затем
+best response считается векторно по всем бакетам героя сразу.
+Независимые поддеревья (бот на каждой из позиций) считаются
+параллельно в отдельных процессах.
+"""
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from app.ai_opponents import AIFactory
+from app.equity import int_to_card
+from app.ml.vector_env import evaluate_batch
+from app.poker_engine import Action, PokerGame
+
+logger = logging.getLogger(__name__)
+
+RULE_BASED_BOTS = ["fish", "nit", "tag", "lag"]
+
+# Абстрактные действия: сброс, чек/колл, рейз
+FOLD, CALL, RAISE = 0, 1, 2
+ACTION_CODES = "fkr"
+
+
+def hand_class(cards: np.ndarray) -> np.ndarray:
+    """Индекс класса стартовой руки 0..168 (сетка 13x13: suited выше диагонали)"""
+    ranks = cards >> 2
+    high = np.maximum(ranks[:, 0], ranks[:, 1])
+    low = np.minimum(ranks[:, 0], ranks[:, 1])
+    suited = (cards[:, 0] & 3) == (cards[:, 1] & 3)
+    return np.where(suited, high * 13 + low, low * 13 + high)
+
+
+def class_combos() -> np.ndarray:
+    """Число комбинаций в каждом классе (6 пары, 4 suited, 12 offsuit)"""
+    grid = np.full((13, 13), 12)
+    grid[np.triu_indices(13, 1)[::-1]] = 4
+    np.fill_diagonal(grid, 6)
+    return grid.reshape(-1)
+
+
+def class_representative(index: int) -> Tuple[int, int]:
+    """Конкретные карты класса (в кодировке app.equity)"""
+    row, column = divmod(index, 13)
+    if row == column:
+        return row * 4, row * 4 + 1
+    if row > column:  # suited
+        return row * 4, column * 4
+    return column * 4, row * 4 + 1
+
+
+def class_matchups(samples: int = 1_000_000, chunk: int = 200_000,
+                   seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Монте-Карло матрицы класс-против-класса: (выигрыши, число раздач)"""
+    rng = np.random.default_rng(seed)
+    wins = np.zeros(169 * 169)
+    counts = np.zeros(169 * 169)
+    done = 0
+    while done < samples:
+        size = min(chunk, samples - done)
+        deals = np.argsort(rng.random((size, 52)), axis=1)[:, :9]
+        hero, villain, board = deals[:, 0:2], deals[:, 2:4], deals[:, 4:9]
+        hero_value = evaluate_batch(np.hstack([hero, board]))
+        villain_value = evaluate_batch(np.hstack([villain, board]))
+        result = np.where(hero_value > villain_value, 1.0, np.where(hero_value == villain_value, 0.5, 0.0))
+        cell = hand_class(hero) * 169 + hand_class(villain)
+        wins += np.bincount(cell, weights=result, minlength=169 * 169)
+        counts += np.bincount(cell, minlength=169 * 169)
+        done += size
+    return wins.reshape(169, 169), counts.reshape(169, 169)
+
+
+class CardAbstraction:
+    """Бакеты рук по эквити против случайной руки"""
+
+    def __init__(self, num_buckets: int = 10, samples: int = 1_000_000, seed: Optional[int] = None):
+        self.num_buckets = num_buckets
+        wins, counts = class_matchups(samples, seed=seed)
+        class_equity = wins.sum(axis=1) / np.maximum(counts.sum(axis=1), 1)
+
+        # Равные по числу комбинаций бакеты от слабых рук к сильным
+        combos = class_combos()
+        order = np.argsort(class_equity)
+        cumulative = np.cumsum(combos[order]) / combos.sum()
+        self.class_bucket = np.empty(169, dtype=np.int64)
+        self.class_bucket[order] = np.minimum((cumulative * num_buckets - 1e-9).astype(np.int64), num_buckets - 1)
+        self.class_weight = combos / combos.sum()
+
+        # Агрегация до бакетов: E[h, b] - эквити, joint[h, b] - совместная вероятность
+        onehot = np.eye(num_buckets)[self.class_bucket]
+        bucket_wins = onehot.T @ wins @ onehot
+        bucket_counts = onehot.T @ counts @ onehot
+        self.equity = bucket_wins / np.maximum(bucket_counts, 1)
+        self.joint = bucket_counts / bucket_counts.sum()
+
+
+class AbstractNode:
+    """Узел абстрактного дерева торговли"""
+
+    __slots__ = ('history', 'contributions', 'to_act', 'raises')
+
+    def __init__(self, history: str, contributions: Tuple[int, int], to_act: int, raises: int):
+        self.history = history
+        self.contributions = contributions
+        self.to_act = to_act
+        self.raises = raises
+
+    def to_call(self) -> int:
+        return self.contributions[1 - self.to_act] - self.contributions[self.to_act]
+
+
+class AbstractGame:
+    """Одноулочная heads-up игра с блайндами и стеками PokerGame.
+
+    Место 0 ставит SB и ходит первым, как пользователь в GameManager.
+    Рейз - в raise_multiplier раз от текущей ставки, не больше max_raises.
+    """
+
+    def __init__(self, small_blind: int = 1, big_blind: int = 2, stack: int = 100,
+                 raise_multiplier: float = 3.0, max_raises: int = 3):
+        self.small_blind = small_blind
+        self.big_blind = big_blind
+        self.stack = stack
+        self.raise_multiplier = raise_multiplier
+        self.max_raises = max_raises
+
+    def root(self) -> AbstractNode:
+        return AbstractNode("", (self.small_blind, self.big_blind), 0, 0)
+
+    def legal_actions(self, node: AbstractNode) -> List[int]:
+        actions = [FOLD, CALL] if node.to_call() > 0 else [CALL]
+        level = max(node.contributions)
+        if node.raises < self.max_raises and level < self.stack:
+            actions.append(RAISE)
+        return actions
+
+    def child(self, node: AbstractNode, action: int) -> Optional[AbstractNode]:
+        """Следующий узел или None, если действие завершает раздачу"""
+        contributions = list(node.contributions)
+        seat = node.to_act
+        history = node.history + ACTION_CODES[action]
+        if action == FOLD:
+            return None
+        if action == CALL:
+            contributions[seat] = contributions[1 - seat]
+            # Лимп SB оставляет BB право хода, остальные чек/колл закрывают торговлю
+            if node.history:
+                return None
+            return AbstractNode(history, tuple(contributions), 1 - seat, node.raises)
+        level = max(contributions)
+        contributions[seat] = min(self.stack, int(level * self.raise_multiplier))
+        return AbstractNode(history, tuple(contributions), 1 - seat, node.raises + 1)
+
+    def bot_nodes(self, bot_seat: int) -> List[AbstractNode]:
+        """Все узлы, где ходит бот"""
+        nodes, stack = [], [self.root()]
+        while stack:
+            node = stack.pop()
+            if node.to_act == bot_seat:
+                nodes.append(node)
+            for action in self.legal_actions(node):
+                child = self.child(node, action)
+                if child is not None:
+                    stack.append(child)
+        return nodes
+
+
+def bot_policy_table(ai_type: str, game: AbstractGame, abstraction: CardAbstraction,
+                     bot_seat: int, samples: int = 32) -> Dict[str, np.ndarray]:
+    """Частоты действий бота (бакет x действие) в каждом его узле.
+
+    Бот опрашивается через decide_action на представителе каждого класса
+    рук samples раз, чтобы учесть случайность Fish и LAG.
+    """
+    bot = AIFactory.create_ai(ai_type)
+    poker_game = PokerGame(["hero", "bot"], game.small_blind, game.big_blind)
+    table = {}
+
+    for node in game.bot_nodes(bot_seat):
+        legal = game.legal_actions(node)
+        class_policy = np.zeros((169, 3))
+        for index in range(169):
+            poker_game.player_cards["bot"] = [int_to_card(card) for card in class_representative(index)]
+            poker_game.current_bet = node.to_call()
+            poker_game.pot = sum(node.contributions)
+            poker_game.player_stacks["bot"] = game.stack - node.contributions[bot_seat]
+            for _ in range(samples):
+                action, _ = bot.decide_action(poker_game, "bot")
+                class_policy[index, _abstract_action(action, legal)] += 1
+        class_policy /= class_policy.sum(axis=1, keepdims=True)
+
+        weights = abstraction.class_weight[:, None] * class_policy
+        bucket_policy = np.zeros((abstraction.num_buckets, 3))
+        np.add.at(bucket_policy, abstraction.class_bucket, weights)
+        table[node.history] = bucket_policy / bucket_policy.sum(axis=1, keepdims=True)
+    return table
+
+
+def _abstract_action(action: Action, legal: List[int]) -> int:
+    """Действие бота в абстрактное (фолд без ставки считается чеком)"""
+    if action == Action.FOLD:
+        return FOLD if FOLD in legal else CALL
+    if action in (Action.RAISE, Action.ALL_IN) and RAISE in legal:
+        return RAISE
+    return CALL
+
+
+def best_response(game: AbstractGame, abstraction: CardAbstraction,
+                  policy: Dict[str, np.ndarray], hero_seat: int) -> Tuple[float, Dict[str, np.ndarray]]:
+    """Значение best response героя (в фишках за раздачу) и его стратегия.
+
+    Значения узлов - векторы по бакетам героя, уже взвешенные совместной
+    вероятностью бакетов, поэтому обход дерева один для всех рук.
+    """
+    joint = abstraction.joint
+    showdown = (2 * abstraction.equity - 1) * joint
+    bot_seat = 1 - hero_seat
+    strategy = {}
+
+    def value(node: Optional[AbstractNode], parent: AbstractNode, action: int, reach: np.ndarray) -> np.ndarray:
+        if node is None:
+            contributions = list(parent.contributions)
+            if action == FOLD:
+                folder = parent.to_act
+                sign = -1 if folder == hero_seat else 1
+                return sign * contributions[folder] * (joint @ reach)
+            contributions[parent.to_act] = contributions[1 - parent.to_act]
+            return contributions[hero_seat] * (showdown @ reach)
+        return traverse(node, reach)
+
+    def traverse(node: AbstractNode, reach: np.ndarray) -> np.ndarray:
+        legal = game.legal_actions(node)
+        if node.to_act == bot_seat:
+            bot_policy = policy[node.history]
+            return sum(value(game.child(node, a), node, a, reach * bot_policy[:, a]) for a in legal)
+        children = np.stack([value(game.child(node, a), node, a, reach) for a in legal])
+        strategy[node.history] = np.array(legal)[np.argmax(children, axis=0)]
+        return children.max(axis=0)
+
+    root_values = traverse(game.root(), np.ones(abstraction.num_buckets))
+    return float(root_values.sum()), strategy
+
+
+def _evaluate_subtree(args) -> Tuple[str, int, float, Dict[str, np.ndarray]]:
+    """Задача для процесса: политика бота и best response на одной позиции"""
+    ai_type, bot_seat, game, abstraction, samples = args
+    policy = bot_policy_table(ai_type, game, abstraction, bot_seat, samples)
+    br_value, strategy = best_response(game, abstraction, policy, hero_seat=1 - bot_seat)
+    return ai_type, bot_seat, br_value, strategy
+
+
+def exploitability_report(ai_types: List[str] = None, num_buckets: int = 10,
+                          equity_samples: int = 1_000_000, policy_samples: int = 32,
+                          workers: Optional[int] = None, seed: Optional[int] = None) -> Dict[str, Dict]:
+    """Эксплуатируемость ботов в mbb/hand (среднее BR по двум позициям)"""
+    ai_types = ai_types or RULE_BASED_BOTS
+    game = AbstractGame()
+    abstraction = CardAbstraction(num_buckets, equity_samples, seed)
+    tasks = [(ai_type, seat, game, abstraction, policy_samples) for ai_type in ai_types for seat in (0, 1)]
+
+    report = {ai_type: {'br_value_mbb': [0.0, 0.0], 'strategy': {}} for ai_type in ai_types}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for ai_type, bot_seat, br_value, strategy in executor.map(_evaluate_subtree, tasks):
+            report[ai_type]['br_value_mbb'][bot_seat] = br_value / game.big_blind * 1000
+            report[ai_type]['strategy'][bot_seat] = strategy
+
+    for ai_type in ai_types:
+        values = report[ai_type]['br_value_mbb']
+        report[ai_type]['exploitability_mbb'] = sum(values) / len(values)
+        logger.info(f"{ai_type}: эксплуатируемость {report[ai_type]['exploitability_mbb']:.0f} mbb/hand")
+    return report
+
+
+def format_report(report: Dict[str, Dict]) -> str:
+    """Текстовый отчет"""
+    lines = ["📉 Эксплуатируемость ботов (mbb/hand)"]
+    for ai_type, data in sorted(report.items(), key=lambda item: -item[1]['exploitability_mbb']):
+        as_sb, as_bb = data['br_value_mbb']
+        lines.append(f"• {ai_type.upper()}: {data['exploitability_mbb']:.0f} "
+                     f"(бот SB: {as_sb:.0f}, бот BB: {as_bb:.0f})")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(format_report(exploitability_report()))
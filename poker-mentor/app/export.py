@@ -0,0 +1,274 @@
+"""
+Потоковая выгрузка раздач и статистики в CSV или JSONL (python -m app.export).
+
+Строки читаются курсором (yield_per) и пишутся пачками по CHUNK_ROWS
+строк: в памяти не больше одной пачки, независимо от объема истории.
+JSON-колонки раздач берутся из БД текстом и в JSONL вставляются как
+есть, без разбора и повторной сериализации. Раздачи прошлых месяцев
+читаются из колоночного архива (app.hand_archive). Сжатие gzip -
+по флагу, с быстрым уровнем GZIP_LEVEL.
+
+    python -m app.export hands --user <telegram_id> --format csv --gzip
+    python -m app.export stats -o stats.jsonl
+"""
+
+import io
+import os
+import csv
+import sys
+import gzip
+import json
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Text, type_coerce
+
+from app.hand_archive import hand_archive
+from app.models import GameSession, HandHistory, User, UserStats, UserDailyStats
+
+logger = logging.getLogger(__name__)
+
+CHUNK_ROWS = 5000
+GZIP_LEVEL = 1
+FORMATS = ('csv', 'jsonl')
+KINDS = ('hands', 'stats', 'daily')
+
+HAND_COLUMNS = ('hand_id', 'session_id', 'hand_number', 'telegram_id', 'ai_type', 'created_at',
+                'position', 'hole_cards', 'community_cards', 'net', 'pot', 'showdown', 'winning_hand',
+                'rating', 'actions')
+# Вложенные поля раздачи в JSONL (в CSV из них - скалярные колонки и actions)
+HAND_JSON_FIELDS = ('positions', 'hole_cards', 'community_cards', 'actions', 'result', 'analysis')
+STATS_COLUMNS = ('telegram_id', 'username') + tuple(
+    column.name for column in UserStats.__table__.columns if column.name not in ('id', 'user_id'))
+DAILY_COLUMNS = ('telegram_id',) + tuple(
+    column.name for column in UserDailyStats.__table__.columns if column.name not in ('id', 'user_id'))
+
+
+def _json_text(value) -> str:
+    """Текст JSON-колонки (SQLite отдает строку, другие драйверы - разобранное значение)"""
+    if value is None:
+        return 'null'
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+
+def _json_value(value):
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def _scalar(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+class _Writer:
+    """Запись пачками в файл (gzip по желанию); CSV - через буфер пачки"""
+
+    def __init__(self, path: str, fmt: str, columns: Tuple[str, ...], compress: bool,
+                 chunk_rows: int = CHUNK_ROWS):
+        if fmt not in FORMATS:
+            raise ValueError(f"Неизвестный формат: {fmt}")
+        self.fmt = fmt
+        self.columns = columns
+        self.chunk_rows = chunk_rows
+        self.file = gzip.open(path, 'wt', encoding='utf-8', compresslevel=GZIP_LEVEL, newline='') \
+            if compress else open(path, 'w', encoding='utf-8', newline='')
+        self.rows = 0
+        self._chunk: List[str] = []
+        self._buffer = io.StringIO()
+        self._csv = csv.writer(self._buffer)
+        if fmt == 'csv':
+            self._csv.writerow(columns)
+
+    def write_row(self, values: Tuple):
+        """Строка CSV (значения в порядке columns)"""
+        self._csv.writerow(values)
+        self._count()
+
+    def write_line(self, line: str):
+        """Готовая строка JSONL"""
+        self._chunk.append(line)
+        self._count()
+
+    def _count(self):
+        self.rows += 1
+        if self.rows % self.chunk_rows == 0:
+            self.flush()
+
+    def flush(self):
+        if self.fmt == 'csv':
+            self.file.write(self._buffer.getvalue())
+            self._buffer.seek(0)
+            self._buffer.truncate()
+        else:
+            self._chunk.append('')
+            self.file.write('\n'.join(self._chunk))
+            self._chunk = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def _hand_line(hand_id, session_id, hand_number, telegram_id, ai_type, created_at, texts: Dict[str, str]) -> str:
+    """Строка JSONL: JSON-колонки вставляются текстом без разбора"""
+    head = json.dumps({
+        'hand_id': hand_id,
+        'session_id': session_id,
+        'hand_number': hand_number,
+        'telegram_id': telegram_id,
+        'ai_type': ai_type,
+        'created_at': _scalar(created_at),
+    }, ensure_ascii=False)
+    return head[:-1] + ''.join(f', "{field}": {texts[field]}' for field in HAND_JSON_FIELDS) + '}'
+
+
+def _hand_row(hand_id, session_id, hand_number, telegram_id, ai_type, created_at,
+              positions, hole_cards, board, actions, result, analysis) -> Tuple:
+    """Строка CSV: показатели пользователя, действия - JSON-текстом"""
+    player = f"user_{telegram_id}"
+    result = result or {}
+    return (hand_id, session_id, hand_number, telegram_id, ai_type, _scalar(created_at),
+            (positions or {}).get(player, ''),
+            ' '.join((hole_cards or {}).get(player) or ()),
+            ' '.join(board or ()),
+            (result.get('net') or {}).get(player, 0),
+            result.get('pot', 0),
+            int(bool(result.get('showdown'))),
+            result.get('winning_hand') or '',
+            (analysis or {}).get('rating', ''),
+            actions)
+
+
+def _user_id(session, telegram_id: Optional[int]) -> Optional[int]:
+    if telegram_id is None:
+        return None
+    user_id = session.query(User.id).filter(User.telegram_id == telegram_id).scalar()
+    if user_id is None:
+        raise ValueError(f"Пользователь {telegram_id} не найден")
+    return user_id
+
+
+def export_hands(database, path: str, fmt: str = 'jsonl', telegram_id: int = None,
+                 compress: bool = False, chunk_rows: int = CHUNK_ROWS) -> int:
+    """Выгрузить раздачи (одного пользователя или всех): сначала архив, затем живые строки"""
+    writer = _Writer(path, fmt, HAND_COLUMNS, compress, chunk_rows)
+    read_session = database.get_session()
+    try:
+        user_id = _user_id(read_session, telegram_id)
+
+        for hand in hand_archive.iter_hands(user_id):
+            meta = (hand['id'], hand['session_id'], hand['hand_number'], hand['telegram_id'],
+                    hand['ai_type'], hand['created_at'])
+            if fmt == 'jsonl':
+                writer.write_line(_hand_line(*meta, {field: json.dumps(hand[field], ensure_ascii=False)
+                                                     for field in HAND_JSON_FIELDS}))
+            else:
+                writer.write_row(_hand_row(*meta, hand['positions'], hand['hole_cards'], hand['community_cards'],
+                                           json.dumps(hand['actions'], ensure_ascii=False), hand['result'],
+                                           hand['analysis']))
+
+        # JSON-колонки текстом: без десериализации в SQLAlchemy
+        rows = read_session.query(HandHistory.id, HandHistory.session_id, HandHistory.hand_number,
+                                  User.telegram_id, GameSession.ai_opponent_type, HandHistory.created_at,
+                                  *[type_coerce(getattr(HandHistory, field), Text) for field in HAND_JSON_FIELDS])\
+            .join(GameSession, GameSession.id == HandHistory.session_id)\
+            .join(User, User.id == GameSession.user_id)
+        if user_id is not None:
+            rows = rows.filter(GameSession.user_id == user_id)
+        for row in rows.yield_per(chunk_rows):
+            if fmt == 'jsonl':
+                writer.write_line(_hand_line(*row[:6], dict(zip(HAND_JSON_FIELDS, map(_json_text, row[6:])))))
+            else:
+                positions, hole_cards, board, actions, result, analysis = row[6:]
+                writer.write_row(_hand_row(*row[:6], _json_value(positions), _json_value(hole_cards),
+                                           _json_value(board), _json_text(actions), _json_value(result),
+                                           _json_value(analysis)))
+    finally:
+        read_session.close()
+        writer.close()
+    return writer.rows
+
+
+def _export_table(database, path: str, fmt: str, columns: Tuple[str, ...], model, telegram_id: Optional[int],
+                  compress: bool, chunk_rows: int) -> int:
+    """Таблица пользователя (user_id) с telegram_id и username из users"""
+    writer = _Writer(path, fmt, columns, compress, chunk_rows)
+    read_session = database.get_session()
+    try:
+        user_id = _user_id(read_session, telegram_id)
+        own = [getattr(model, name) for name in columns if name not in ('telegram_id', 'username')]
+        users = [getattr(User, name) for name in columns if name in ('telegram_id', 'username')]
+        rows = read_session.query(*users, *own).join(User, User.id == model.user_id)
+        if user_id is not None:
+            rows = rows.filter(model.user_id == user_id)
+        for row in rows.yield_per(chunk_rows):
+            values = tuple(map(_scalar, row))
+            if fmt == 'jsonl':
+                writer.write_line(json.dumps(dict(zip(columns, values)), ensure_ascii=False))
+            else:
+                writer.write_row(tuple(json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+                                       for value in values))
+    finally:
+        read_session.close()
+        writer.close()
+    return writer.rows
+
+
+def export_stats(database, path: str, fmt: str = 'jsonl', telegram_id: int = None,
+                 compress: bool = False, chunk_rows: int = CHUNK_ROWS) -> int:
+    """Выгрузить user_stats (одного пользователя или всех)"""
+    return _export_table(database, path, fmt, STATS_COLUMNS, UserStats, telegram_id, compress, chunk_rows)
+
+
+def export_daily(database, path: str, fmt: str = 'jsonl', telegram_id: int = None,
+                 compress: bool = False, chunk_rows: int = CHUNK_ROWS) -> int:
+    """Выгрузить дневные итоги user_daily_stats"""
+    return _export_table(database, path, fmt, DAILY_COLUMNS, UserDailyStats, telegram_id, compress, chunk_rows)
+
+
+EXPORTERS = {'hands': export_hands, 'stats': export_stats, 'daily': export_daily}
+
+
+def default_path(kind: str, fmt: str, telegram_id: int = None, compress: bool = False) -> str:
+    owner = telegram_id if telegram_id is not None else 'all'
+    return f"export_{kind}_{owner}_{datetime.utcnow():%Y%m%d_%H%M%S}.{fmt}{'.gz' if compress else ''}"
+
+
+def export(database, kind: str, path: str = None, fmt: str = 'jsonl', telegram_id: int = None,
+           compress: bool = False, chunk_rows: int = CHUNK_ROWS) -> Tuple[str, int]:
+    """Выгрузка одного вида данных: (путь файла, число строк)"""
+    if kind not in EXPORTERS:
+        raise ValueError(f"Неизвестный вид выгрузки: {kind}")
+    path = path or default_path(kind, fmt, telegram_id, compress)
+    rows = EXPORTERS[kind](database, path, fmt, telegram_id, compress, chunk_rows)
+    logger.info(f"Выгрузка {kind} ({fmt}) в {path}: {rows} строк")
+    return path, rows
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    from app.database import db
+
+    parser = argparse.ArgumentParser(description="Выгрузка раздач и статистики")
+    parser.add_argument('kind', choices=KINDS)
+    parser.add_argument('--user', type=int, default=None, help="telegram_id (по умолчанию - все пользователи)")
+    parser.add_argument('--format', choices=FORMATS, default='jsonl')
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('-o', '--output', default=None)
+    args = parser.parse_args(argv)
+
+    db.init_db()
+    started = datetime.now()
+    path, rows = export(db, args.kind, args.output, args.format, args.user, args.gzip)
+    seconds = (datetime.now() - started).total_seconds()
+    size = os.path.getsize(path) / 1024 / 1024
+    print(f"✅ {path}: {rows} строк, {size:.1f} МБ за {seconds:.1f} с ({rows / max(seconds, 1e-9):.0f} строк/с)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
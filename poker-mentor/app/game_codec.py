@@ -0,0 +1,316 @@
+"""
+Бинарный формат состояния heads-up PokerGame.
+
+Запись версии 1 (little-endian):
+  заголовок HEADER (38 байт): magic b'PG', версия, флаги, тип AI,
+      индекс текущего игрока, блайнды, банк, ставка, два стека,
+      telegram id пользователя, число карт борда/колоды, число действий
+  блок карт (61 байт): 2+2 карманные, 5 борд, 52 колода; карта = байт
+      rank * 4 + suit, пустой слот = 0xFF
+  действия: n x ACTION (7 байт): улица, место, действие, сумма
+  при FLAG_NAMES - имена игроков (длина u8 + utf-8)
+
+Для пакетов записи склеиваются с префиксом длины u32; decode_many
+читает их из memoryview без копирования буфера.
+"""
+
+import re
+import struct
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+from app.ai_opponents import AIFactory
+from app.poker_engine import Card, Deck, PokerGame, Rank, Suit
+
+MAGIC = b'PG'
+VERSION = 1
+
+FLAG_NAMES = 0x01
+
+HEADER = struct.Struct('<2sBBBBHHiiiiqBBH')
+ACTION = struct.Struct('<BBBi')
+LENGTH = struct.Struct('<I')
+CARD_BLOCK = 61
+EMPTY = 0xFF
+
+# Порядок кодов фиксирован версией формата, новые коды - только в конец
+AI_TYPES = ('fish', 'nit', 'tag', 'lag', 'equity')
+STREETS = ('preflop', 'flop', 'turn', 'river')
+ACTIONS = ('fold', 'check', 'call', 'raise', 'all_in', 'small_blind', 'big_blind')
+NO_AI = 0xFF
+
+# Карты не изменяются, декодированные игры делят одни экземпляры
+CARDS = tuple(Card(rank, suit) for rank in Rank for suit in Suit)
+_AI_CODES = {name: code for code, name in enumerate(AI_TYPES)}
+_STREET_CODES = {name: code for code, name in enumerate(STREETS)}
+_ACTION_CODES = {name: code for code, name in enumerate(ACTIONS)}
+_USER_PLAYER = re.compile(r'user_(-?\d+)$')
+_EMPTY_BYTE = bytes([EMPTY])
+_PADDING = tuple(_EMPTY_BYTE * size for size in range(53))
+_EMPTY_CODES = tuple([EMPTY] * size for size in range(6))
+_RECORDS: Dict[int, struct.Struct] = {}
+
+
+class GameCodecError(ValueError):
+    """Поврежденная или несовместимая запись"""
+
+
+class PackedDeck(Deck):
+    """Колода декодированной игры: карты строятся при первом обращении.
+
+    Пока колода не тронута, encode_game пишет исходные коды без
+    обхода карт (выгрузка/подъем игры в GameStore не платит за колоду).
+    """
+
+    def __init__(self, codes: bytes = b''):
+        self.codes = codes
+        self._cards = None
+
+    @property
+    def cards(self) -> List[Card]:
+        if self._cards is None:
+            self._cards = list(map(CARDS.__getitem__, self.codes))
+        return self._cards
+
+    @cards.setter
+    def cards(self, cards: List[Card]):
+        self._cards = cards
+
+
+class PackedGame(PokerGame):
+    """Игра, поднятая из записи: история действий разбирается при первом обращении.
+
+    Коды действий проверяются в decode_game, поэтому ленивый разбор не
+    падает. Пока история не тронута, encode_game копирует исходные байты.
+    """
+
+    @property
+    def hand_history(self) -> List[dict]:
+        if self._hand_history is None:
+            players = self.players
+            streets, actions = STREETS, ACTIONS
+            self._hand_history = [
+                {
+                    'street': streets[street],
+                    'player': players[seat] if seat != EMPTY else None,
+                    'action': actions[action],
+                    'amount': amount,
+                }
+                for street, seat, action, amount in ACTION.iter_unpack(self._actions)
+            ]
+        return self._hand_history
+
+    @hand_history.setter
+    def hand_history(self, history: List[dict]):
+        self._hand_history = history
+
+
+def _record_struct(action_count: int) -> struct.Struct:
+    """Заголовок, карты и действия одной структурой (кэш по числу действий)"""
+    record = _RECORDS.get(action_count)
+    if record is None:
+        record = _RECORDS[action_count] = struct.Struct(
+            HEADER.format + '9B52s' + ACTION.format[1:] * action_count)
+    return record
+
+
+@lru_cache(maxsize=65536)
+def _user_id(player: str) -> Optional[int]:
+    match = _USER_PLAYER.match(player)
+    return int(match.group(1)) if match else None
+
+
+@lru_cache(maxsize=None)
+def _ai_code(name: str) -> int:
+    return _AI_CODES.get(name.lower(), NO_AI)
+
+
+@lru_cache(maxsize=None)
+def _ai_name(ai_code: int) -> str:
+    return AIFactory.create_ai(AI_TYPES[ai_code]).name
+
+
+def encode_game(game: PokerGame) -> bytes:
+    """Закодировать игру в бинарную запись"""
+    players = game.players
+    ai_opponent = getattr(game, 'ai_opponent', None)
+    ai_code = _ai_code(ai_opponent.name) if ai_opponent is not None else NO_AI
+
+    # Стандартная пара "user_<id>" + AI восстанавливается без хранения имен
+    user_id = _user_id(players[0]) if len(players) == 2 else None
+    standard = user_id is not None and ai_code != NO_AI and players[1] == ai_opponent.name
+    flags = 0 if standard else FLAG_NAMES
+
+    deck = game.deck
+    if type(deck) is PackedDeck and deck._cards is None:
+        deck_codes = deck.codes
+    else:
+        deck_codes = bytes([card.code for card in deck.cards[:52]])
+    # Нетронутая история поднятой игры пишется исходными байтами
+    raw_actions = game._actions if type(game) is PackedGame and game._hand_history is None else None
+    actions = () if raw_actions is not None else game.hand_history
+    action_count = len(raw_actions) // ACTION.size if raw_actions is not None else len(actions)
+
+    stacks = game.player_stacks
+    player_cards = game.player_cards
+    board = game.community_cards[:5]
+    values = [MAGIC, VERSION, flags, ai_code, game.current_player_idx,
+              game.small_blind, game.big_blind, game.pot, game.current_bet,
+              stacks.get(players[0], 0) if players else 0,
+              stacks.get(players[1], 0) if len(players) > 1 else 0,
+              user_id if standard else 0, len(board), len(deck_codes), action_count]
+    for player in players[:2]:
+        cards = player_cards.get(player) or ()
+        if len(cards) >= 2:
+            values += (cards[0].code, cards[1].code)
+        else:
+            values += [card.code for card in cards] + _EMPTY_CODES[2 - len(cards)]
+    values += _EMPTY_CODES[4 - 2 * min(len(players), 2)]
+    values += [card.code for card in board]
+    values += _EMPTY_CODES[5 - len(board)]
+    values.append(deck_codes + _PADDING[52 - len(deck_codes)])
+
+    if raw_actions is not None:
+        data = _record_struct(0).pack(*values) + raw_actions
+    else:
+        seats = {player: seat for seat, player in enumerate(players)}
+        street_codes, action_codes = _STREET_CODES, _ACTION_CODES
+        for record in actions:
+            values += (street_codes.get(record.get('street'), 0),
+                       seats.get(record.get('player'), EMPTY),
+                       action_codes.get(record.get('action'), 0),
+                       int(record.get('amount', 0)))
+        data = _record_struct(action_count).pack(*values)
+    if flags & FLAG_NAMES:
+        parts = [data, bytes([len(players)])]
+        for player in players:
+            name = player.encode('utf-8')
+            parts.append(bytes([len(name)]) + name)
+        data = b''.join(parts)
+    return data
+
+
+def decode_game(data: Union[bytes, memoryview], offset: int = 0, restore_ai: bool = True,
+                with_deck: bool = True) -> PokerGame:
+    """Восстановить игру из записи (data может быть memoryview)"""
+    try:
+        header = HEADER.unpack_from(data, offset)
+    except struct.error as e:
+        raise GameCodecError(f"Короткая запись: {e}")
+    if header[0] != MAGIC:
+        raise GameCodecError("Неверная сигнатура записи")
+    if header[1] != VERSION:
+        raise GameCodecError(f"Неподдерживаемая версия формата: {header[1]}")
+    flags, ai_code = header[2], header[3]
+    board_count, deck_count, action_count = header[12], header[13], header[14]
+    if board_count > 5 or deck_count > 52:
+        raise GameCodecError(f"Неверное число карт: борд {board_count}, колода {deck_count}")
+    actions_at = offset + HEADER.size + CARD_BLOCK
+    actions_end = actions_at + action_count * ACTION.size
+    if len(data) < actions_end:
+        raise GameCodecError(f"Короткая запись: нужно {actions_end - offset} байт, есть {len(data) - offset}")
+    record = _record_struct(0).unpack_from(data, offset)
+
+    if flags & FLAG_NAMES:
+        position = actions_end
+        players = []
+        try:
+            for _ in range(data[position]):
+                length = data[position + 1]
+                if position + 2 + length > len(data):
+                    raise GameCodecError("Короткая запись: обрезаны имена игроков")
+                players.append(bytes(data[position + 2:position + 2 + length]).decode('utf-8'))
+                position += 1 + length
+        except (IndexError, UnicodeDecodeError) as e:
+            raise GameCodecError(f"Поврежденные имена игроков: {e}")
+    elif ai_code == NO_AI:
+        raise GameCodecError("Запись без имен игроков и без AI")
+    else:
+        players = [f"user_{header[11]}", None]
+
+    # Коды проверяются сразу: колода и история разбираются лениво
+    board = record[19:19 + board_count]
+    deck = record[24][:deck_count] if with_deck else b''
+    raw_actions = bytes(data[actions_at:actions_end])
+    if (board and max(board) >= len(CARDS)) or (deck and max(deck) >= len(CARDS)):
+        raise GameCodecError("Неизвестный код карты")
+    if action_count and (max(raw_actions[0::ACTION.size]) >= len(STREETS)
+                         or max(raw_actions[2::ACTION.size]) >= len(ACTIONS)
+                         or max(raw_actions[1::ACTION.size].translate(None, _EMPTY_BYTE), default=0)
+                         >= len(players)):
+        raise GameCodecError("Неизвестный код улицы, действия или места")
+
+    ai_opponent = None
+    if ai_code != NO_AI:
+        if ai_code >= len(AI_TYPES):
+            raise GameCodecError(f"Неизвестный код AI: {ai_code}")
+        if restore_ai:
+            ai_opponent = AIFactory.create_ai(AI_TYPES[ai_code])
+        if players[1] is None:
+            players[1] = ai_opponent.name if ai_opponent else _ai_name(ai_code)
+
+    cards = CARDS
+    player_cards = {}
+    try:
+        for seat, player in enumerate(players[:2]):
+            first, second = record[15 + 2 * seat], record[16 + 2 * seat]
+            if first != EMPTY and second != EMPTY:
+                player_cards[player] = [cards[first], cards[second]]
+            else:
+                player_cards[player] = [cards[code] for code in (first, second) if code != EMPTY]
+        community_cards = [cards[code] for code in board]
+    except IndexError as e:
+        raise GameCodecError(f"Неизвестный код карты: {e}")
+
+    game = PackedGame.__new__(PackedGame)
+    game.players = players
+    game.small_blind = header[5]
+    game.big_blind = header[6]
+    game.pot = header[7]
+    game.current_bet = header[8]
+    game.current_player_idx = header[4]
+    game.player_stacks = dict(zip(players, header[9:11]))
+    game.player_cards = player_cards
+    game.community_cards = community_cards
+    game.deck = PackedDeck(deck)
+    game._actions = raw_actions
+    game._hand_history = None
+    if ai_opponent is not None:
+        game.ai_opponent = ai_opponent
+    return game
+
+
+def encode_many(games: Iterable[PokerGame]) -> bytes:
+    """Пакет записей с префиксом длины"""
+    parts = []
+    for game in games:
+        record = encode_game(game)
+        parts.append(LENGTH.pack(len(record)))
+        parts.append(record)
+    return b''.join(parts)
+
+
+def decode_many(buffer: Union[bytes, bytearray, memoryview], restore_ai: bool = True,
+                with_deck: bool = True) -> Iterator[PokerGame]:
+    """Потоковое чтение пакета без копирования буфера"""
+    view = memoryview(buffer)
+    offset = 0
+    end = len(view)
+    while offset < end:
+        if offset + LENGTH.size > end:
+            raise GameCodecError("Обрезанный пакет записей")
+        (length,) = LENGTH.unpack_from(view, offset)
+        offset += LENGTH.size
+        if offset + length > end:
+            raise GameCodecError("Обрезанный пакет записей")
+        yield decode_game(view, offset, restore_ai, with_deck)
+        offset += length
+
+
+def record_user_id(data: Union[bytes, memoryview], offset: int = 0) -> Optional[int]:
+    """telegram id из заголовка без полного декодирования"""
+    try:
+        header = HEADER.unpack_from(data, offset)
+    except struct.error as e:
+        raise GameCodecError(f"Короткая запись: {e}")
+    return None if header[2] & FLAG_NAMES else header[11]
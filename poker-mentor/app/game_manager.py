@@ -1,7 +1,12 @@
 import logging
-from app.poker_engine import PokerGame, Action
+from app.poker_engine import PokerGame, Action, format_bb
 from app.ai_opponents import AIFactory
 from app.ml.data_pipeline import ml_data_pipeline
+from app.opponent_tracker import opponent_tracker
+from app.hand_log import hand_log, build_hand_record
+from app.game_store import GameStore
+from app.database import db
+from app.config import config
 
 logger = logging.getLogger(__name__)
 
@@ -9,8 +14,19 @@ class GameManager:
     """Управление игровыми сессиями"""
     
     def __init__(self):
-        self.active_games = {}
         self.data_pipeline = ml_data_pipeline
+        self.opponent_tracker = opponent_tracker
+        self.hand_log = hand_log
+        # Куда уходят приращения статистики выгружаемых игроков
+        # (в игровом воркере - его поток записи, а не БД напрямую)
+        self.stats_writer = db
+        self.active_games = GameStore(
+            db,
+            max_games=int(config.get('GAME_STORE_MAX_GAMES', 5000)),
+            idle_ttl=float(config.get('GAME_STORE_IDLE_TTL', 1800)),
+            on_restore=self._on_game_restored,
+            on_evict=self._on_games_evicted
+        )
 
     
     
@@ -23,6 +39,10 @@ class GameManager:
         game.start_hand()
         game.post_blinds()
         
+        # AI читает статистику пользователя из памяти, без запросов к БД
+        self.opponent_tracker.start_hand(int(user_id))
+        ai_opponent.opponent_stats = self.opponent_tracker.get(int(user_id))
+        
         self.active_games[user_id] = game
         logger.info(f"Создана новая игра для пользователя {user_id} с AI {ai_type}")
         
@@ -32,10 +52,19 @@ class GameManager:
         """Получить активную игру пользователя"""
         return self.active_games.get(user_id)
     
+    def _on_game_restored(self, user_id: str, game: PokerGame):
+        """Восстановленной из снимка игре возвращаем статистику пользователя"""
+        if hasattr(game, 'ai_opponent'):
+            game.ai_opponent.opponent_stats = self.opponent_tracker.get(int(user_id))
+    
+    def _on_games_evicted(self, user_ids: list):
+        """Выгруженные игры уносят из памяти и счетчики стиля их игроков"""
+        self.opponent_tracker.evict([int(user_id) for user_id in user_ids], self.stats_writer)
+    
     def end_game(self, user_id: str):
         """Завершить игру"""
-        if user_id in self.active_games:
-            del self.active_games[user_id]
+        if self.active_games.discard(user_id):
+            self.opponent_tracker.evict([int(user_id)], self.stats_writer)
             logger.info(f"Игра пользователя {user_id} завершена")
     
     def process_player_action(self, user_id: str, action: str, amount: int = 0) -> dict:
@@ -56,6 +85,17 @@ class GameManager:
             "game_continues": True
         }
         
+        # Обновляем статистику стиля игры пользователя
+        street = self._get_street(game)
+        try:
+            self.opponent_tracker.record_action(
+                int(user_id), street, action,
+                facing_raise=street == "preflop" and game.current_bet > game.big_blind,
+                facing_cbet=self.opponent_tracker.facing_cbet(int(user_id), street, game.current_bet)
+            )
+        except Exception as e:
+            logger.error(f"Opponent tracker error: {e}")
+        
         # Обрабатываем действие игрока
         if action == "fold":
             game.player_stacks[player] -= 0
@@ -67,7 +107,7 @@ class GameManager:
             game.player_stacks[player] -= call_amount
             game.pot += call_amount
             result["player_amount"] = call_amount
-            result["message"] = f"📥 Вы поставили {call_amount} BB"
+            result["message"] = f"📥 Вы поставили {format_bb(call_amount)}"
             
         elif action == "check":
             game.player_stacks[player] -= 0
@@ -77,7 +117,9 @@ class GameManager:
             game.player_stacks[player] -= amount
             game.pot += amount
             game.current_bet = amount
-            result["message"] = f"📤 Вы поставили рейз {amount} BB"
+            result["message"] = f"📤 Вы поставили рейз {format_bb(amount)}"
+        
+        game.record_action(player, action, result["player_amount"])
         
         try:
             # Собираем данные для ML обучения
@@ -96,6 +138,8 @@ class GameManager:
         # Ход AI
         if result["game_continues"]:
             ai_action, ai_amount = self._process_ai_turn(game)
+            self.opponent_tracker.record_ai_action(int(user_id), street, ai_action)
+            game.record_action(game.ai_opponent.name, ai_action, ai_amount)
             result["ai_action"] = ai_action
             result["ai_amount"] = ai_amount
             result["ai_message"] = self._get_ai_action_text(ai_action, ai_amount)
@@ -103,6 +147,12 @@ class GameManager:
             # Обновляем состояние после хода AI
             result["pot"] = game.pot
             result["player_stack"] = game.player_stacks[player]
+            
+            if ai_action == "fold":
+                result["game_continues"] = False
+                self._log_hand(user_id, game, [player], showdown=False)
+        elif action == "fold":
+            self._log_hand(user_id, game, [game.players[1]], showdown=False)
         
         # Проверяем продолжение игры
         if result["game_continues"]:
@@ -110,11 +160,23 @@ class GameManager:
             if not result["game_continues"]:
                 # Шоудаун
                 winners = game.get_winner()
+                winning_hand = game.evaluate_showdown()[winners[0]][0].name
                 result["winner"] = "Вы" if 'user' in winners[0] else "AI"
-                result["winning_hand"] = game.evaluate_showdown()[winners[0]][0].name
+                result["winning_hand"] = winning_hand
+                self._log_hand(user_id, game, winners, showdown=True, winning_hand=winning_hand)
         
         return result
     
+    def _log_hand(self, user_id: str, game: PokerGame, winners: list, showdown: bool,
+                  winning_hand: str = None):
+        """Поставить завершенную раздачу в очередь записи в hand_histories"""
+        try:
+            hand = build_hand_record(int(user_id), game, winners, showdown, winning_hand)
+            hand['tendencies'] = self.opponent_tracker.take_hand(int(user_id))
+            self.hand_log.record_hand(hand)
+        except Exception as e:
+            logger.error(f"Hand log error: {e}")
+    
     def _process_ai_turn(self, game: PokerGame) -> tuple:
         """Обработать ход AI"""
         ai_action, ai_amount = game.ai_opponent.decide_action(game, game.ai_opponent.name)
@@ -138,8 +200,8 @@ class GameManager:
         actions = {
             "fold": "🤖 AI: фолд",
             "check": "🤖 AI: чек", 
-            "call": f"🤖 AI: колл {ai_amount} BB",
-            "raise": f"🤖 AI: рейз {ai_amount} BB"
+            "call": f"🤖 AI: колл {format_bb(ai_amount)}",
+            "raise": f"🤖 AI: рейз {format_bb(ai_amount)}"
         }
         return actions.get(ai_action, "🤖 AI: неизвестное действие")
     
@@ -158,6 +220,10 @@ class GameManager:
             # Игра завершена
             return False
     
+    def _get_street(self, game: PokerGame) -> str:
+        """Определить текущую улицу по количеству карт на столе"""
+        return game.current_street()
+    
     def get_game_state(self, user_id: str) -> dict:
         """Получить текущее состояние игры"""
         game = self.get_game(user_id)
@@ -178,22 +244,16 @@ class GameManager:
         """Извлечение фич для ML из состояния игры"""
         try:
             player = f"user_{user_id}"
-            
-            # Определяем текущую улицу по количеству карт
-            street = "preflop"
-            if len(game.community_cards) == 3:
-                street = "flop"
-            elif len(game.community_cards) == 4:
-                street = "turn" 
-            elif len(game.community_cards) == 5:
-                street = "river"
+            street = self._get_street(game)
             
             # Базовые фичи для ML
             features = {
-                'hand_strength': self._calculate_hand_strength(game, user_id),
-                'position': 'middle',  # Временная заглушка
+                # Сила руки и позиция - общие с MLEnhancedAI и self-play (DataPipeline)
+                'hand_strength': self.data_pipeline.hand_strength([card.code for card in game.player_cards[player]]),
+                'position': self.data_pipeline.heads_up_position(game.players.index(player)),
                 'stack_ratio': game.player_stacks[player] / 100.0,  # Относительно стартового стека 100
                 'pot_ratio': game.pot / 100.0,
+                'effective_stack': min(game.player_stacks.values()) / 100.0,
                 'street': street,
                 'action_taken': action,
                 'current_bet_ratio': game.current_bet / 100.0,
@@ -218,39 +278,3 @@ class GameManager:
         except Exception as e:
             logger.error(f"Error extracting ML features: {e}")
             return {}
-    
-    def _calculate_hand_strength(self, game: PokerGame, user_id: str) -> float:
-        """Упрощенный расчет силы руки (0-1)"""
-        try:
-            player = f"user_{user_id}"
-            cards = game.player_cards[player]
-            
-            if len(cards) != 2:
-                return 0.5
-                
-            # Простая эвристика для демонстрации
-            rank_values = {'2': 2, '3': 3, '4': 4, '5': 5, '6': 6, '7': 7, '8': 8, 
-                          '9': 9, 'T': 10, 'J': 11, 'Q': 12, 'K': 13, 'A': 14}
-            
-            card1, card2 = cards
-            rank1_val = rank_values.get(card1.rank.value, 7)
-            rank2_val = rank_values.get(card2.rank.value, 7)
-            
-            # Пара
-            if card1.rank == card2.rank:
-                return min(0.95, rank1_val / 14.0 + 0.3)
-            
-            # suited
-            suited_bonus = 0.1 if card1.suit == card2.suit else 0
-            
-            # Коннекторы
-            gap = abs(rank1_val - rank2_val)
-            connector_bonus = max(0, 0.1 - gap * 0.02)
-            
-            base_strength = (max(rank1_val, rank2_val) / 14.0) * 0.6
-            
-            return min(0.9, base_strength + suited_bonus + connector_bonus)
-            
-        except Exception as e:
-            logger.error(f"Error calculating hand strength: {e}")
-            return 0.5
\ No newline at end of file
@@ -24,6 +24,7 @@ class GameMenus:
             [InlineKeyboardButton("🛡️ Nit AI", callback_data="ai_nit")],
             [InlineKeyboardButton("🎯 TAG AI", callback_data="ai_tag")],
             [InlineKeyboardButton("⚡ LAG AI", callback_data="ai_lag")],
+            [InlineKeyboardButton("🧮 Equity AI", callback_data="ai_equity")],
         ]
         return InlineKeyboardMarkup(keyboard)
     
@@ -223,4 +224,47 @@ class LearningMenus:
         
         if lesson_type in lessons:
             return InlineKeyboardMarkup(lessons[lesson_type])
-        return LearningMenus.get_learning_menu()
\ No newline at end of file
+        return LearningMenus.get_learning_menu()
+class HistoryMenus:
+    """Меню истории игр (keyset-курсоры в callback_data)"""
+    
+    @staticmethod
+    def get_sessions_menu(sessions: List[Dict], next_cursor: Optional[str]):
+        """Сессии страницы и переход на следующую"""
+        keyboard = [
+            [InlineKeyboardButton(f"🃏 {session['date']} • {session['opponent']}",
+                                  callback_data=f"hist_s_{session['id']}")]
+            for session in sessions
+        ]
+        if next_cursor:
+            keyboard.append([InlineKeyboardButton("➡️ Раньше", callback_data=f"hist_p_{next_cursor}")])
+        return InlineKeyboardMarkup(keyboard)
+    
+    @staticmethod
+    def get_hands_menu(session_id: int, hands: List[Dict], next_hand: Optional[int]):
+        """Раздачи сессии"""
+        keyboard = [
+            [InlineKeyboardButton(f"#{hand['hand_number']} {hand['cards']} • {hand['result']}",
+                                  callback_data=f"hist_h_{hand['hand_id']}")]
+            for hand in hands
+        ]
+        if next_hand:
+            keyboard.append([InlineKeyboardButton("➡️ Дальше", callback_data=f"hist_n_{session_id}_{next_hand}")])
+        keyboard.append([InlineKeyboardButton("🔙 К сессиям", callback_data="hist_p_")])
+        return InlineKeyboardMarkup(keyboard)
+    
+    @staticmethod
+    def get_found_hands_menu(hands: List[Dict]):
+        """Раздачи, найденные /find"""
+        keyboard = [
+            [InlineKeyboardButton(f"#{hand['hand_number']} {hand['cards']} • {hand['result']}",
+                                  callback_data=f"hist_h_{hand['hand_id']}")]
+            for hand in hands
+        ]
+        return InlineKeyboardMarkup(keyboard)
+    
+    @staticmethod
+    def get_hand_menu(session_id: int):
+        """Назад к раздачам сессии"""
+        keyboard = [[InlineKeyboardButton("🔙 К раздачам", callback_data=f"hist_s_{session_id}")]]
+        return InlineKeyboardMarkup(keyboard)
@@ -0,0 +1,420 @@
+"""
+Шардированный игровой сервис.
+
+Игры раскладываются по N процессам-воркерам по хешу user id, каждый
+воркер держит свой GameManager. Бот (asyncio) отправляет вызовы в
+воркеры через однонаправленные pipe и ждет ответа, не блокируя event
+loop. У пользователя всегда один и тот же воркер, а воркер обрабатывает
+запросы строго по очереди, поэтому действия пользователя не
+переупорядочиваются. При num_workers=0 игры живут в процессе бота.
+
+Запись в БД (статистика игроков, раздачи) в воркере делает отдельный
+поток, цикл запросов только ставит ее в очередь. Упавший воркер
+перезапускается, его игры поднимаются из game_snapshots.
+"""
+
+import time
+import signal
+import asyncio
+import logging
+import itertools
+import threading
+import multiprocessing
+import queue
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class GameServiceError(RuntimeError):
+    """Ошибка выполнения вызова в воркере"""
+
+
+def shard_for(user_id: str, num_shards: int) -> int:
+    """Номер шарда пользователя (стабилен между перезапусками, в отличие от hash)"""
+    return zlib.crc32(str(user_id).encode('utf-8')) % num_shards
+
+
+def _dispatch(manager, method: str, args: tuple) -> Any:
+    """Выполнить вызов на GameManager; результат должен сериализоваться"""
+    if method == 'create_game':
+        # Сам PokerGame остается в воркере, наружу уходит состояние
+        manager.create_game(*args)
+        return manager.get_game_state(args[0])
+    if method == 'active_game_count':
+        return len(manager.active_games)
+    if method in ('process_player_action', 'get_game_state', 'end_game'):
+        return getattr(manager, method)(*args)
+    raise ValueError(f"Неизвестный метод: {method}")
+
+
+class _WorkerWriter:
+    """Поток записи воркера: статистика игроков и раздачи уходят в БД мимо цикла запросов.
+
+    Цикл запросов только ставит приращения в очередь (writer подставляется
+    трекеру вместо Database), раздачи поток забирает из HandLog сам.
+    Приращения, которые не удалось записать, повторяются в следующем цикле.
+    После записи notify получает telegram_id пользователей, чьи строки
+    изменились: кэш UserCache бота живет в другом процессе.
+    """
+
+    def __init__(self, database, hand_log, interval: float, notify: Callable[[List[int]], None]):
+        self.database = database
+        self.hand_log = hand_log
+        self.interval = interval
+        self.notify = notify
+        self._invalidated: Set[int] = set()
+        database.user_cache.on_invalidate = self._on_invalidate
+        self._queue: "queue.SimpleQueue[Dict[int, Dict[str, int]]]" = queue.SimpleQueue()
+        self._pending: Dict[int, Dict[str, int]] = {}
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="game-writer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def apply_tendency_deltas(self, dirty: Dict[int, Dict[str, int]]):
+        """Поставить приращения в очередь записи (интерфейс Database для OpponentTracker)"""
+        if dirty:
+            self._queue.put(dirty)
+
+    def _write_tendencies(self):
+        while True:
+            try:
+                dirty = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            for telegram_id, delta in dirty.items():
+                current = self._pending.setdefault(telegram_id, {})
+                for field, value in delta.items():
+                    current[field] = current.get(field, 0) + value
+        if not self._pending:
+            return
+        try:
+            self.database.apply_tendency_deltas(self._pending)
+            self._pending = {}
+        except Exception as e:
+            logger.error(f"Ошибка сброса статистики {len(self._pending)} игроков, повтор в следующем цикле: {e}")
+
+    def _on_invalidate(self, telegram_id: int, part: Optional[str]):
+        self._invalidated.add(telegram_id)
+
+    def _write(self):
+        self._write_tendencies()
+        self.hand_log.flush(self.database)
+        if self._invalidated:
+            invalidated, self._invalidated = self._invalidated, set()
+            try:
+                self.notify(sorted(invalidated))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Сброс кэша пользователей не отправлен боту: {e}")
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self._write()
+            except Exception as e:
+                logger.error(f"Ошибка потока записи воркера: {e}")
+
+    def close(self, timeout: float = 10.0):
+        """Остановить поток и записать все, что осталось в очередях"""
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._write()
+
+
+def _maintenance(manager):
+    """Передача статистики игроков потоку записи, вытеснение простаивающих игр"""
+    manager.opponent_tracker.flush(manager.stats_writer)
+    evicted = manager.active_games.evict_idle()
+    if evicted:
+        logger.info(f"Выгружено простаивающих игр: {evicted}")
+
+
+def _worker_main(shard: int, requests, replies, maintenance_interval: float, write_interval: float):
+    """Цикл процесса-воркера"""
+    # Остановкой управляет родитель
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(
+        format=f'%(asctime)s - shard{shard} - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    from app.database import db
+    from app.equity import decision_budget
+    from app.game_manager import GameManager
+
+    # Ответы пишут цикл запросов и поток записи
+    reply_lock = threading.Lock()
+
+    def reply(message: tuple):
+        with reply_lock:
+            replies.send(message)
+
+    manager = GameManager()
+    # Ответ без request_id - список telegram_id для сброса кэша бота
+    writer = _WorkerWriter(db, manager.hand_log, write_interval,
+                           notify=lambda telegram_ids: reply((None, True, telegram_ids)))
+    manager.stats_writer = writer
+    writer.start()
+    next_maintenance = time.monotonic() + maintenance_interval
+    logger.info(f"Игровой воркер {shard} запущен")
+    try:
+        while True:
+            if requests.poll(max(0.0, next_maintenance - time.monotonic())):
+                message = requests.recv()
+                if message is None:
+                    break
+                request_id, method, args, sent_at = message
+                # Event loop бота в воркере не виден: бюджет решений AI сжимается
+                # по задержке запроса в очереди шарда (monotonic общий для процессов)
+                decision_budget.record_loop_lag((time.monotonic() - sent_at) * 1000.0)
+                try:
+                    reply((request_id, True, _dispatch(manager, method, args)))
+                except Exception as e:
+                    logger.error(f"Ошибка {method} в воркере {shard}: {e}")
+                    reply((request_id, False, f"{type(e).__name__}: {e}"))
+            else:
+                # Очередь пуста - задержки нет
+                decision_budget.record_loop_lag(0.0)
+
+            if time.monotonic() >= next_maintenance:
+                try:
+                    _maintenance(manager)
+                except Exception as e:
+                    logger.error(f"Ошибка обслуживания воркера {shard}: {e}")
+                next_maintenance = time.monotonic() + maintenance_interval
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        manager.active_games.snapshot_all()
+        manager.opponent_tracker.flush(writer)
+        writer.close()
+        manager.data_pipeline.close()
+        logger.info(f"Игровой воркер {shard} остановлен")
+
+
+class _Worker:
+    """Процесс-воркер и его каналы на стороне бота"""
+
+    def __init__(self, shard: int, process, requests, replies):
+        self.shard = shard
+        self.process = process
+        self.requests = requests
+        self.replies = replies
+        self.pending: Dict[int, asyncio.Future] = {}
+        # Запись в pipe блокируется, когда воркер не успевает читать,
+        # поэтому запросы пишет отдельный поток, а не event loop
+        self.outbox: "queue.SimpleQueue[Optional[tuple]]" = queue.SimpleQueue()
+        self.sender: Optional[threading.Thread] = None
+        self.reader: Optional[threading.Thread] = None
+        self.exited = False
+
+
+class GameService:
+    """Асинхронный фасад над шардами GameManager"""
+
+    def __init__(self, num_workers: int = 0, maintenance_interval: float = 30.0,
+                 write_interval: float = 5.0, respawn_delay: float = 1.0):
+        self.num_workers = num_workers
+        self.maintenance_interval = maintenance_interval
+        self.write_interval = write_interval
+        self.respawn_delay = respawn_delay
+        self._workers: List[_Worker] = []
+        self._local = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._request_ids = itertools.count()
+        self._context = None
+        self._stopping = False
+        self.respawns = 0
+
+        if num_workers <= 0:
+            from app.game_manager import GameManager
+            self._local = GameManager()
+
+    async def start(self):
+        """Запустить воркеры (или фоновое вытеснение в локальном режиме)"""
+        self._loop = asyncio.get_running_loop()
+        if self._local is not None:
+            from app.database import db
+            self._loop.create_task(self._local.active_games.run_periodic_eviction())
+            self._loop.create_task(self._local.hand_log.run_periodic_flush(db))
+            self._loop.create_task(self._local.opponent_tracker.run_periodic_flush(db))
+            return
+
+        # spawn: не копируем в воркеры потоки и сокеты бота
+        self._context = multiprocessing.get_context('spawn')
+        self._workers = [self._spawn(shard) for shard in range(self.num_workers)]
+        logger.info(f"Запущено игровых воркеров: {self.num_workers}")
+
+    def _spawn(self, shard: int) -> _Worker:
+        """Запустить процесс шарда и потоки его каналов"""
+        requests_out, requests_in = self._context.Pipe(duplex=False)
+        replies_out, replies_in = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_worker_main,
+            args=(shard, requests_out, replies_in, self.maintenance_interval, self.write_interval),
+            name=f"game-shard-{shard}",
+            daemon=True
+        )
+        process.start()
+        # Концы, принадлежащие воркеру, в боте не нужны
+        requests_out.close()
+        replies_in.close()
+
+        worker = _Worker(shard, process, requests_in, replies_out)
+        worker.sender = threading.Thread(target=self._send_requests, args=(worker,),
+                                         name=f"game-shard-{shard}-sender", daemon=True)
+        worker.reader = threading.Thread(target=self._read_replies, args=(worker,),
+                                         name=f"game-shard-{shard}-reader", daemon=True)
+        worker.sender.start()
+        worker.reader.start()
+        return worker
+
+    async def stop(self, timeout: float = 10.0):
+        """Остановить воркеры; они сохраняют игры и статистику перед выходом"""
+        if self._local is not None:
+            from app.database import db
+            self._local.opponent_tracker.flush(db)
+            self._local.hand_log.flush(db)
+            self._local.active_games.snapshot_all()
+            return
+
+        self._stopping = True
+        for worker in self._workers:
+            worker.outbox.put(None)
+        loop = asyncio.get_running_loop()
+        for worker in self._workers:
+            await loop.run_in_executor(None, worker.process.join, timeout)
+            if worker.process.is_alive():
+                logger.warning(f"Воркер {worker.shard} не остановился, завершаем принудительно")
+                worker.process.terminate()
+            await loop.run_in_executor(None, worker.sender.join, timeout)
+            worker.requests.close()
+        self._workers = []
+
+    def _send_requests(self, worker: _Worker):
+        """Поток записи запросов в pipe воркера (порядок запросов сохраняется)"""
+        while True:
+            message = worker.outbox.get()
+            try:
+                worker.requests.send(message)
+            except (OSError, ValueError) as e:
+                if message is None:
+                    break
+                self._call_in_loop(self._resolve, worker, message[0], False,
+                                   f"Игровой воркер {worker.shard} недоступен: {e}")
+                continue
+            if message is None:
+                break
+
+    def _read_replies(self, worker: _Worker):
+        """Поток чтения ответов воркера; конец pipe означает выход процесса"""
+        while True:
+            try:
+                request_id, ok, payload = worker.replies.recv()
+            except (EOFError, OSError):
+                break
+            if request_id is None:
+                self._invalidate_cached(payload)
+                continue
+            self._call_in_loop(self._resolve, worker, request_id, ok, payload)
+        worker.process.join(self.respawn_delay)
+        self._call_in_loop(self._worker_exited, worker)
+
+    @staticmethod
+    def _invalidate_cached(telegram_ids: List[int]):
+        """Воркер изменил статистику пользователей: сбросить ее в кэше бота"""
+        from app.database import db
+        for telegram_id in telegram_ids:
+            db.user_cache.invalidate(telegram_id, 'stats')
+
+    def _call_in_loop(self, callback, *args):
+        try:
+            self._loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # event loop уже закрыт при остановке бота
+            pass
+
+    @staticmethod
+    def _resolve(worker: _Worker, request_id: int, ok: bool, payload: Any):
+        future = worker.pending.pop(request_id, None)
+        if future is None or future.done():
+            return
+        if ok:
+            future.set_result(payload)
+        else:
+            future.set_exception(GameServiceError(payload))
+
+    @staticmethod
+    def _fail_pending(worker: _Worker):
+        if worker.pending:
+            logger.error(f"Игровой воркер {worker.shard} завершился, "
+                         f"незавершенных запросов: {len(worker.pending)}")
+        for future in worker.pending.values():
+            if not future.done():
+                future.set_exception(GameServiceError(f"Игровой воркер {worker.shard} недоступен"))
+        worker.pending.clear()
+
+    def _worker_exited(self, worker: _Worker):
+        """Процесс шарда завершился: ошибки ожидающим вызовам и перезапуск.
+
+        Новый воркер поднимает игры из game_snapshots при обращении
+        пользователей; игры, не успевшие попасть в снимок, теряются.
+        """
+        worker.exited = True
+        self._fail_pending(worker)
+        worker.outbox.put(None)
+        if self._stopping or worker not in self._workers:
+            return
+        logger.error(f"Игровой воркер {worker.shard} упал (код выхода {worker.process.exitcode}), "
+                     f"перезапуск через {self.respawn_delay} с")
+        self._loop.call_later(self.respawn_delay, self._respawn, worker)
+
+    def _respawn(self, worker: _Worker):
+        if self._stopping or worker not in self._workers:
+            return
+        worker.requests.close()
+        self._workers[worker.shard] = self._spawn(worker.shard)
+        self.respawns += 1
+        logger.info(f"Игровой воркер {worker.shard} перезапущен")
+
+    async def _call_shard(self, worker: _Worker, method: str, args: tuple) -> Any:
+        if worker.exited:
+            raise GameServiceError(f"Игровой воркер {worker.shard} перезапускается")
+        request_id = next(self._request_ids)
+        future = self._loop.create_future()
+        worker.pending[request_id] = future
+        # Время постановки в очередь: по нему воркер оценивает свою задержку
+        worker.outbox.put((request_id, method, args, time.monotonic()))
+        return await future
+
+    async def _call(self, user_id: str, method: str, *args) -> Any:
+        if self._local is not None:
+            return _dispatch(self._local, method, (user_id,) + args)
+        worker = self._workers[shard_for(user_id, len(self._workers))]
+        return await self._call_shard(worker, method, (user_id,) + args)
+
+    async def create_game(self, user_id: str, ai_type: str = "fish") -> dict:
+        """Создать игру; возвращает состояние как get_game_state"""
+        return await self._call(user_id, 'create_game', ai_type)
+
+    async def process_player_action(self, user_id: str, action: str, amount: int = 0) -> dict:
+        """Обработать действие игрока"""
+        return await self._call(user_id, 'process_player_action', action, amount)
+
+    async def get_game_state(self, user_id: str) -> Optional[dict]:
+        """Получить текущее состояние игры"""
+        return await self._call(user_id, 'get_game_state')
+
+    async def end_game(self, user_id: str):
+        """Завершить игру"""
+        await self._call(user_id, 'end_game')
+
+    async def active_game_count(self) -> int:
+        """Число игр в памяти по всем шардам"""
+        if self._local is not None:
+            return _dispatch(self._local, 'active_game_count', ())
+        counts = await asyncio.gather(*(self._call_shard(worker, 'active_game_count', ())
+                                        for worker in self._workers))
+        return sum(counts)
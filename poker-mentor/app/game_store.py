@@ -0,0 +1,217 @@
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set
+
+from app.game_codec import decode_game, encode_game
+from app.models import GameSnapshot
+from app.poker_engine import PokerGame
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot_game(game: PokerGame) -> bytes:
+    """Компактный снимок игры в бинарном формате app.game_codec"""
+    return encode_game(game)
+
+
+def restore_game(data: bytes) -> PokerGame:
+    """Восстановить PokerGame из снимка"""
+    return decode_game(data)
+
+
+class GameStore:
+    """Ограниченное хранилище активных игр с LRU/TTL вытеснением.
+
+    В памяти держится не больше max_games игр; игры, простаивающие
+    дольше idle_ttl секунд, и самые давние при переполнении
+    выгружаются снимком в таблицу game_snapshots и прозрачно
+    поднимаются обратно при следующем обращении пользователя.
+    Множество пользователей со снимком читается один раз, поэтому
+    промахи (пользователь без игры) не ходят в БД.
+    """
+
+    def __init__(self, database, max_games: int = 5000, idle_ttl: float = 1800.0,
+                 on_restore: Optional[Callable[[str, PokerGame], None]] = None,
+                 on_evict: Optional[Callable[[List[str]], None]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.database = database
+        self.max_games = max_games
+        self.idle_ttl = idle_ttl
+        self.on_restore = on_restore
+        self.on_evict = on_evict
+        self.clock = clock
+        self._games: "OrderedDict[str, PokerGame]" = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._snapshot_users: Optional[Set[str]] = None
+        self.evictions = 0
+        self.restores = 0
+
+    def __len__(self) -> int:
+        """Число игр в памяти"""
+        return len(self._games)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._games or self._load_snapshot(user_id, remove=False) is not None
+
+    def __setitem__(self, user_id: str, game: PokerGame):
+        self._games[user_id] = game
+        self._games.move_to_end(user_id)
+        self._last_access[user_id] = self.clock()
+        # Новая игра заменяет старый снимок
+        self._delete_snapshot(user_id)
+        self._evict_overflow()
+
+    def __getitem__(self, user_id: str) -> PokerGame:
+        game = self.get(user_id)
+        if game is None:
+            raise KeyError(user_id)
+        return game
+
+    def __delitem__(self, user_id: str):
+        if not self.discard(user_id):
+            raise KeyError(user_id)
+
+    def get(self, user_id: str, default=None) -> Optional[PokerGame]:
+        """Игра пользователя из памяти или из снимка"""
+        game = self._games.get(user_id)
+        if game is not None:
+            self._games.move_to_end(user_id)
+            self._last_access[user_id] = self.clock()
+            return game
+
+        data = self._load_snapshot(user_id, remove=True)
+        if data is None:
+            return default
+        try:
+            game = restore_game(data)
+        except Exception as e:
+            logger.error(f"Ошибка восстановления игры {user_id}: {e}")
+            return default
+        if self.on_restore:
+            self.on_restore(user_id, game)
+        self.restores += 1
+        self._games[user_id] = game
+        self._last_access[user_id] = self.clock()
+        self._evict_overflow()
+        logger.debug(f"Игра пользователя {user_id} восстановлена из снимка")
+        return game
+
+    def discard(self, user_id: str) -> bool:
+        """Удалить игру из памяти и снимков"""
+        in_memory = self._games.pop(user_id, None) is not None
+        self._last_access.pop(user_id, None)
+        on_disk = self._delete_snapshot(user_id)
+        return in_memory or on_disk
+
+    def evict_idle(self) -> int:
+        """Выгрузить игры, простаивающие дольше idle_ttl"""
+        deadline = self.clock() - self.idle_ttl
+        # OrderedDict упорядочен по последнему обращению, старые - в начале
+        idle = []
+        for user_id in self._games:
+            if self._last_access[user_id] > deadline:
+                break
+            idle.append(user_id)
+        self._evict(idle)
+        return len(idle)
+
+    def snapshot_all(self) -> int:
+        """Выгрузить все игры (при остановке бота)"""
+        user_ids = list(self._games)
+        self._evict(user_ids)
+        return len(user_ids)
+
+    def _evict_overflow(self):
+        overflow = len(self._games) - self.max_games
+        if overflow > 0:
+            self._evict(list(self._games)[:overflow])
+
+    def _evict(self, user_ids: List[str]):
+        """Снимки одной транзакцией, затем удаление из памяти"""
+        if not user_ids:
+            return
+        session = self.database.get_session()
+        try:
+            now = datetime.utcnow()
+            for user_id in user_ids:
+                session.merge(GameSnapshot(user_id=user_id, data=snapshot_game(self._games[user_id]),
+                                           updated_at=now))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Ошибка выгрузки игр: {e}")
+            return
+        finally:
+            session.close()
+
+        snapshots = self._snapshots()
+        for user_id in user_ids:
+            snapshots.add(user_id)
+            del self._games[user_id]
+            del self._last_access[user_id]
+        self.evictions += len(user_ids)
+        logger.debug(f"Выгружено игр: {len(user_ids)}")
+        if self.on_evict:
+            self.on_evict(user_ids)
+
+    def _snapshots(self) -> Set[str]:
+        """Пользователи со снимком (загружаются из БД при первом обращении)"""
+        if self._snapshot_users is None:
+            session = self.database.get_session()
+            try:
+                self._snapshot_users = {user_id for user_id, in session.query(GameSnapshot.user_id)}
+            except Exception as e:
+                logger.error(f"Ошибка чтения списка снимков игр: {e}")
+                return set()
+            finally:
+                session.close()
+        return self._snapshot_users
+
+    def _load_snapshot(self, user_id: str, remove: bool) -> Optional[bytes]:
+        if user_id not in self._snapshots():
+            return None
+        session = self.database.get_session()
+        try:
+            snapshot = session.get(GameSnapshot, user_id)
+            if snapshot is None:
+                self._snapshots().discard(user_id)
+                return None
+            data = snapshot.data
+            if remove:
+                session.delete(snapshot)
+                session.commit()
+                self._snapshots().discard(user_id)
+            return data
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Ошибка чтения снимка игры {user_id}: {e}")
+            return None
+        finally:
+            session.close()
+
+    def _delete_snapshot(self, user_id: str) -> bool:
+        if user_id not in self._snapshots():
+            return False
+        session = self.database.get_session()
+        try:
+            deleted = session.query(GameSnapshot).filter(GameSnapshot.user_id == user_id).delete()
+            session.commit()
+            self._snapshots().discard(user_id)
+            return deleted > 0
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Ошибка удаления снимка игры {user_id}: {e}")
+            return False
+        finally:
+            session.close()
+
+    async def run_periodic_eviction(self, interval: float = 60.0):
+        """Фоновая задача вытеснения простаивающих игр"""
+        import asyncio
+        while True:
+            await asyncio.sleep(interval)
+            evicted = self.evict_idle()
+            if evicted:
+                logger.info(f"Выгружено простаивающих игр: {evicted}")
@@ -0,0 +1,559 @@
+"""
+Колоночный архив раздач по месяцам (python -m app.hand_archive).
+
+Завершенные раздачи старше HAND_ARCHIVE_KEEP_MONTHS месяцев
+переносятся из hand_histories в каталог HAND_ARCHIVE_DIR/<ГГГГ-ММ>:
+по файлу .npy на поле. Раздачи месяца отсортированы по (user_id,
+hand_id), поэтому раздачи пользователя - непрерывный срез. Списки
+переменной длины (игроки раздачи, действия) хранятся плоскими
+массивами со смещениями (*_offsets), строки (имена игроков, типы AI,
+JSON анализа) - словарями, на которые ссылаются коды. Сжатие дают
+кодирование и узкие типы (карта - байт, улица и действие - int8):
+файлы не сжаты zlib, чтобы читаться через np.load(mmap_mode='r') без
+копирования - срез пользователя не читает с диска ничего лишнего.
+
+После записи месяца его строки удаляются из hand_histories (перенос,
+а не копия: живые и архивные раздачи не пересекаются). Если прошлый
+запуск упал между записью и удалением, повторный запуск пропускает
+уже заархивированные id и дочищает строки. Раздачи, позже попавшие в
+закрытый месяц (импорт старой истории), дописываются к месяцу при
+следующем запуске.
+
+Читатели: StatisticsManager (user_columns для StatsEngine), история
+(get_hand, session_hands, get_hands), пересборка дневных итогов и
+битового индекса, воспроизведение для ML (iter_hands ->
+hand_replay.replay_rows).
+"""
+
+import os
+import sys
+import json
+import shutil
+import asyncio
+import logging
+from array import array
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from app.config import config
+from app.game_codec import ACTIONS, AI_TYPES, CARDS, EMPTY, STREETS
+from app.models import GameSession, HandHistory, User
+from app.poker_engine import HandType
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+POSITIONS = ('SB', 'BB', 'BTN', 'UTG', 'UTG+1', 'UTG+2', 'MP', 'HJ', 'CO')
+DELETE_BATCH = 5000
+
+_CARD_CODES = {str(card): card.code for card in CARDS}
+_STREET_CODES = {name: code for code, name in enumerate(STREETS)}
+_ACTION_CODES = {name: code for code, name in enumerate(ACTIONS)}
+_POSITION_CODES = {name: code for code, name in enumerate(POSITIONS)}
+_HAND_TYPES = {hand_type.name: hand_type.value for hand_type in HandType}
+_HAND_TYPE_NAMES = {hand_type.value: hand_type.name for hand_type in HandType}
+_EPOCH = datetime(1970, 1, 1)
+
+
+def month_key(moment: datetime) -> str:
+    return f"{moment.year:04d}-{moment.month:02d}"
+
+
+def month_range(month: str):
+    """Начало месяца и начало следующего"""
+    year, number = map(int, month.split('-'))
+    start = datetime(year, number, 1)
+    end = datetime(year + number // 12, number % 12 + 1, 1)
+    return start, end
+
+
+class _Dictionary:
+    """Строковый словарь колонки: значение -> код"""
+
+    def __init__(self, values: Iterable[str] = ()):
+        self.values: List[str] = list(values)
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def array(self) -> np.ndarray:
+        return np.array(self.values or [''], dtype=str)
+
+
+class _PartitionBuilder:
+    """Колонки месяца, собираемые построчно (array - компактно, без объектов на раздачу)"""
+
+    HAND_FIELDS = (('hand_id', 'q'), ('session_id', 'q'), ('hand_number', 'i'), ('user_id', 'i'),
+                   ('telegram_id', 'q'), ('created_at', 'q'), ('ai_type', 'b'), ('position', 'b'),
+                   ('net', 'i'), ('pot', 'i'), ('showdown', 'B'), ('won', 'B'), ('winning_hand', 'b'),
+                   ('analysis', 'i'), ('player_count', 'i'), ('event_count', 'i'))
+    CARD_FIELDS = (('hole_cards', 2), ('board', 5))
+    PLAYER_FIELDS = (('player_name', 'i'), ('player_position', 'b'), ('player_net', 'i'),
+                     ('player_winner', 'B'))
+    EVENT_FIELDS = (('event_street', 'b'), ('event_action', 'b'), ('event_player', 'b'),
+                    ('event_user', 'B'), ('event_amount', 'i'))
+
+    def __init__(self):
+        self.columns = {name: array(code) for name, code in self.HAND_FIELDS + self.PLAYER_FIELDS + self.EVENT_FIELDS}
+        self.columns.update({name: bytearray() for name, _ in self.CARD_FIELDS})
+        self.columns['player_cards'] = bytearray()
+        self.names = _Dictionary()
+        self.ai_types = _Dictionary(AI_TYPES)
+        self.analyses = _Dictionary()
+
+    def __len__(self) -> int:
+        return len(self.columns['hand_id'])
+
+    @staticmethod
+    def _cards(cards: Optional[List[str]], size: int) -> bytes:
+        codes = [_CARD_CODES.get(card, EMPTY) for card in (cards or [])[:size]]
+        return bytes(codes + [EMPTY] * (size - len(codes)))
+
+    def add(self, hand_id, session_id, hand_number, user_id, telegram_id, ai_type, created_at,
+            positions, hole_cards, board, actions, result, analysis):
+        columns = self.columns
+        player = f"user_{telegram_id}"
+        positions = positions or {}
+        hole_cards = hole_cards or {}
+        actions = actions or []
+        result = result or {}
+        net = result.get('net') or {}
+        winners = set(result.get('winners') or ())
+
+        # Игроки раздачи в порядке первого упоминания
+        players = list(dict.fromkeys(list(positions) + list(hole_cards) + list(net)
+                                     + [event['player'] for event in actions]))
+        seats = {name: seat for seat, name in enumerate(players)}
+        for name in players:
+            columns['player_name'].append(self.names.code(name))
+            columns['player_position'].append(_POSITION_CODES.get(positions.get(name), -1))
+            columns['player_net'].append(net.get(name, 0))
+            columns['player_winner'].append(name in winners)
+            columns['player_cards'] += self._cards(hole_cards.get(name), 2)
+        for event in actions:
+            columns['event_street'].append(_STREET_CODES.get(event['street'], 0))
+            columns['event_action'].append(_ACTION_CODES.get(event['action'], 0))
+            columns['event_player'].append(seats.get(event['player'], -1))
+            columns['event_user'].append(event['player'] == player)
+            columns['event_amount'].append(event.get('amount') or 0)
+
+        columns['hand_id'].append(hand_id)
+        columns['session_id'].append(session_id)
+        columns['hand_number'].append(hand_number)
+        columns['user_id'].append(user_id)
+        columns['telegram_id'].append(telegram_id)
+        columns['created_at'].append(int((created_at - _EPOCH).total_seconds()) if created_at else 0)
+        columns['ai_type'].append(self.ai_types.code(ai_type or ''))
+        columns['position'].append(_POSITION_CODES.get(positions.get(player), -1))
+        columns['net'].append(net.get(player, 0))
+        columns['pot'].append(result.get('pot') or 0)
+        columns['showdown'].append(bool(result.get('showdown')))
+        columns['won'].append(player in winners)
+        columns['winning_hand'].append(_HAND_TYPES.get(result.get('winning_hand'), 0))
+        columns['analysis'].append(self.analyses.code(json.dumps(analysis, ensure_ascii=False))
+                                   if analysis is not None else -1)
+        columns['player_count'].append(len(players))
+        columns['event_count'].append(len(actions))
+        columns['hole_cards'] += self._cards(hole_cards.get(player), 2)
+        columns['board'] += self._cards(board, 5)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Колонки NumPy, раздачи отсортированы по (user_id, hand_id)"""
+        columns = self.columns
+        arrays = {name: np.frombuffer(columns[name], dtype=np.dtype(columns[name].typecode))
+                  if len(columns[name]) else np.zeros(0, dtype=np.dtype(code))
+                  for name, code in self.HAND_FIELDS + self.PLAYER_FIELDS + self.EVENT_FIELDS}
+        arrays['showdown'] = arrays['showdown'].astype(bool)
+        arrays['won'] = arrays['won'].astype(bool)
+        arrays['player_winner'] = arrays['player_winner'].astype(bool)
+        arrays['event_user'] = arrays['event_user'].astype(bool)
+        arrays['created_at'] = arrays['created_at'].astype('datetime64[s]')
+        for name, width in self.CARD_FIELDS + (('player_cards', 2),):
+            arrays[name] = np.frombuffer(bytes(columns[name]), dtype=np.uint8).reshape(-1, width)
+        arrays['names'] = self.names.array()
+        arrays['ai_types'] = self.ai_types.array()
+        arrays['analyses'] = self.analyses.array()
+        return sort_partition(arrays)
+
+
+def _offsets(counts: np.ndarray) -> np.ndarray:
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def _gather(counts: np.ndarray, order: np.ndarray) -> np.ndarray:
+    """Индексы элементов плоского массива для раздач в порядке order"""
+    starts = _offsets(counts)[:-1][order]
+    lengths = counts[order]
+    total = int(lengths.sum())
+    shift = np.repeat(starts - _offsets(lengths)[:-1], lengths)
+    return shift + np.arange(total, dtype=np.int64)
+
+
+def sort_partition(arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Переставить раздачи по (user_id, hand_id) вместе с их игроками и событиями"""
+    order = np.lexsort((arrays['hand_id'], arrays['user_id']))
+    players = _gather(arrays['player_count'], order)
+    events = _gather(arrays['event_count'], order)
+    sorted_arrays = {}
+    for name, values in arrays.items():
+        if name in ('names', 'ai_types', 'analyses'):
+            sorted_arrays[name] = values
+        elif name.startswith('player_') and name != 'player_count':
+            sorted_arrays[name] = values[players]
+        elif name.startswith('event_') and name != 'event_count':
+            sorted_arrays[name] = values[events]
+        else:
+            sorted_arrays[name] = values[order]
+    sorted_arrays['player_offsets'] = _offsets(sorted_arrays['player_count'])
+    sorted_arrays['event_offsets'] = _offsets(sorted_arrays['event_count'])
+    return sorted_arrays
+
+
+class ArchivePartition:
+    """Месяц архива: колонки читаются лениво через memmap"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self.meta['hands']
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        values = self._arrays.get(name)
+        if values is None:
+            values = self._arrays[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode='r')
+        return values
+
+    def materialize(self) -> Dict[str, np.ndarray]:
+        """Все колонки в памяти (для дописывания месяца)"""
+        return {name[:-4]: np.load(os.path.join(self.path, name))
+                for name in os.listdir(self.path) if name.endswith('.npy')}
+
+    def user_range(self, user_id: int):
+        """Срез раздач пользователя [lo, hi)"""
+        lo, hi = np.searchsorted(self['user_id'], [user_id, user_id + 1])
+        return int(lo), int(hi)
+
+    def ai_codes(self) -> np.ndarray:
+        """Коды словаря типов AI месяца -> коды game_codec.AI_TYPES (-1 - прочие)"""
+        return np.array([AI_TYPES.index(name) if name in AI_TYPES else -1 for name in self['ai_types']],
+                        dtype=np.int8)
+
+    def hand(self, index: int) -> Dict[str, Any]:
+        """Раздача в формате строки HandHistory (+ user_id, telegram_id, ai_type)"""
+        names = self['names']
+        # Срезы - списками: поэлементный доступ к memmap заметно дороже
+        first, last = self['player_offsets'][index:index + 2].tolist()
+        players = [str(names[code]) for code in self['player_name'][first:last].tolist()]
+        positions = self['player_position'][first:last].tolist()
+        cards = self['player_cards'][first:last].tolist()
+        nets = self['player_net'][first:last].tolist()
+        winners = self['player_winner'][first:last].tolist()
+        start, end = self['event_offsets'][index:index + 2].tolist()
+        seats = self['event_player'][start:end].tolist()
+        analysis = int(self['analysis'][index])
+        winning_hand = int(self['winning_hand'][index])
+        return {
+            'id': int(self['hand_id'][index]),
+            'session_id': int(self['session_id'][index]),
+            'hand_number': int(self['hand_number'][index]),
+            'user_id': int(self['user_id'][index]),
+            'telegram_id': int(self['telegram_id'][index]),
+            'ai_type': str(self['ai_types'][self['ai_type'][index]]),
+            'positions': {name: POSITIONS[code] for name, code in zip(players, positions) if code >= 0},
+            'hole_cards': {name: [str(CARDS[code]) for code in pair if code != EMPTY]
+                           for name, pair in zip(players, cards) if pair[0] != EMPTY},
+            'community_cards': [str(CARDS[code]) for code in self['board'][index].tolist() if code != EMPTY],
+            'actions': [{
+                'street': STREETS[street],
+                'player': players[seat] if seat >= 0 else '',
+                'action': ACTIONS[action],
+                'amount': int(amount),
+            } for street, action, seat, amount in zip(self['event_street'][start:end].tolist(),
+                                                      self['event_action'][start:end].tolist(), seats,
+                                                      self['event_amount'][start:end].tolist())],
+            'result': {
+                'winners': [name for name, winner in zip(players, winners) if winner],
+                'pot': int(self['pot'][index]),
+                'showdown': bool(self['showdown'][index]),
+                'winning_hand': _HAND_TYPE_NAMES.get(winning_hand) if winning_hand else None,
+                'net': {name: int(net) for name, net in zip(players, nets)},
+            },
+            'analysis': json.loads(str(self['analyses'][analysis])) if analysis >= 0 else None,
+            'created_at': self['created_at'][index].astype(datetime),
+        }
+
+
+class HandArchive:
+    """Каталог архива: месяцы и чтение раздач"""
+
+    def __init__(self, path: str = None):
+        self.path = path or config.get('HAND_ARCHIVE_DIR', 'hand_archive')
+        self._partitions: Dict[str, ArchivePartition] = {}
+
+    def months(self) -> List[str]:
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name for name in os.listdir(self.path)
+                      if os.path.isfile(os.path.join(self.path, name, 'meta.json')))
+
+    def partition(self, month: str) -> Optional[ArchivePartition]:
+        """Месяц архива; перечитывается, если месяц переписан"""
+        path = os.path.join(self.path, month)
+        try:
+            written = os.path.getmtime(os.path.join(path, 'meta.json'))
+        except OSError:
+            self._partitions.pop(month, None)
+            return None
+        partition = self._partitions.get(month)
+        if partition is None or partition.meta.get('mtime') != written:
+            partition = ArchivePartition(path)
+            partition.meta['mtime'] = written
+            self._partitions[month] = partition
+        return partition
+
+    def partitions(self, months: Iterable[str] = None) -> Iterator[ArchivePartition]:
+        for month in months if months is not None else self.months():
+            partition = self.partition(month)
+            if partition is not None:
+                yield partition
+
+    def user_columns(self, user_id: int):
+        """Архивные раздачи пользователя как HandColumns для StatsEngine (срезы memmap)"""
+        from app.stats_engine import HandColumns, concat_columns
+
+        parts = []
+        for partition in self.partitions():
+            lo, hi = partition.user_range(user_id)
+            if lo == hi:
+                continue
+            offsets = partition['event_offsets'][lo:hi + 1]
+            start, end = int(offsets[0]), int(offsets[-1])
+            won = partition['won'][lo:hi]
+            parts.append(HandColumns(
+                partition['net'][lo:hi],
+                partition['showdown'][lo:hi],
+                won,
+                partition.ai_codes()[partition['ai_type'][lo:hi]],
+                np.where(won, partition['winning_hand'][lo:hi], 0).astype(np.int8),
+                partition['hole_cards'][lo:hi],
+                np.repeat(np.arange(hi - lo, dtype=np.int32), np.diff(offsets)),
+                partition['event_street'][start:end],
+                partition['event_action'][start:end],
+                partition['event_user'][start:end],
+            ))
+        return concat_columns(parts) if parts else None
+
+    def iter_hands(self, user_id: int = None) -> Iterator[Dict[str, Any]]:
+        """Раздачи архива (всех или одного пользователя) в формате строк HandHistory"""
+        for partition in self.partitions():
+            lo, hi = partition.user_range(user_id) if user_id is not None else (0, len(partition))
+            for index in range(lo, hi):
+                yield partition.hand(index)
+
+    def get_hands(self, hand_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """Раздачи по id: {id: раздача}"""
+        wanted = np.array(sorted(set(hand_ids)), dtype=np.int64)
+        found = {}
+        for partition in self.partitions():
+            if not len(wanted):
+                break
+            if wanted[-1] < partition.meta['min_hand_id'] or wanted[0] > partition.meta['max_hand_id']:
+                continue
+            for index in np.flatnonzero(np.isin(partition['hand_id'], wanted)):
+                hand = partition.hand(int(index))
+                found[hand['id']] = hand
+            wanted = wanted[~np.isin(wanted, list(found))]
+        return found
+
+    def get_hand(self, hand_id: int) -> Optional[Dict[str, Any]]:
+        return self.get_hands([hand_id]).get(hand_id)
+
+    def session_hands(self, session_id: int, user_id: int, started: datetime = None,
+                      completed: datetime = None) -> List[Dict[str, Any]]:
+        """Раздачи сессии по hand_number; месяцы ограничиваются временем сессии"""
+        months = self.months()
+        if started is not None:
+            first, last = month_key(started), month_key(completed or started)
+            months = [month for month in months if first <= month <= last]
+        hands = []
+        for partition in self.partitions(months):
+            lo, hi = partition.user_range(user_id)
+            for index in np.flatnonzero(partition['session_id'][lo:hi] == session_id):
+                hands.append(partition.hand(lo + int(index)))
+        hands.sort(key=lambda hand: hand['hand_number'])
+        return hands
+
+    # ===== ЗАПИСЬ =====
+
+    def write_partition(self, month: str, arrays: Dict[str, np.ndarray]):
+        """Записать месяц атомарно: во временный каталог, затем замена"""
+        os.makedirs(self.path, exist_ok=True)
+        target = os.path.join(self.path, month)
+        temporary = os.path.join(self.path, f".{month}.tmp")
+        shutil.rmtree(temporary, ignore_errors=True)
+        os.makedirs(temporary)
+        for name, values in arrays.items():
+            np.save(os.path.join(temporary, f"{name}.npy"), np.ascontiguousarray(values), allow_pickle=False)
+        hand_ids = arrays['hand_id']
+        meta = {
+            'version': FORMAT_VERSION,
+            'month': month,
+            'hands': int(len(hand_ids)),
+            'events': int(len(arrays['event_street'])),
+            'min_hand_id': int(hand_ids.min()) if len(hand_ids) else 0,
+            'max_hand_id': int(hand_ids.max()) if len(hand_ids) else 0,
+            'written_at': datetime.utcnow().isoformat(),
+        }
+        with open(os.path.join(temporary, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        previous = os.path.join(self.path, f".{month}.old")
+        shutil.rmtree(previous, ignore_errors=True)
+        if os.path.isdir(target):
+            os.rename(target, previous)
+        os.rename(temporary, target)
+        shutil.rmtree(previous, ignore_errors=True)
+        self._partitions.pop(month, None)
+
+
+def _merge(existing: Dict[str, np.ndarray], added: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Дописать раздачи к месяцу: словари объединяются, коды новых раздач перекодируются"""
+    merged = {}
+    for dictionary, code_fields in (('names', ('player_name',)), ('ai_types', ('ai_type',)),
+                                    ('analyses', ('analysis',))):
+        values = _Dictionary(str(value) for value in existing[dictionary])
+        remap = np.array([values.code(str(value)) for value in added[dictionary]], dtype=np.int64)
+        merged[dictionary] = values.array()
+        for field in code_fields:
+            codes = added[field].astype(np.int64)
+            recoded = np.where(codes >= 0, remap[np.maximum(codes, 0)], codes)
+            merged[field] = np.concatenate([existing[field], recoded.astype(existing[field].dtype)])
+    for name, values in existing.items():
+        if name not in merged and name not in ('player_offsets', 'event_offsets'):
+            merged[name] = np.concatenate([values, added[name]])
+    return sort_partition(merged)
+
+
+def archive_month(database, archive: HandArchive, month: str, batch_size: int = 5000) -> Dict[str, int]:
+    """Перенести раздачи месяца из hand_histories в архив"""
+    start, end = month_range(month)
+    existing = archive.partition(month)
+    archived_ids = set(existing['hand_id'].tolist()) if existing is not None else set()
+
+    builder = _PartitionBuilder()
+    moved: List[int] = []
+    read_session = database.get_session()
+    try:
+        rows = read_session.query(HandHistory.id, HandHistory.session_id, HandHistory.hand_number,
+                                  GameSession.user_id, User.telegram_id, GameSession.ai_opponent_type,
+                                  HandHistory.created_at, HandHistory.positions, HandHistory.hole_cards,
+                                  HandHistory.community_cards, HandHistory.actions, HandHistory.result,
+                                  HandHistory.analysis)\
+            .join(GameSession, GameSession.id == HandHistory.session_id)\
+            .join(User, User.id == GameSession.user_id)\
+            .filter(HandHistory.created_at >= start, HandHistory.created_at < end)
+        for row in rows.yield_per(batch_size):
+            moved.append(row[0])
+            if row[0] not in archived_ids:
+                builder.add(*row)
+    finally:
+        read_session.close()
+
+    if len(builder):
+        arrays = builder.arrays()
+        if existing is not None:
+            arrays = _merge(existing.materialize(), arrays)
+        archive.write_partition(month, arrays)
+
+    # Удаляем только после записи месяца
+    for offset in range(0, len(moved), DELETE_BATCH):
+        with database.session_scope() as session:
+            session.query(HandHistory).filter(HandHistory.id.in_(moved[offset:offset + DELETE_BATCH]))\
+                .delete(synchronize_session=False)
+    return {'hands': len(builder), 'pruned': len(moved)}
+
+
+def _add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def archive_hands(database, archive: HandArchive = None, keep_months: int = None,
+                  vacuum: bool = False) -> Dict[str, int]:
+    """Перенести в архив все закрытые месяцы старше keep_months"""
+    from sqlalchemy import func
+
+    archive = archive or hand_archive
+    if keep_months is None:
+        keep_months = int(config.get('HAND_ARCHIVE_KEEP_MONTHS', 3))
+    cutoff = _add_months(datetime.utcnow().date().replace(day=1), -keep_months)
+
+    with database.session_scope() as session:
+        oldest = session.query(func.min(HandHistory.created_at)).scalar()
+    totals = {'months': 0, 'hands': 0, 'pruned': 0}
+    if oldest is None:
+        return totals
+    month = oldest.date().replace(day=1)
+    while month < cutoff:
+        moved = archive_month(database, archive, month_key(month))
+        if moved['pruned']:
+            totals['months'] += 1
+            totals['hands'] += moved['hands']
+            totals['pruned'] += moved['pruned']
+            logger.info(f"Архив {month_key(month)}: {moved}")
+        month = _add_months(month, 1)
+
+    if vacuum and totals['pruned'] and database.engine.dialect.name == 'sqlite':
+        with database.raw_connection() as conn:
+            conn.execute('VACUUM')
+    return totals
+
+
+async def run_periodic_archive(database, interval_hours: float = 24.0):
+    """Фоновая задача бота: перенос старых месяцев в архив в пуле потоков"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval_hours * 3600)
+        try:
+            totals = await loop.run_in_executor(None, archive_hands, database)
+            if totals['pruned']:
+                logger.info(f"Раздачи перенесены в архив: {totals}")
+        except Exception as e:
+            logger.error(f"Ошибка архивации раздач: {e}")
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    from app.database import db
+
+    parser = argparse.ArgumentParser(description="Перенос старых раздач в колоночный архив")
+    parser.add_argument('--keep-months', type=int, default=None, help="сколько последних месяцев оставить в БД")
+    parser.add_argument('--vacuum', action='store_true', help="вернуть освободившееся место (VACUUM)")
+    args = parser.parse_args(argv)
+
+    db.init_db()
+    started = datetime.now()
+    totals = archive_hands(db, keep_months=args.keep_months, vacuum=args.vacuum)
+    print(f"✅ Месяцев: {totals['months']}, раздач в архиве: {totals['hands']}, "
+          f"удалено из БД: {totals['pruned']} за {(datetime.now() - started).total_seconds():.1f} с")
+    return 0
+
+
+# Глобальный экземпляр архива
+hand_archive = HandArchive()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
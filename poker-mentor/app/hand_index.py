@@ -0,0 +1,341 @@
+"""
+Битовый индекс раздач для поиска по фильтрам (/find).
+
+Для каждой раздачи пользователя извлекаются признаки: класс руки
+(AKs), позиция, в позиции или нет на постфлопе, текстура флопа,
+достигнутые улицы, действия пользователя по улицам, результат и тип
+AI. Раздача получает порядковый номер у пользователя, и для каждого
+значения признака хранится битовая карта номеров, разбитая на
+сегменты по SEGMENT_BITS раздач и сжатая zlib (таблица hand_bitmaps).
+
+Фильтр - AND по признакам и OR по значениям одного признака - это
+побитовые операции над целыми Python по сегментам; JSON раздач при
+поиске не читается. Database.save_hands и импорт историй дописывают
+индекс в своей транзакции, переписывая только последний сегмент.
+Пересборка по всей истории: python -m app.hand_index
+"""
+
+import sys
+import zlib
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import delete
+
+from app.database import db
+from app.hand_archive import hand_archive
+from app.models import GameSession, HandBitmap, HandHistory, User
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_BITS = 65536
+IDS = '_ids'
+
+ATTRIBUTES = ('hand', 'position', 'ip', 'board', 'street', 'action', 'result', 'opponent')
+
+_RANKS = '23456789TJQKA'
+_RANK_ORDER = {rank: order for order, rank in enumerate(_RANKS)}
+# Порядок хода на постфлопе (хедз-ап: баттон - SB, ходит последним)
+_POSTFLOP_ORDER = ('SB', 'BB', 'UTG', 'UTG+1', 'UTG+2', 'MP', 'HJ', 'CO', 'BTN')
+_STREETS = ('preflop', 'flop', 'turn', 'river')
+_BOARD_SIZE = {'flop': 3, 'turn': 4, 'river': 5}
+
+
+def hand_class(cards: List[str]) -> Optional[str]:
+    """['A♠', 'K♠'] -> 'AKs', пары - 'QQ'"""
+    if len(cards) != 2:
+        return None
+    (high, high_suit), (low, low_suit) = sorted(((card[:-1], card[-1]) for card in cards),
+                                                key=lambda card: _RANK_ORDER.get(card[0], -1), reverse=True)
+    if high == low:
+        return high + low
+    return f"{high}{low}{'s' if high_suit == low_suit else 'o'}"
+
+
+def board_texture(board: List[str]) -> List[str]:
+    """Текстура флопа: масти (monotone/two_tone/rainbow), paired, connected"""
+    if len(board) < 3:
+        return []
+    flop = board[:3]
+    suits = len({card[-1] for card in flop})
+    textures = [{1: 'monotone', 2: 'two_tone', 3: 'rainbow'}[suits]]
+    ranks = sorted({_RANK_ORDER.get(card[:-1], -1) for card in flop})
+    if len(ranks) < 3:
+        textures.append('paired')
+    elif ranks[-1] - ranks[0] <= 4:
+        textures.append('connected')
+    return textures
+
+
+def _in_position(hand: Dict[str, Any], player: str) -> Optional[str]:
+    """'ip'/'oop' для раздачи, дошедшей до флопа с пользователем и соперниками"""
+    positions = hand.get('positions') or {}
+    folded = {event['player'] for event in hand.get('actions') or []
+              if event['street'] == 'preflop' and event['action'] == 'fold'}
+    in_hand = [name for name in positions if name not in folded]
+    if player not in in_hand or len(in_hand) < 2 or len(hand.get('community_cards') or []) < 3:
+        return None
+    order = _POSTFLOP_ORDER
+    if set(positions.values()) == {'SB', 'BB'}:
+        order = ('BB', 'SB')
+    rank = {position: index for index, position in enumerate(order)}
+    last = max(in_hand, key=lambda name: rank.get(positions[name], -1))
+    return 'ip' if last == player else 'oop'
+
+
+def hand_features(hand: Dict[str, Any], player: str, ai_type: str = None) -> List[Tuple[str, str]]:
+    """Пары (признак, значение) раздачи для пользователя player"""
+    features = []
+    cards = hand_class((hand.get('hole_cards') or {}).get(player) or [])
+    if cards:
+        features.append(('hand', cards))
+    position = (hand.get('positions') or {}).get(player)
+    if position:
+        features.append(('position', position))
+    ip = _in_position(hand, player)
+    if ip:
+        features.append(('ip', ip))
+    board = hand.get('community_cards') or []
+    features.extend(('board', texture) for texture in board_texture(board))
+
+    # Улицы, до которых дошел пользователь (накопительно: river входит в turn)
+    actions = hand.get('actions') or []
+    fold_street = next((event['street'] for event in actions
+                        if event['player'] == player and event['action'] == 'fold'), None)
+    for street in _STREETS:
+        if street != 'preflop' and len(board) < _BOARD_SIZE[street]:
+            break
+        features.append(('street', street))
+        if street == fold_street:
+            break
+    result = hand.get('result') or {}
+    if result.get('showdown') and fold_street is None:
+        features.append(('street', 'showdown'))
+
+    features.extend(dict.fromkeys(
+        ('action', f"{event['street']}_{event['action']}") for event in actions
+        if event['player'] == player and event['action'] not in ('small_blind', 'big_blind')))
+
+    net = (result.get('net') or {}).get(player, 0)
+    features.append(('result', 'win' if net > 0 else 'loss' if net < 0 else 'push'))
+    if ai_type:
+        features.append(('opponent', ai_type))
+    return features
+
+
+def _pack(bits: int) -> bytes:
+    return zlib.compress(bits.to_bytes((bits.bit_length() + 7) // 8, 'little'))
+
+
+def _unpack(data: bytes) -> int:
+    return int.from_bytes(zlib.decompress(data), 'little') if data else 0
+
+
+def _pack_ids(ids: np.ndarray) -> bytes:
+    return zlib.compress(ids.astype(np.int64).tobytes())
+
+
+def _unpack_ids(data: bytes) -> np.ndarray:
+    return np.frombuffer(zlib.decompress(data), dtype=np.int64) if data else np.zeros(0, dtype=np.int64)
+
+
+def bit_positions(bits: int) -> np.ndarray:
+    """Номера установленных битов по возрастанию"""
+    if not bits:
+        return np.zeros(0, dtype=np.int64)
+    raw = np.frombuffer(bits.to_bytes((bits.bit_length() + 7) // 8, 'little'), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(raw, bitorder='little'))
+
+
+class HandIndexer:
+    """Приращения битового индекса по пачке сохраненных раздач.
+
+    Как и StatsAggregator: add_hand() для каждой раздачи с уже
+    известным id, затем apply() в той же транзакции.
+    """
+
+    def __init__(self):
+        self._hands: Dict[int, List[Tuple[int, List[Tuple[str, str]]]]] = defaultdict(list)
+
+    def __len__(self) -> int:
+        return sum(map(len, self._hands.values()))
+
+    def add_hand(self, user_id: int, hand_id: int, hand: Dict[str, Any]):
+        player = f"user_{hand['telegram_id']}"
+        self._hands[user_id].append((hand_id, hand_features(hand, player, hand.get('ai_type'))))
+
+    def apply(self, session) -> int:
+        """Дописать раздачи в последние сегменты пользователей"""
+        written = 0
+        for user_id, hands in self._hands.items():
+            written += self._apply_user(session, user_id, hands)
+        self._hands = defaultdict(list)
+        return written
+
+    @staticmethod
+    def _apply_user(session, user_id: int, hands: List[Tuple[int, List[Tuple[str, str]]]]) -> int:
+        last = session.query(HandBitmap)\
+            .filter(HandBitmap.user_id == user_id, HandBitmap.attribute == IDS, HandBitmap.value == '')\
+            .order_by(HandBitmap.segment.desc()).first()
+        ordinal = last.segment * SEGMENT_BITS + last.cardinality if last else 0
+
+        # Новые биты и id по (признак, значение, сегмент)
+        new_bits: Dict[Tuple[str, str, int], int] = defaultdict(int)
+        new_ids: Dict[int, List[int]] = defaultdict(list)
+        for hand_id, features in hands:
+            segment, bit = divmod(ordinal, SEGMENT_BITS)
+            new_ids[segment].append(hand_id)
+            for attribute, value in features:
+                new_bits[(attribute, value, segment)] |= 1 << bit
+            ordinal += 1
+
+        rows = {(row.attribute, row.value, row.segment): row for row in session.query(HandBitmap)
+                .filter(HandBitmap.user_id == user_id, HandBitmap.segment.in_(list(new_ids)))}
+        for segment, ids in new_ids.items():
+            row = rows.get((IDS, '', segment))
+            if row is None:
+                row = HandBitmap(user_id=user_id, attribute=IDS, value='', segment=segment, cardinality=0)
+                session.add(row)
+            row.data = _pack_ids(np.concatenate([_unpack_ids(row.data), np.array(ids, dtype=np.int64)]))
+            row.cardinality += len(ids)
+        for (attribute, value, segment), bits in new_bits.items():
+            row = rows.get((attribute, value, segment))
+            if row is None:
+                row = HandBitmap(user_id=user_id, attribute=attribute, value=value[:20], segment=segment,
+                                 cardinality=0)
+                session.add(row)
+            merged = _unpack(row.data) | bits
+            row.data = _pack(merged)
+            row.cardinality = merged.bit_count()
+        return len(hands)
+
+
+class HandIndex:
+    """Поиск раздач пользователя по битовому индексу"""
+
+    def __init__(self):
+        self.db = db
+
+    def search(self, telegram_id: int, filters: Dict[str, Iterable[str]],
+               limit: int = 10) -> Tuple[int, List[int]]:
+        """(число найденных раздач, id последних limit из них, новые первыми).
+
+        filters: {признак: значения} - AND по признакам, OR по значениям.
+        """
+        filters = {attribute: [values] if isinstance(values, str) else list(values)
+                   for attribute, values in filters.items()}
+        unknown = [attribute for attribute in filters if attribute not in ATTRIBUTES]
+        if unknown:
+            raise ValueError(f"Неизвестные признаки: {', '.join(unknown)}")
+
+        with self.db.session_scope() as session:
+            user_id = session.query(User.id).filter(User.telegram_id == telegram_id).scalar()
+            if user_id is None:
+                return 0, []
+            query = session.query(HandBitmap.attribute, HandBitmap.value, HandBitmap.segment, HandBitmap.data)\
+                .filter(HandBitmap.user_id == user_id,
+                        HandBitmap.attribute.in_(list(filters) + [IDS]))
+            bitmaps: Dict[int, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+            ids: Dict[int, bytes] = {}
+            for attribute, value, segment, data in query:
+                if attribute == IDS:
+                    ids[segment] = data
+                elif value in filters[attribute]:
+                    bitmaps[segment][attribute] |= _unpack(data)
+
+        found: List[np.ndarray] = []
+        for segment, data in ids.items():
+            segment_ids = _unpack_ids(data)
+            matched = (1 << len(segment_ids)) - 1
+            for attribute in filters:
+                matched &= bitmaps[segment][attribute]
+            found.append(segment_ids[bit_positions(matched)])
+        # Порядковые номера не совпадают с порядком игры (пересборка, архив) - сортируем по id
+        hand_ids = np.sort(np.concatenate(found))[::-1] if found else np.zeros(0, dtype=np.int64)
+        return len(hand_ids), [int(hand_id) for hand_id in hand_ids[:limit]]
+
+    def values(self, telegram_id: int) -> Dict[str, Dict[str, int]]:
+        """Значения признаков пользователя и число раздач с ними"""
+        with self.db.session_scope() as session:
+            rows = session.query(HandBitmap.attribute, HandBitmap.value, HandBitmap.cardinality)\
+                .join(User, User.id == HandBitmap.user_id)\
+                .filter(User.telegram_id == telegram_id, HandBitmap.attribute != IDS).all()
+        counts: Dict[str, Dict[str, int]] = defaultdict(dict)
+        for attribute, value, cardinality in rows:
+            counts[attribute][value] = counts[attribute].get(value, 0) + (cardinality or 0)
+        return counts
+
+
+def rebuild(database, batch_size: int = 5000, user_id: Optional[int] = None) -> Dict[str, int]:
+    """Пересобрать индекс (всех или одного пользователя по users.id).
+
+    Раздачи читаются курсором (yield_per), индекс дописывается каждые
+    batch_size раздач отдельной транзакцией. Запускать, пока бот не
+    пишет раздачи.
+    """
+    with database.session_scope() as session:
+        statement = delete(HandBitmap)
+        if user_id is not None:
+            statement = statement.where(HandBitmap.user_id == user_id)
+        session.execute(statement)
+
+    totals = {'hands': 0}
+    indexer = HandIndexer()
+    read_session = database.get_session()
+    try:
+        hands = read_session.query(GameSession.user_id, GameSession.ai_opponent_type, User.telegram_id,
+                                   HandHistory.id, HandHistory.positions, HandHistory.hole_cards,
+                                   HandHistory.community_cards, HandHistory.actions, HandHistory.result)\
+            .join(GameSession, GameSession.id == HandHistory.session_id)\
+            .join(User, User.id == GameSession.user_id)
+        if user_id is not None:
+            hands = hands.filter(GameSession.user_id == user_id)
+        for owner, ai_type, telegram_id, hand_id, positions, hole_cards, board, actions, result \
+                in hands.yield_per(batch_size):
+            indexer.add_hand(owner, hand_id, {
+                'telegram_id': telegram_id,
+                'ai_type': ai_type,
+                'positions': positions,
+                'hole_cards': hole_cards,
+                'community_cards': board,
+                'actions': actions,
+                'result': result,
+            })
+            totals['hands'] += 1
+            if len(indexer) >= batch_size:
+                with database.session_scope() as session:
+                    indexer.apply(session)
+    finally:
+        read_session.close()
+
+    # Раздачи прошлых месяцев из колоночного архива
+    for hand in hand_archive.iter_hands(user_id):
+        indexer.add_hand(hand['user_id'], hand['id'], hand)
+        totals['hands'] += 1
+        if len(indexer) >= batch_size:
+            with database.session_scope() as session:
+                indexer.apply(session)
+
+    with database.session_scope() as session:
+        indexer.apply(session)
+    logger.info(f"Индекс раздач пересобран: {totals}")
+    return totals
+
+
+def main():
+    db.init_db()
+    started = datetime.now()
+    totals = rebuild(db)
+    print(f"✅ Проиндексировано раздач: {totals['hands']} за {(datetime.now() - started).total_seconds():.1f} с")
+    return 0
+
+
+# Глобальный экземпляр поиска
+hand_index = HandIndex()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.exc import OperationalError
+
+from app.poker_engine import PokerGame
+
+logger = logging.getLogger(__name__)
+
+
+def build_hand_record(telegram_id: int, game: PokerGame, winners: List[str], showdown: bool,
+                      winning_hand: Optional[str] = None) -> Dict[str, Any]:
+    """Запись завершенной раздачи из лога событий игры"""
+    invested = {player: 0 for player in game.players}
+    for event in game.hand_history:
+        if event['player'] in invested:
+            invested[event['player']] += event['amount']
+
+    # Банк делится между победителями, остаток - первому
+    won = {player: 0 for player in game.players}
+    if winners:
+        share, remainder = divmod(game.pot, len(winners))
+        for player in winners:
+            won[player] = share
+        won[winners[0]] += remainder
+
+    ai_opponent = getattr(game, 'ai_opponent', None)
+    return {
+        'telegram_id': telegram_id,
+        'ai_type': ai_opponent.name.lower() if ai_opponent else 'unknown',
+        'positions': {game.players[0]: 'SB', game.players[1]: 'BB'},
+        'hole_cards': {player: [str(card) for card in cards] for player, cards in game.player_cards.items()},
+        'community_cards': [str(card) for card in game.community_cards],
+        'actions': list(game.hand_history),
+        'result': {
+            'winners': winners,
+            'pot': game.pot,
+            'showdown': showdown,
+            'winning_hand': winning_hand,
+            'net': {player: won[player] - invested[player] for player in game.players},
+        },
+        'created_at': datetime.utcnow(),
+    }
+
+
+class HandLog:
+    """Буфер завершенных раздач с пакетной записью в hand_histories.
+    
+    Очередь ограничена max_pending (при переполнении теряются самые
+    старые раздачи). Пачка, которая не записывается max_failures раз
+    подряд, делится пополам до отдельных раздач; раздача, которую
+    нельзя записать и по одной, откладывается в карантин (лог) и
+    больше не блокирует очередь. Ошибки соединения (OperationalError)
+    пачку не делят: это недоступность БД, а не плохие данные.
+    """
+
+    def __init__(self, batch_size: int = 500, max_pending: int = 100000, max_failures: int = 3):
+        self.batch_size = batch_size
+        self.max_failures = max_failures
+        self._hands = deque(maxlen=max_pending)
+        # Сброс вызывается из пула потоков, записи не должны уходить дважды
+        self._flush_lock = threading.Lock()
+        self._failures = 0
+        self.saved = 0
+        self.dropped = 0
+        self.quarantined = 0
+
+    def __len__(self) -> int:
+        return len(self._hands)
+
+    def record_hand(self, hand: Dict[str, Any]):
+        """Добавить раздачу в очередь на запись (без обращения к БД)"""
+        if len(self._hands) == self._hands.maxlen:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"Очередь раздач переполнена, потеряно раздач: {self.dropped}")
+        self._hands.append(hand)
+
+    def flush(self, database) -> int:
+        """Записать накопленные раздачи пачками, вернуть число сохраненных"""
+        saved = 0
+        with self._flush_lock:
+            while self._hands:
+                batch = []
+                while self._hands and len(batch) < self.batch_size:
+                    batch.append(self._hands.popleft())
+                try:
+                    database.save_hands(batch)
+                except Exception as e:
+                    self._failures += 1
+                    logger.error(f"Ошибка записи истории раздач (попытка {self._failures}): {e}")
+                    if self._failures < self.max_failures or isinstance(e, OperationalError):
+                        self._requeue(batch)
+                        break
+                    # Ошибка повторяется: ищем и откладываем плохие раздачи
+                    split_saved, completed = self._save_split(database, batch)
+                    saved += split_saved
+                    if not completed:
+                        break
+                    self._failures = 0
+                    continue
+                self._failures = 0
+                saved += len(batch)
+        if saved:
+            self.saved += saved
+            logger.debug(f"Сохранено раздач: {saved}")
+        return saved
+
+    def _requeue(self, hands: List[Dict[str, Any]]):
+        """Вернуть раздачи в начало очереди в исходном порядке"""
+        overflow = len(self._hands) + len(hands) - self._hands.maxlen
+        if overflow > 0:
+            # extendleft вытесняет самые новые раздачи с конца очереди
+            self.dropped += overflow
+            logger.warning(f"Очередь раздач переполнена, потеряно раздач: {self.dropped}")
+        self._hands.extendleft(reversed(hands))
+
+    def _save_split(self, database, batch: List[Dict[str, Any]]):
+        """Записать пачку половинами; (сохранено, дошли ли до конца пачки)"""
+        saved = 0
+        middle = len(batch) // 2
+        parts = deque([batch[:middle], batch[middle:]] if middle else [batch])
+        while parts:
+            part = parts.popleft()
+            try:
+                database.save_hands(part)
+                saved += len(part)
+            except OperationalError as e:
+                logger.error(f"БД недоступна при записи раздач: {e}")
+                self._requeue([hand for piece in [part, *parts] for hand in piece])
+                return saved, False
+            except Exception as e:
+                if len(part) > 1:
+                    middle = len(part) // 2
+                    parts.extendleft([part[middle:], part[:middle]])
+                else:
+                    self._quarantine(part[0], e)
+        return saved, True
+
+    def _quarantine(self, hand: Dict[str, Any], error: Exception):
+        """Отложить раздачу, которую нельзя записать: в лог, из очереди - вон"""
+        self.quarantined += 1
+        logger.error(f"Раздача пользователя {hand.get('telegram_id')} от {hand.get('created_at')} "
+                     f"не записывается и отложена в карантин ({error}): {hand!r}")
+
+    async def run_periodic_flush(self, database, interval: float = 5.0):
+        """Фоновая задача: запись в пуле потоков, event loop не ждет диск"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            if self._hands:
+                await loop.run_in_executor(None, self.flush, database)
+
+
+# Глобальный лог раздач
+hand_log = HandLog()
@@ -0,0 +1,154 @@
+"""
+Детерминированное воспроизведение сохраненных раздач.
+
+Источники: строки HandHistory (ORM-объекты или словари с теми же
+полями), колоночный архив app.hand_archive и бинарные записи
+app.game_codec (encode_many). Для каждого
+решения игрока генератор выдает DecisionPoint - состояние стола до
+действия и само действие. Учет фишек повторяет GameManager: стеки
+и банк меняются на сумму из лога, рейз задает current_bet.
+
+Модуль не использует Telegram и логирование; PokerGame собирается
+лениво (DecisionPoint.to_game), горячий цикл работает с кортежами.
+"""
+
+from collections import namedtuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+from app.game_codec import CARDS, decode_many
+from app.poker_engine import Card, Deck, PokerGame
+
+STARTING_STACK = 100
+BOARD_SIZE = {'preflop': 0, 'flop': 3, 'turn': 4, 'river': 5}
+BLIND_ACTIONS = frozenset(('small_blind', 'big_blind'))
+
+_CARD_BY_TEXT = {str(card): card for card in CARDS}
+_new_tuple = tuple.__new__
+
+
+class ReplayHand:
+    """Раздача, приведенная к единому виду для воспроизведения"""
+
+    __slots__ = ('hand_id', 'players', 'hole_cards', 'board', 'actions', 'big_blind', 'result')
+
+    def __init__(self, hand_id: Any, players: List[str], hole_cards: Dict[str, List[Card]],
+                 board: List[Card], actions: List[dict], big_blind: int = 2,
+                 result: Optional[dict] = None):
+        self.hand_id = hand_id
+        self.players = players
+        self.hole_cards = hole_cards
+        self.board = board
+        self.actions = actions
+        self.big_blind = big_blind
+        self.result = result
+
+
+_DecisionFields = namedtuple('_DecisionFields', ('hand', 'index', 'street', 'player', 'action', 'amount',
+                                                 'pot', 'current_bet', 'stacks'))
+
+
+class DecisionPoint(_DecisionFields):
+    """Состояние стола перед решением игрока (кортеж: создается без вызова Python-кода)"""
+
+    __slots__ = ()
+
+    @property
+    def board(self) -> List[Card]:
+        """Открытые на этой улице карты"""
+        return self.hand.board[:BOARD_SIZE.get(self.street, 0)]
+
+    @property
+    def hole_cards(self) -> List[Card]:
+        """Карманные карты игрока, принимающего решение"""
+        return self.hand.hole_cards.get(self.player, [])
+
+    def to_game(self) -> PokerGame:
+        """Собрать PokerGame в состоянии этого решения"""
+        hand = self.hand
+        game = PokerGame.__new__(PokerGame)
+        game.players = list(hand.players)
+        game.small_blind = hand.big_blind // 2
+        game.big_blind = hand.big_blind
+        game.pot = self.pot
+        game.current_bet = self.current_bet
+        game.current_player_idx = hand.players.index(self.player) if self.player in hand.players else 0
+        game.player_stacks = dict(zip(hand.players, self.stacks))
+        game.player_cards = {player: list(cards) for player, cards in hand.hole_cards.items()}
+        game.community_cards = self.board
+        game.hand_history = hand.actions[:self.index]
+        # Остаток колоды: карты, не известные в раздаче, в каноническом порядке
+        known = {card.code for cards in hand.hole_cards.values() for card in cards}
+        known.update(card.code for card in hand.board)
+        game.deck = Deck.__new__(Deck)
+        game.deck.cards = [card for card in CARDS if card.code not in known]
+        return game
+
+
+def _parse_cards(cards: Optional[Iterable[str]]) -> List[Card]:
+    return list(map(_CARD_BY_TEXT.__getitem__, cards)) if cards else []
+
+
+def hands_from_rows(rows: Iterable[Any]) -> Iterator[ReplayHand]:
+    """ReplayHand из строк HandHistory (объекты или словари)"""
+    for row in rows:
+        get = row.get if isinstance(row, dict) else (lambda name, row=row: getattr(row, name, None))
+        positions = get('positions') or {}
+        actions = get('actions') or []
+        # SB ходит первым, как в GameManager
+        players = sorted(positions, key=lambda player: positions[player] != 'SB')
+        big_blind = next((event['amount'] for event in actions if event['action'] == 'big_blind'), 2)
+        yield ReplayHand(
+            get('id'),
+            players,
+            {player: _parse_cards(cards) for player, cards in (get('hole_cards') or {}).items()},
+            _parse_cards(get('community_cards')),
+            actions,
+            big_blind,
+            get('result')
+        )
+
+
+def hands_from_binary(buffer: Union[bytes, bytearray, memoryview]) -> Iterator[ReplayHand]:
+    """ReplayHand из пакета бинарных записей app.game_codec"""
+    for number, game in enumerate(decode_many(buffer, restore_ai=False, with_deck=False)):
+        yield ReplayHand(number, game.players, game.player_cards, game.community_cards,
+                         game.hand_history, game.big_blind)
+
+
+def replay(hands: Iterable[ReplayHand], starting_stack: int = STARTING_STACK,
+           include_blinds: bool = False) -> Iterator[DecisionPoint]:
+    """Поток решений по всем раздачам в порядке игры"""
+    for hand in hands:
+        players = hand.players
+        seats = {player: seat for seat, player in enumerate(players)}
+        stacks = [starting_stack] * len(players)
+        pot = 0
+        current_bet = 0
+        for index, event in enumerate(hand.actions):
+            action = event['action']
+            amount = event['amount']
+            player = event['player']
+            if include_blinds or action not in BLIND_ACTIONS:
+                yield _new_tuple(DecisionPoint, (hand, index, event['street'], player, action, amount,
+                                                 pot, current_bet, tuple(stacks)))
+            seat = seats.get(player)
+            if seat is not None:
+                stacks[seat] -= amount
+            pot += amount
+            if action == 'raise' or action == 'big_blind':
+                current_bet = amount
+
+
+def replay_rows(rows: Iterable[Any], **kwargs) -> Iterator[DecisionPoint]:
+    """Воспроизвести строки HandHistory"""
+    return replay(hands_from_rows(rows), **kwargs)
+
+
+def replay_binary(buffer: Union[bytes, bytearray, memoryview], **kwargs) -> Iterator[DecisionPoint]:
+    """Воспроизвести пакет бинарных записей"""
+    return replay(hands_from_binary(buffer), **kwargs)
+
+
+def replay_archive(archive, user_id: Optional[int] = None, **kwargs) -> Iterator[DecisionPoint]:
+    """Воспроизвести раздачи колоночного архива (HandArchive)"""
+    return replay(hands_from_rows(archive.iter_hands(user_id)), **kwargs)
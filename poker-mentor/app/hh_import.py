@@ -0,0 +1,505 @@
+"""
+Импорт текстовых историй раздач (PokerStars и совместимые форматы:
+GGPoker "Poker Hand #", Full Tilt "Full Tilt Poker Game #").
+
+Конвейер генераторов: файл делится на байтовые диапазоны, каждый
+диапазон читается построчно (память не зависит от размера файла) и
+разбирается в отдельном процессе; раздачи приходят в главный процесс
+пачками и пишутся в game_sessions/hand_histories крупными транзакциями
+через executemany, вместе с приращениями UserStats, дневных итогов и
+битового индекса раздач.
+
+Раздача приводится к формату build_hand_record: герой (Dealt to)
+становится user_<telegram_id>, суммы - в фишках тренажера (big blind =
+2 фишки), тип оппонента - 'import'. Номер раздачи в руме (source_id)
+запоминается в imported_hands, повторный импорт пропускает такие раздачи.
+
+    python -m app.hh_import --user <telegram_id> [--workers N] файлы...
+"""
+
+import re
+import os
+import sys
+import logging
+import multiprocessing
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import insert
+
+from app.models import GameSession, HandHistory, ImportedHand, User, GameType, SessionStatus
+from app.poker_engine import BIG_BLIND
+
+logger = logging.getLogger(__name__)
+
+IMPORT_AI_TYPE = 'import'
+# Big blind в фишках тренажера: импортированные суммы в тех же единицах, что и свои игры
+CHIPS_PER_BB = BIG_BLIND
+CHUNK_BYTES = 4 * 1024 * 1024
+BATCH_HANDS = 20000
+# source_id в одном IN (меньше лимита 999 параметров старых SQLite)
+SOURCE_ID_CHUNK = 500
+
+HAND_START = re.compile(rb'^(?:\xef\xbb\xbf)?(?:PokerStars|Poker|Full Tilt Poker) (?:Hand|Game) #')
+_HAND_ID = re.compile(r'(?:Hand|Game) #([\w-]+)')
+_STAKES = re.compile(r'\(([$€£]?[\d.,]+)/([$€£]?[\d.,]+)')
+_DATE = re.compile(r'(\d{4}/\d{2}/\d{2} \d{1,2}:\d{2}:\d{2})(?: ([A-Z]{2,4})\b)?')
+_DATE_FIELDS = re.compile(r'[/ :]')
+_TABLE = re.compile(r"^Table '([^']+)'.*?(?:Seat #(\d+) is the button)?$")
+_SEAT = re.compile(r'^Seat (\d+): (.+?) \([$€£]?[\d.,]+(?: in chips)?.*\)(?! is sitting out)')
+_DEALT = re.compile(r'^Dealt to (.+?) \[(.+?)\]')
+_BOARD = re.compile(r'^\*\*\* (FLOP|TURN|RIVER) \*\*\*.*?((?:\[[^\]]+\] ?)+)$')
+_ACTION = re.compile(r'^(.+?): (posts small blind|posts big blind|posts small & big blinds|posts the ante|posts ante|'
+                     r'folds|checks|calls|bets|raises)(?: [$€£]?([\d.,]+))?(?: to [$€£]?([\d.,]+))?(.*)$')
+_RETURNED = re.compile(r'^Uncalled bet \([$€£]?([\d.,]+)\) returned to (.+)$')
+_COLLECTED = re.compile(r'^(.+?) collected [$€£]?([\d.,]+) from')
+_SHOWS = re.compile(r'^(.+?): shows \[(.+?)\](?: \((.+)\))?')
+
+SUITS = {'s': '♠', 'h': '♥', 'd': '♦', 'c': '♣'}
+STREET_NAMES = {'FLOP': 'flop', 'TURN': 'turn', 'RIVER': 'river'}
+# Описание комбинации в истории -> HandType.name (порядок важен: "straight flush" раньше "straight")
+HAND_DESCRIPTIONS = (
+    ('royal flush', 'ROYAL_FLUSH'),
+    ('straight flush', 'STRAIGHT_FLUSH'),
+    ('four of a kind', 'FOUR_OF_A_KIND'),
+    ('full house', 'FULL_HOUSE'),
+    ('flush', 'FLUSH'),
+    ('straight', 'STRAIGHT'),
+    ('three of a kind', 'THREE_OF_A_KIND'),
+    ('two pair', 'TWO_PAIR'),
+    ('pair', 'ONE_PAIR'),
+    ('high card', 'HIGH_CARD'),
+)
+LATE_POSITIONS = ('UTG', 'UTG+1', 'UTG+2', 'MP', 'HJ', 'CO')
+# Метки часовых поясов в заголовках -> зона IANA (летнее время учитывает zoneinfo)
+TIMEZONES = {
+    'ET': 'America/New_York', 'EST': 'America/New_York', 'EDT': 'America/New_York',
+    'CT': 'America/Chicago', 'MT': 'America/Denver', 'PT': 'America/Los_Angeles',
+    'BRT': 'America/Sao_Paulo', 'ART': 'America/Argentina/Buenos_Aires',
+    'WET': 'Europe/Lisbon', 'WEST': 'Europe/Lisbon',
+    'CET': 'Europe/Paris', 'CEST': 'Europe/Paris',
+    'EET': 'Europe/Helsinki', 'EEST': 'Europe/Helsinki', 'MSK': 'Europe/Moscow',
+    'IST': 'Asia/Kolkata', 'CCT': 'Asia/Shanghai', 'JST': 'Asia/Tokyo',
+    'AET': 'Australia/Sydney', 'NZT': 'Pacific/Auckland',
+    'UTC': 'UTC', 'GMT': 'UTC',
+}
+
+
+class HandParseError(ValueError):
+    """Текст раздачи не разобран"""
+
+
+def _number(text: str) -> float:
+    return float(text.lstrip('$€£').replace(',', ''))
+
+
+def _cards(text: str) -> List[str]:
+    """'Ah Kd' -> ['A♥', 'K♦'] (формат str(Card))"""
+    return [card[:-1].upper().replace('10', 'T') + SUITS[card[-1].lower()] for card in text.split()]
+
+
+def _positions(seats: List[Tuple[int, str]], button: Optional[int]) -> Dict[str, str]:
+    """Позиции от баттона: SB, BB, затем UTG..CO, BTN"""
+    if not seats:
+        return {}
+    seats = sorted(seats)
+    numbers = [number for number, _ in seats]
+    start = 0
+    if button in numbers:
+        start = numbers.index(button)
+    order = [name for _, name in seats[start:] + seats[:start]]  # начиная с баттона
+    if len(order) == 2:
+        return {order[0]: 'SB', order[1]: 'BB'}
+    positions = {order[0]: 'BTN', order[1]: 'SB', order[2]: 'BB'}
+    rest = order[3:]
+    for name, position in zip(rest, LATE_POSITIONS[len(LATE_POSITIONS) - len(rest):]):
+        positions[name] = position
+    return positions
+
+
+def _hand_time(header: str) -> datetime:
+    """Начало раздачи в UTC (naive, как остальные DateTime в БД).
+
+    PokerStars пишет локальное время и время сервера:
+    "2024/01/01 12:00:00 CET [2024/01/01 6:00:00 ET]" - берется последняя
+    дата с известной меткой пояса. Время без метки (GGPoker) - уже UTC.
+    """
+    dates = _DATE.findall(header)
+    if not dates:
+        return datetime.utcnow()
+    for text, tag in reversed(dates):
+        if tag in TIMEZONES:
+            local = datetime(*map(int, _DATE_FIELDS.split(text)), tzinfo=ZoneInfo(TIMEZONES[tag]))
+            return local.astimezone(timezone.utc).replace(tzinfo=None)
+    return datetime(*map(int, _DATE_FIELDS.split(dates[-1][0])))
+
+
+def parse_hand(lines: List[str], telegram_id: int) -> Dict[str, Any]:
+    """Раздача в формате build_hand_record"""
+    header = lines[0]
+    stakes = _STAKES.findall(header)
+    if not stakes:
+        raise HandParseError(f"нет блайндов в заголовке: {header[:80]}")
+    big_blind = _number(stakes[-1][1])
+    if big_blind <= 0:
+        raise HandParseError("нулевой big blind")
+    scale = CHIPS_PER_BB / big_blind
+    hand_id = _HAND_ID.search(header)
+
+    table, button = '', None
+    seats: List[Tuple[int, str]] = []
+    hero = None
+    hole_cards: Dict[str, List[str]] = {}
+    board: List[str] = []
+    actions: List[Dict[str, Any]] = []
+    invested: Dict[str, int] = {}
+    street_put: Dict[str, int] = {}
+    collected: Dict[str, int] = {}
+    descriptions: Dict[str, str] = {}
+    street = 'preflop'
+    showdown = False
+
+    for line in lines[1:]:
+        if line.startswith('*** SUMMARY'):
+            break
+        if line.startswith('*** '):
+            match = _BOARD.match(line)
+            if match:
+                street = STREET_NAMES[match.group(1)]
+                street_put = {}
+                board = _cards(' '.join(re.findall(r'\[([^\]]+)\]', match.group(2))))
+            elif line.startswith('*** SHOW'):
+                showdown = True
+            continue
+        if line.startswith('Table '):
+            match = _TABLE.match(line)
+            if match:
+                table = match.group(1)
+                button = int(match.group(2)) if match.group(2) else None
+            continue
+        if line.startswith('Seat '):
+            match = _SEAT.match(line)
+            if match and 'sitting out' not in line:
+                seats.append((int(match.group(1)), match.group(2)))
+            continue
+        match = _ACTION.match(line)
+        if match:
+            player, verb, amount, total, tail = match.groups()
+            chips = round(_number(amount) * scale) if amount else 0
+            if verb == 'raises' and total:
+                # "raises X to Y": в банк добавляется Y минус уже поставленное на улице
+                chips = round(_number(total) * scale) - street_put.get(player, 0)
+            if 'ante' in verb:
+                invested[player] = invested.get(player, 0) + chips
+                continue
+            action = {
+                'posts small blind': 'small_blind',
+                'posts big blind': 'big_blind',
+                'posts small & big blinds': 'big_blind',
+                'folds': 'fold',
+                'checks': 'check',
+                'calls': 'call',
+                'bets': 'raise',
+                'raises': 'raise',
+            }[verb]
+            if action == 'raise' and 'all-in' in tail:
+                action = 'all_in'
+            invested[player] = invested.get(player, 0) + chips
+            street_put[player] = street_put.get(player, 0) + chips
+            actions.append({'street': street, 'player': player, 'action': action, 'amount': chips})
+            continue
+        match = _DEALT.match(line)
+        if match:
+            hero = match.group(1)
+            hole_cards[hero] = _cards(match.group(2))
+            continue
+        match = _RETURNED.match(line)
+        if match:
+            player = match.group(2)
+            invested[player] = invested.get(player, 0) - round(_number(match.group(1)) * scale)
+            continue
+        match = _COLLECTED.match(line)
+        if match:
+            player = match.group(1)
+            collected[player] = collected.get(player, 0) + round(_number(match.group(2)) * scale)
+            continue
+        match = _SHOWS.match(line)
+        if match:
+            hole_cards[match.group(1)] = _cards(match.group(2))
+            if match.group(3):
+                descriptions[match.group(1)] = match.group(3).lower()
+
+    if hero is None:
+        raise HandParseError(f"нет строки Dealt to: {header[:80]}")
+
+    user = f"user_{telegram_id}"
+    rename = lambda name: user if name == hero else name
+    players = [name for _, name in seats] or list(invested)
+    winners = [rename(name) for name in collected]
+    winning_hand = None
+    for name in collected:
+        description = descriptions.get(name, '')
+        winning_hand = next((hand_type for text, hand_type in HAND_DESCRIPTIONS if text in description), None)
+        if winning_hand:
+            break
+
+    return {
+        'telegram_id': telegram_id,
+        'ai_type': IMPORT_AI_TYPE,
+        'source_id': hand_id.group(1) if hand_id else None,
+        'table': table,
+        'game_type': GameType.TOURNAMENT if 'Tournament' in header else GameType.CASH,
+        'stakes': f"{stakes[-1][0]}/{stakes[-1][1]}",
+        'positions': {rename(name): position for name, position in _positions(seats, button).items()},
+        'hole_cards': {rename(name): cards for name, cards in hole_cards.items()},
+        'community_cards': board,
+        'actions': [dict(event, player=rename(event['player'])) for event in actions],
+        'result': {
+            'winners': winners,
+            'pot': sum(collected.values()),
+            'showdown': showdown,
+            'winning_hand': winning_hand,
+            'net': {rename(name): collected.get(name, 0) - invested.get(name, 0)
+                    for name in dict.fromkeys(players + list(invested))},
+        },
+        'created_at': _hand_time(header),
+    }
+
+
+def iter_hand_texts(path: str, start: int = 0, end: Optional[int] = None) -> Iterator[List[str]]:
+    """Тексты раздач (списки строк), начинающихся в байтовом диапазоне [start, end)"""
+    with open(path, 'rb') as f:
+        if start:
+            # Дочитать строку, начатую в предыдущем диапазоне (с байта перед start,
+            # чтобы не потерять строку, начинающуюся ровно на границе)
+            f.seek(start - 1)
+            f.readline()
+        position = f.tell()
+        lines: List[str] = []
+        for raw in f:
+            if HAND_START.match(raw):
+                if lines:
+                    yield lines
+                if end is not None and position >= end:
+                    return
+                lines = []
+            position += len(raw)
+            if lines or HAND_START.match(raw):
+                line = raw.decode('utf-8', errors='replace').strip()
+                if line:
+                    lines.append(line)
+        if lines:
+            yield lines
+
+
+def file_chunks(path: str, chunk_bytes: int = CHUNK_BYTES) -> Iterator[Tuple[str, int, int]]:
+    """Байтовые диапазоны файла; граница раздачи находится при чтении"""
+    size = os.path.getsize(path)
+    for start in range(0, max(size, 1), chunk_bytes):
+        yield path, start, min(start + chunk_bytes, size)
+
+
+def parse_chunk(path: str, start: int, end: int, telegram_id: int) -> Tuple[List[Dict[str, Any]], int]:
+    """Разобрать и проанализировать диапазон файла (в процессе пула): (раздачи, число ошибок)"""
+    from app.stats_aggregator import analyze_hand
+
+    hands, errors = [], 0
+    for lines in iter_hand_texts(path, start, end):
+        try:
+            hand = parse_hand(lines, telegram_id)
+            hand['analysis'] = analyze_hand(hand)
+            hands.append(hand)
+        except (HandParseError, ValueError, KeyError, IndexError) as e:
+            errors += 1
+            logger.debug(f"Раздача пропущена: {e}")
+    return hands, errors
+
+
+def _parse_chunks(chunks: Iterable[Tuple[str, int, int]], telegram_id: int,
+                  workers: int) -> Iterator[Tuple[List[Dict[str, Any]], int]]:
+    """Результаты по диапазонам в исходном порядке; в работе не больше 2*workers диапазонов"""
+    if workers <= 1:
+        for path, start, end in chunks:
+            yield parse_chunk(path, start, end, telegram_id)
+        return
+
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers) as pool:
+        pending = deque()
+        for path, start, end in chunks:
+            pending.append(pool.apply_async(parse_chunk, (path, start, end, telegram_id)))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def _session_key(hand: Dict[str, Any]) -> Tuple[str, str]:
+    return hand['table'], hand['stakes']
+
+
+def _new_hands(session, user_id: int, hands: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Раздачи, которых еще нет у пользователя (по source_id), без повторов внутри пачки"""
+    source_ids = list({hand['source_id'] for hand in hands if hand['source_id'] is not None})
+    seen = set()
+    for offset in range(0, len(source_ids), SOURCE_ID_CHUNK):
+        seen.update(source_id for source_id, in session.query(ImportedHand.source_id)
+                    .filter(ImportedHand.user_id == user_id,
+                            ImportedHand.source_id.in_(source_ids[offset:offset + SOURCE_ID_CHUNK])))
+    new_hands = []
+    for hand in hands:
+        source_id = hand['source_id']
+        if source_id is not None:
+            if source_id in seen:
+                continue
+            seen.add(source_id)
+        new_hands.append(hand)
+    return new_hands
+
+
+def save_imported_hands(database, user_id: int, hands: List[Dict[str, Any]]) -> int:
+    """Записать пачку раздач одной транзакцией (Core executemany).
+
+    Раздачи, уже импортированные пользователем (тот же source_id),
+    пропускаются; возвращается число записанных.
+    """
+    from app.database import SESSION_GAP
+    from app.stats_aggregator import StatsAggregator
+    from app.rollups import DailyRollup
+    from app.hand_index import HandIndexer
+
+    aggregator = StatsAggregator()
+    rollup = DailyRollup()
+    indexer = HandIndexer()
+    with database.session_scope() as session:
+        hands = sorted(_new_hands(session, user_id, hands),
+                       key=lambda hand: (_session_key(hand), hand['created_at']))
+        rows = []
+        game_session = None
+        for hand in hands:
+            if game_session is None or game_session['key'] != _session_key(hand) \
+                    or hand['created_at'] - game_session['completed_at'] > SESSION_GAP:
+                if game_session is not None:
+                    _close_session(session, game_session)
+                game_session = {
+                    'key': _session_key(hand),
+                    'id': session.execute(insert(GameSession).values(
+                        user_id=user_id,
+                        game_type=hand['game_type'],
+                        stake_level=hand['stakes'],
+                        ai_opponent_type=IMPORT_AI_TYPE,
+                        status=SessionStatus.COMPLETED,
+                        created_at=hand['created_at'],
+                    )).inserted_primary_key[0],
+                    'created_at': hand['created_at'],
+                    'completed_at': hand['created_at'],
+                    'hands': 0,
+                    'net': 0,
+                }
+                rollup.add_session(user_id, hand['created_at'].date())
+                new_session = True
+            else:
+                rollup.add_session_time(
+                    user_id, game_session['created_at'].date(),
+                    int((hand['created_at'] - game_session['created_at']).total_seconds())
+                    - int((game_session['completed_at'] - game_session['created_at']).total_seconds()))
+                new_session = False
+
+            net = hand['result']['net'].get(f"user_{hand['telegram_id']}", 0)
+            game_session['hands'] += 1
+            game_session['net'] += net
+            game_session['completed_at'] = hand['created_at']
+            aggregator.add_hand(user_id, hand, new_session, hand['analysis'])
+            rollup.add_hand(user_id, hand['created_at'].date(), hand['ai_type'], net)
+            rows.append({
+                'session_id': game_session['id'],
+                'hand_number': game_session['hands'],
+                'positions': hand['positions'],
+                'hole_cards': hand['hole_cards'],
+                'community_cards': hand['community_cards'],
+                'actions': hand['actions'],
+                'result': hand['result'],
+                'analysis': hand['analysis'],
+                'created_at': hand['created_at'],
+            })
+        if game_session is not None:
+            _close_session(session, game_session)
+        if rows:
+            # id в порядке строк - для битового индекса
+            hand_ids = session.scalars(insert(HandHistory).returning(HandHistory.id, sort_by_parameter_order=True),
+                                       rows).all()
+            for hand_id, hand in zip(hand_ids, hands):
+                indexer.add_hand(user_id, hand_id, hand)
+            imported = [{'user_id': user_id, 'source_id': hand['source_id'], 'hand_id': hand_id}
+                        for hand_id, hand in zip(hand_ids, hands) if hand['source_id'] is not None]
+            if imported:
+                session.execute(insert(ImportedHand), imported)
+        aggregator.apply(session)
+        rollup.apply(session)
+        indexer.apply(session)
+    return len(rows)
+
+
+def _close_session(session, game_session: Dict[str, Any]):
+    session.query(GameSession).filter(GameSession.id == game_session['id']).update({
+        GameSession.hands_played: game_session['hands'],
+        GameSession.net_profit: game_session['net'],
+        GameSession.completed_at: game_session['completed_at'],
+    }, synchronize_session=False)
+
+
+def import_files(database, paths: Iterable[str], telegram_id: int, workers: int = 1,
+                 batch_hands: int = BATCH_HANDS, chunk_bytes: int = CHUNK_BYTES) -> Dict[str, int]:
+    """Импортировать файлы историй раздач пользователя telegram_id"""
+    with database.session_scope() as session:
+        user_id = session.query(User.id).filter(User.telegram_id == telegram_id).scalar()
+    if user_id is None:
+        raise ValueError(f"Пользователь {telegram_id} не зарегистрирован")
+
+    totals = {'hands': 0, 'errors': 0, 'duplicates': 0}
+    chunks = (chunk for path in paths for chunk in file_chunks(path, chunk_bytes))
+    batch: List[Dict[str, Any]] = []
+    for hands, errors in _parse_chunks(chunks, telegram_id, workers):
+        batch.extend(hands)
+        totals['errors'] += errors
+        if len(batch) >= batch_hands:
+            saved = save_imported_hands(database, user_id, batch)
+            totals['hands'] += saved
+            totals['duplicates'] += len(batch) - saved
+            batch = []
+    if batch:
+        saved = save_imported_hands(database, user_id, batch)
+        totals['hands'] += saved
+        totals['duplicates'] += len(batch) - saved
+
+    database.user_cache.invalidate(telegram_id)
+    logger.info(f"Импорт раздач пользователя {telegram_id}: {totals}")
+    return totals
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    from app.database import db
+
+    parser = argparse.ArgumentParser(description="Импорт историй раздач")
+    parser.add_argument('--user', type=int, required=True, help="telegram_id владельца раздач")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--batch', type=int, default=BATCH_HANDS, help="раздач в одной транзакции")
+    parser.add_argument('files', nargs='+')
+    args = parser.parse_args(argv)
+
+    db.init_db()
+    db.add_user(telegram_id=args.user, username=None, first_name=None, last_name=None)
+    started = datetime.now()
+    totals = import_files(db, args.files, args.user, workers=args.workers, batch_hands=args.batch)
+    seconds = (datetime.now() - started).total_seconds()
+    print(f"✅ Импортировано раздач: {totals['hands']}, пропущено: {totals['errors']}, "
+          f"уже были импортированы: {totals['duplicates']} "
+          f"за {seconds:.1f} с ({totals['hands'] / max(seconds, 1e-9):.0f} раздач/с)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,44 +1,235 @@
+import json
 import logging
 from datetime import datetime, timedelta
+from sqlalchemy import func, tuple_
 from app.database import db
-import json
+from app.models import User, GameSession, HandHistory
+from app.hand_archive import hand_archive, month_key
+from app.poker_engine import format_bb
 
 logger = logging.getLogger(__name__)
 
+OPPONENT_NAMES = {'fish': 'Fish AI', 'nit': 'Nit AI', 'tag': 'TAG AI', 'lag': 'LAG AI', 'equity': 'Equity AI'}
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Курсор страницы для callback_data: микросекунды от эпохи (UTC) и id"""
+    return f"{(created_at - _EPOCH) // _MICROSECOND}.{row_id}"
+
+
+def decode_cursor(cursor: str):
+    micros, row_id = cursor.split('.')
+    return _EPOCH + timedelta(microseconds=int(micros)), int(row_id)
+
+
 class HistoryManager:
+    """История сессий и раздач с keyset-пагинацией.
+
+    Страница сессий - это WHERE (created_at, id) < курсор по индексу
+    (user_id, created_at, id), без OFFSET: любая страница стоит столько
+    же, сколько первая. Списки читают только отображаемые колонки,
+    JSON раздачи целиком загружается лишь при открытии одной раздачи.
+    """
+
     def __init__(self):
         self.db = db
-    
+
+    def _user_id(self, session, telegram_id: int):
+        return session.query(User.id).filter(User.telegram_id == telegram_id).scalar()
+
+    def get_sessions_page(self, telegram_id: int, limit: int = 10, cursor: str = None):
+        """Страница сессий (новые первыми) и курсор следующей страницы или None"""
+        try:
+            with self.db.session_scope() as session:
+                user_id = self._user_id(session, telegram_id)
+                if user_id is None:
+                    return [], None
+                query = session.query(GameSession.id, GameSession.created_at, GameSession.completed_at,
+                                      GameSession.ai_opponent_type, GameSession.hands_played,
+                                      GameSession.net_profit)\
+                    .filter(GameSession.user_id == user_id)
+                if cursor:
+                    query = query.filter(tuple_(GameSession.created_at, GameSession.id) < tuple_(*decode_cursor(cursor)))
+                rows = query.order_by(GameSession.created_at.desc(), GameSession.id.desc())\
+                    .limit(limit + 1).all()
+
+            sessions = [self._session_to_dict(row) for row in rows[:limit]]
+            next_cursor = encode_cursor(rows[limit - 1].created_at, rows[limit - 1].id) \
+                if len(rows) > limit else None
+            return sessions, next_cursor
+        except Exception as e:
+            logger.error(f"Error getting sessions: {e}")
+            return [], None
+
     def get_recent_sessions(self, telegram_id: int, limit: int = 10):
         """Получить последние сессии пользователя"""
+        sessions, _ = self.get_sessions_page(telegram_id, limit)
+        return sessions
+
+    @staticmethod
+    def _session_to_dict(row) -> dict:
+        minutes = 0
+        if row.completed_at and row.created_at:
+            minutes = round((row.completed_at - row.created_at).total_seconds() / 60)
+        return {
+            'id': row.id,
+            'date': row.created_at.strftime('%Y-%m-%d %H:%M') if row.created_at else '',
+            'opponent': OPPONENT_NAMES.get(row.ai_opponent_type, row.ai_opponent_type),
+            'hands_played': row.hands_played or 0,
+            'result': format_bb(row.net_profit or 0, signed=True),
+            'duration': f"{minutes} мин"
+        }
+
+    def get_session_hands(self, session_id: int, telegram_id: int = None, limit: int = 10,
+                          after_hand: int = 0):
+        """Страница раздач сессии по hand_number (индекс session_id, hand_number).
+
+        Карты и результат пользователя извлекаются из JSON средствами БД
+        (json_extract), сами колонки в Python не разбираются. Раздачи
+        сессий из прошлых месяцев дочитываются из архива.
+        """
         try:
-            # Здесь будет реальная логика из БД
-            # Пока заглушка с демо-данными
-            return [
-                {
-                    'id': i,
-                    'date': (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d %H:%M'),
-                    'opponent': ['Fish AI', 'Nit AI', 'TAG AI', 'LAG AI'][i % 4],
-                    'hands_played': 10 + i * 5,
-                    'result': f"{['+', '-'][i % 2]}{i * 5 + 15} BB",
-                    'duration': f"{15 + i * 5} мин"
-                }
-                for i in range(1, limit + 1)
-            ]
+            with self.db.session_scope() as session:
+                owner = session.query(GameSession.user_id, User.telegram_id,
+                                      GameSession.created_at, GameSession.completed_at)\
+                    .join(User, User.id == GameSession.user_id)\
+                    .filter(GameSession.id == session_id).first()
+                if owner is None or (telegram_id is not None and owner.telegram_id != telegram_id):
+                    return [], None
+                player = f'"user_{owner.telegram_id}"'
+                rows = session.query(
+                    HandHistory.id, HandHistory.hand_number,
+                    func.json_extract(HandHistory.hole_cards, f'$.{player}').label('cards'),
+                    func.json_extract(HandHistory.result, f'$.net.{player}').label('net'),
+                    func.json_extract(HandHistory.analysis, '$.rating').label('rating')
+                ).filter(HandHistory.session_id == session_id, HandHistory.hand_number > after_hand)\
+                    .order_by(HandHistory.hand_number).limit(limit + 1).all()
+
+            hands = [{
+                'hand_id': row.id,
+                'hand_number': row.hand_number,
+                'cards': self._format_cards(row.cards),
+                'result': self._format_result(row.net or 0),
+                'analysis_rating': row.rating
+            } for row in rows]
+            months = hand_archive.months()
+            if months and owner.created_at and month_key(owner.created_at) <= months[-1]:
+                hands += [self._archived_to_dict(hand, owner.telegram_id) for hand in hand_archive.session_hands(
+                    session_id, owner.user_id, owner.created_at, owner.completed_at)
+                    if hand['hand_number'] > after_hand]
+                hands.sort(key=lambda hand: hand['hand_number'])
+            next_hand = hands[limit - 1]['hand_number'] if len(hands) > limit else None
+            return hands[:limit], next_hand
         except Exception as e:
-            logger.error(f"Error getting sessions: {e}")
+            logger.error(f"Error getting session hands: {e}")
+            return [], None
+
+    def get_hands(self, hand_ids: list, telegram_id: int):
+        """Краткие строки раздач по id (результаты поиска), в порядке hand_ids"""
+        if not hand_ids:
+            return []
+        try:
+            player = f'"user_{telegram_id}"'
+            with self.db.session_scope() as session:
+                rows = session.query(
+                    HandHistory.id, HandHistory.hand_number,
+                    func.json_extract(HandHistory.hole_cards, f'$.{player}').label('cards'),
+                    func.json_extract(HandHistory.result, f'$.net.{player}').label('net'),
+                    func.json_extract(HandHistory.analysis, '$.rating').label('rating')
+                ).join(GameSession, GameSession.id == HandHistory.session_id)\
+                    .join(User, User.id == GameSession.user_id)\
+                    .filter(HandHistory.id.in_(hand_ids), User.telegram_id == telegram_id).all()
+
+            by_id = {row.id: {
+                'hand_id': row.id,
+                'hand_number': row.hand_number,
+                'cards': self._format_cards(row.cards),
+                'result': self._format_result(row.net or 0),
+                'analysis_rating': row.rating
+            } for row in rows}
+            missing = [hand_id for hand_id in hand_ids if hand_id not in by_id]
+            if missing:
+                by_id.update({hand_id: self._archived_to_dict(hand, telegram_id)
+                              for hand_id, hand in hand_archive.get_hands(missing).items()
+                              if hand['telegram_id'] == telegram_id})
+            return [by_id[hand_id] for hand_id in hand_ids if hand_id in by_id]
+        except Exception as e:
+            logger.error(f"Error getting hands: {e}")
             return []
-    
-    def get_session_hands(self, session_id: int):
-        """Получить раздачи сессии"""
-        return [
-            {
-                'hand_id': f"{session_id}_{i}",
-                'cards': ['A♠ K♥', 'Q♦ Q♣', 'J♠ T♠'][i % 3],
-                'result': ['Win +15BB', 'Loss -2BB', 'Win +8BB'][i % 3],
-                'analysis_rating': [8, 4, 7][i % 3]
-            }
-            for i in range(5)
-        ]
-
-history_manager = HistoryManager()
\ No newline at end of file
+
+    def _archived_to_dict(self, hand: dict, telegram_id: int) -> dict:
+        """Строка списка раздач из раздачи архива"""
+        player = f"user_{telegram_id}"
+        return {
+            'hand_id': hand['id'],
+            'hand_number': hand['hand_number'],
+            'cards': self._format_cards(hand['hole_cards'].get(player)),
+            'result': self._format_result(hand['result']['net'].get(player, 0)),
+            'analysis_rating': (hand['analysis'] or {}).get('rating')
+        }
+
+    @staticmethod
+    def _format_result(net: int) -> str:
+        if net == 0:
+            return "Push 0 BB"
+        return f"{'Win' if net > 0 else 'Loss'} {format_bb(net, signed=True)}"
+
+    @staticmethod
+    def _format_cards(cards) -> str:
+        # json_extract возвращает массив текстом: ["A♠","K♥"]
+        if not cards:
+            return '??'
+        return ' '.join(json.loads(cards)) if isinstance(cards, str) else ' '.join(cards)
+
+    def get_hand(self, hand_id: int, telegram_id: int = None):
+        """Одна раздача целиком (все JSON-колонки)"""
+        try:
+            with self.db.session_scope() as session:
+                row = session.query(HandHistory, User.telegram_id)\
+                    .join(GameSession, GameSession.id == HandHistory.session_id)\
+                    .join(User, User.id == GameSession.user_id)\
+                    .filter(HandHistory.id == hand_id).first()
+                if row is None:
+                    return self._get_archived_hand(hand_id, telegram_id)
+                hand, owner = row
+                if telegram_id is not None and owner != telegram_id:
+                    return None
+                return {
+                    'hand_id': hand.id,
+                    'session_id': hand.session_id,
+                    'hand_number': hand.hand_number,
+                    'player': f"user_{owner}",
+                    'positions': hand.positions,
+                    'hole_cards': hand.hole_cards,
+                    'community_cards': hand.community_cards,
+                    'actions': hand.actions,
+                    'result': hand.result,
+                    'analysis': hand.analysis,
+                    'created_at': hand.created_at
+                }
+        except Exception as e:
+            logger.error(f"Error getting hand: {e}")
+            return None
+
+    def _get_archived_hand(self, hand_id: int, telegram_id: int = None):
+        hand = hand_archive.get_hand(hand_id)
+        if hand is None or (telegram_id is not None and hand['telegram_id'] != telegram_id):
+            return None
+        return {
+            'hand_id': hand['id'],
+            'session_id': hand['session_id'],
+            'hand_number': hand['hand_number'],
+            'player': f"user_{hand['telegram_id']}",
+            'positions': hand['positions'],
+            'hole_cards': hand['hole_cards'],
+            'community_cards': hand['community_cards'],
+            'actions': hand['actions'],
+            'result': hand['result'],
+            'analysis': hand['analysis'],
+            'created_at': hand['created_at']
+        }
+
+history_manager = HistoryManager()
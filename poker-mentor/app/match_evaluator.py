@@ -0,0 +1,299 @@
+"""
+Дубликатные матчи для оценки силы ботов.
+
+Каждая пара раздач играется на одной и той же колоде с пересадкой
+игроков, случайность самих ботов тоже фиксируется сидом. К результату
+применяется поправка all-in EV и контрольная переменная "удачи по
+улицам": (эквити после карты - эквити до карты) x банк. Обе поправки
+имеют нулевое среднее, поэтому не смещают оценку, но сильно снижают
+дисперсию. Пары раздач играются параллельно в процессах.
+
+    python -m app.match_evaluator tag fish
+    python -m app.match_evaluator --ml tag [--model model.pt] [--threshold 0]
+"""
+
+import math
+import random
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import combinations
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+from app.ai_opponents import AIFactory, BaseAI
+from app.equity import int_to_card
+from app.ml.vector_env import evaluate_batch
+from app.poker_engine import Action, PokerGame
+
+logger = logging.getLogger(__name__)
+
+SEATS = ("seat_0", "seat_1")
+MAX_RAISES_PER_STREET = 4
+
+
+def showdown_equity(hole0: List[int], hole1: List[int], board: List[int],
+                    rng: np.random.Generator, samples: int = 2000) -> float:
+    """Эквити места 0: точный перебор до двух карт борда, иначе Монте-Карло"""
+    dead = set(hole0) | set(hole1) | set(board)
+    stub = np.array([card for card in range(52) if card not in dead])
+    missing = 5 - len(board)
+    if missing == 0:
+        runouts = np.zeros((1, 0), dtype=np.int64)
+    elif missing <= 2:
+        runouts = np.array(list(combinations(stub, missing)))
+    else:
+        runouts = np.argsort(rng.random((samples, len(stub))), axis=1)[:, :missing]
+        runouts = stub[runouts]
+    boards = np.hstack([np.tile(board, (len(runouts), 1)), runouts]).astype(np.int64)
+    value0 = evaluate_batch(np.hstack([np.tile(hole0, (len(boards), 1)), boards]))
+    value1 = evaluate_batch(np.hstack([np.tile(hole1, (len(boards), 1)), boards]))
+    return float(np.mean(np.where(value0 > value1, 1.0, np.where(value0 == value1, 0.5, 0.0))))
+
+
+def play_hand(bots: Tuple[BaseAI, BaseAI], deck: List[int], bot_seed: int,
+              rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    """Сыграть одну раздачу между двумя ботами на заданной колоде.
+
+    Раскладка колоды как в PokerGame (карманные, сжечь, флоп, ...), место 0
+    ставит SB и ходит первым на каждой улице, как пользователь в
+    GameManager. Возвращает net, all-in EV net и удачу по улицам (фишки).
+    """
+    random.seed(bot_seed)
+    game = PokerGame(list(SEATS))
+    game.player_cards = {SEATS[0]: [int_to_card(c) for c in deck[0:2]],
+                         SEATS[1]: [int_to_card(c) for c in deck[2:4]]}
+    board = [deck[5], deck[6], deck[7], deck[9], deck[11]]
+    start_stack = game.player_stacks[SEATS[0]]
+
+    committed_total = [game.small_blind, game.big_blind]
+    game.player_stacks[SEATS[0]] -= game.small_blind
+    game.player_stacks[SEATS[1]] -= game.big_blind
+    game.pot = game.small_blind + game.big_blind
+
+    luck = 0.0
+    ev_override = None
+    equity = None
+    folded = None
+    visible = 0
+
+    for street_cards in (0, 3, 4, 5):
+        if street_cards:
+            # Удача по улице: изменение эквити от новой карты, умноженное на банк
+            if equity is None:
+                equity = showdown_equity(deck[0:2], deck[2:4], board[:visible], rng)
+            visible = street_cards
+            new_equity = showdown_equity(deck[0:2], deck[2:4], board[:visible], rng)
+            luck += (new_equity - equity) * game.pot
+            equity = new_equity
+            game.community_cards = [int_to_card(c) for c in board[:visible]]
+
+        committed = [0, 0] if street_cards else [game.small_blind, game.big_blind]
+        folded = _betting_round(game, bots, committed, committed_total)
+        if folded is not None:
+            break
+
+        if any(game.player_stacks[seat] == 0 for seat in SEATS) and visible < 5:
+            # All-in до ривера: результат заменяется на ожидание по эквити
+            equity = showdown_equity(deck[0:2], deck[2:4], board[:visible], rng)
+            ev_override = equity * game.pot - committed_total[0]
+            visible = 5
+            break
+
+    stacks = [game.player_stacks[seat] for seat in SEATS]
+    if folded is not None:
+        stacks[1 - folded] += game.pot
+    else:
+        hole = [deck[0:2], deck[2:4]]
+        values = [evaluate_batch(np.array([hole[seat] + board], dtype=np.int64))[0] for seat in (0, 1)]
+        share0 = game.pot if values[0] > values[1] else 0 if values[0] < values[1] else game.pot - game.pot // 2
+        stacks[0] += share0
+        stacks[1] += game.pot - share0
+
+    net0 = stacks[0] - start_stack
+    ev_net0 = ev_override if ev_override is not None else net0
+    return {'net': np.array([net0, -net0], dtype=float),
+            'ev_net': np.array([ev_net0, -ev_net0], dtype=float),
+            'luck': np.array([luck, -luck], dtype=float)}
+
+
+def _betting_round(game: PokerGame, bots: Tuple[BaseAI, BaseAI],
+                   committed: List[int], committed_total: List[int]) -> Optional[int]:
+    """Круг торговли. Возвращает место сбросившего игрока или None"""
+    seat = 0
+    acted = [False, False]
+    raises = 0
+    while True:
+        player = SEATS[seat]
+        to_call = committed[1 - seat] - committed[seat]
+        stack = game.player_stacks[player]
+        if stack == 0 or (game.player_stacks[SEATS[1 - seat]] == 0 and to_call == 0):
+            acted[seat] = True
+        else:
+            # Боты ожидают в current_bet сумму для колла (как в GameManager)
+            game.current_bet = to_call
+            action, amount = bots[seat].decide_action(game, player)
+
+            if action == Action.FOLD and to_call > 0:
+                return seat
+            if action in (Action.RAISE, Action.ALL_IN) and raises < MAX_RAISES_PER_STREET \
+                    and stack > to_call and game.player_stacks[SEATS[1 - seat]] > 0:
+                put_in = stack if action == Action.ALL_IN else max(amount, to_call + game.big_blind)
+                raises += 1
+                acted[1 - seat] = False
+            else:
+                put_in = to_call
+            put_in = min(put_in, stack)
+
+            game.player_stacks[player] -= put_in
+            game.pot += put_in
+            committed[seat] += put_in
+            committed_total[seat] += put_in
+            acted[seat] = True
+
+        all_in = any(game.player_stacks[s] == 0 for s in SEATS)
+        if all(acted) and (committed[0] == committed[1] or all_in):
+            return None
+        seat = 1 - seat
+
+
+def create_ml_ai(base_type: str, model_path: Optional[str] = None, seed: int = 0,
+                 confidence_threshold: Optional[float] = None) -> BaseAI:
+    """MLEnhancedAI поверх бота base_type (фабрика для evaluate_match).
+
+    Модель PokerPredictor загружается из model_path (state_dict torch),
+    без пути - инициализируется сидом, одинаково во всех процессах.
+    """
+    import torch
+    from app.ai_opponents import MLEnhancedAI
+    from app.ml.poker_model import create_poker_model
+
+    # Процессы матча и так параллельны, потоки torch только мешают друг другу
+    torch.set_num_threads(1)
+    torch.manual_seed(seed)
+    model = create_poker_model()
+    if model_path:
+        model.load_state_dict(torch.load(model_path, map_location='cpu'))
+    model.eval()
+    bot = MLEnhancedAI(AIFactory.create_ai(base_type), model)
+    if confidence_threshold is not None:
+        bot.confidence_threshold = confidence_threshold
+    return bot
+
+
+def _play_pairs(args) -> np.ndarray:
+    """Задача для процесса: пары дубликатных раздач, строки (net, ev_net, luck) для игрока A"""
+    factory_a, factory_b, seed, num_pairs = args
+    rng = np.random.default_rng(seed)
+    bot_a, bot_b = factory_a(), factory_b()
+    rows = np.zeros((num_pairs, 2, 3))
+    for pair in range(num_pairs):
+        deck = [int(card) for card in rng.permutation(52)]
+        bot_seed = int(rng.integers(2 ** 31))
+        # Те же карты и та же случайность ботов, места поменяны
+        first = play_hand((bot_a, bot_b), deck, bot_seed, rng)
+        second = play_hand((bot_b, bot_a), deck, bot_seed, rng)
+        rows[pair, 0] = first['net'][0], first['ev_net'][0], first['luck'][0]
+        rows[pair, 1] = second['net'][1], second['ev_net'][1], second['luck'][1]
+    return rows
+
+
+def _bb_per_100(samples: np.ndarray, hands_per_sample: int, big_blind: int) -> Dict[str, float]:
+    """Среднее и 95% доверительный интервал в bb/100"""
+    scale = 100.0 / hands_per_sample / big_blind
+    mean = float(np.mean(samples)) * scale
+    stderr = float(np.std(samples, ddof=1) / math.sqrt(len(samples))) * scale if len(samples) > 1 else float('inf')
+    return {'bb_per_100': mean, 'ci95': 1.96 * stderr, 'stderr': stderr}
+
+
+def evaluate_match(factory_a: Callable[[], BaseAI], factory_b: Callable[[], BaseAI],
+                   num_pairs: int = 10000, workers: Optional[int] = None,
+                   chunk_pairs: int = 250, seed: int = 0, big_blind: int = 2) -> Dict[str, Dict[str, float]]:
+    """Результат A против B в bb/100 с доверительными интервалами.
+
+    factory_a / factory_b - функции без аргументов, создающие ботов
+    (должны сериализоваться для передачи в процессы, например
+    functools.partial(AIFactory.create_ai, "tag")).
+    """
+    chunks = [chunk_pairs] * (num_pairs // chunk_pairs)
+    if num_pairs % chunk_pairs:
+        chunks.append(num_pairs % chunk_pairs)
+    seeds = np.random.SeedSequence(seed).generate_state(len(chunks))
+    tasks = [(factory_a, factory_b, int(chunk_seed), size) for chunk_seed, size in zip(seeds, chunks)]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        rows = np.concatenate(list(executor.map(_play_pairs, tasks)))
+
+    net, ev_net, luck = rows[..., 0], rows[..., 1], rows[..., 2]
+    duplicate = ev_net.sum(axis=1)
+    duplicate_luck = luck.sum(axis=1)
+
+    # Коэффициент контрольной переменной: beta = cov(x, c) / var(c)
+    variance = np.var(duplicate_luck)
+    beta = float(np.cov(duplicate, duplicate_luck)[0, 1] / variance) if variance > 0 else 0.0
+    controlled = duplicate - beta * duplicate_luck
+
+    report = {
+        'naive': _bb_per_100(net.reshape(-1), 1, big_blind),
+        'duplicate': _bb_per_100(net.sum(axis=1), 2, big_blind),
+        'duplicate_allin_ev': _bb_per_100(duplicate, 2, big_blind),
+        'duplicate_allin_ev_cv': _bb_per_100(controlled, 2, big_blind),
+    }
+    report['duplicate_allin_ev_cv']['beta'] = beta
+    report['hands'] = {'count': 2 * len(rows)}
+    logger.info(f"Матч: {2 * len(rows)} раздач, "
+                f"{report['duplicate_allin_ev_cv']['bb_per_100']:+.2f} ± {report['duplicate_allin_ev_cv']['ci95']:.2f} bb/100")
+    return report
+
+
+def format_match_report(report: Dict[str, Dict[str, float]], name_a: str = "A", name_b: str = "B") -> str:
+    """Текстовый отчет с выигрышем в числе раздач относительно наивной оценки"""
+    naive_var = report['naive']['stderr'] ** 2
+    lines = [f"⚔️ {name_a} против {name_b}: {report['hands']['count']} раздач"]
+    titles = {
+        'naive': "Без поправок",
+        'duplicate': "Дубликат",
+        'duplicate_allin_ev': "Дубликат + all-in EV",
+        'duplicate_allin_ev_cv': "Дубликат + all-in EV + CV",
+    }
+    for key, title in titles.items():
+        data = report[key]
+        # Нулевая или неизвестная дисперсия (например, бот против самого себя) - выигрыш не определен
+        if 0 < data['stderr'] < math.inf and math.isfinite(naive_var):
+            speedup = f"в {naive_var / data['stderr'] ** 2:.1f}x меньше раздач"
+        else:
+            speedup = "n/a"
+        lines.append(f"• {title}: {data['bb_per_100']:+.2f} ± {data['ci95']:.2f} bb/100 ({speedup})")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Дубликатный матч ботов")
+    parser.add_argument('--ml', metavar='BASE', help="MLEnhancedAI поверх BASE против самого BASE")
+    parser.add_argument('--model', help="state_dict PokerPredictor для --ml")
+    parser.add_argument('--threshold', type=float, default=None,
+                        help="порог уверенности модели для --ml (0 - всегда решает модель)")
+    parser.add_argument('--pairs', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('bots', nargs='*', default=['tag', 'fish'], help="два типа AI (без --ml)")
+    args = parser.parse_args(argv)
+
+    if args.ml:
+        factory_a = partial(create_ml_ai, args.ml, args.model, confidence_threshold=args.threshold)
+        factory_b = partial(AIFactory.create_ai, args.ml)
+        names = (f"ML-{args.ml.upper()}", args.ml.upper())
+    else:
+        if len(args.bots) != 2:
+            parser.error("нужно два типа AI")
+        factory_a, factory_b = (partial(AIFactory.create_ai, bot) for bot in args.bots)
+        names = tuple(bot.upper() for bot in args.bots)
+    result = evaluate_match(factory_a, factory_b, num_pairs=args.pairs, workers=args.workers)
+    print(format_match_report(result, *names))
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -5,12 +5,15 @@ ML модуль для Poker Mentor
 from .data_pipeline import DataPipeline
 from .poker_model import PokerPredictor
 from .model_trainer import ModelTrainer
+from .vector_env import VectorPokerEnv, collect_self_play
 # from .inference_engine import InferenceEngine
 
 __all__ = [
     'DataPipeline', 
     'PokerPredictor', 
     'ModelTrainer',
+    'VectorPokerEnv',
+    'collect_self_play',
     'model_trainer',
     'create_poker_model'
 ]
\ No newline at end of file
@@ -1,65 +1,202 @@
 import logging
 import json
+import atexit
+import threading
+import time
+from collections import deque
 from datetime import datetime
-from typing import List, Dict, Any
-import sqlite3
+from typing import List, Dict, Any, Optional
+from app.database import db
 
 logger = logging.getLogger(__name__)
 
 class DataPipeline:
     """Пайплайн для сбора и обработки данных ML"""
     
-    def __init__(self, db_path: str = "poker_mentor.db"):
-        self.db_path = db_path
+    # Кодировки фич, общие для живых игр и self-play окружения
+    FEATURE_DIM = 47
+    POSITION_MAP = {'early': 0.0, 'middle': 0.5, 'late': 1.0, 'blinds': 0.25}
+    STREET_MAP = {'preflop': 0.0, 'flop': 0.33, 'turn': 0.66, 'river': 1.0}
+    ACTION_MAP = {'fold': 0, 'check': 1, 'call': 2, 'raise': 3}
+    
+    def __init__(self, database=None, buffer_size: int = 100000,
+                 batch_size: int = 256, flush_interval: float = 1.0, max_retries: int = 5):
+        # Соединения берутся из общего пула Database (WAL и PRAGMA уже настроены)
+        self.database = database or db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        # Кольцевой буфер решений: при переполнении теряются самые старые
+        self._buffer = deque(maxlen=buffer_size)
+        self._wakeup = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self._stopping = False
+        # Пачка, которую не удалось записать: повторяется до max_retries раз
+        self._retry_rows: List[tuple] = []
+        self._retry_attempts = 0
+        self.dropped = 0
+        self.failed = 0
+        self.written = 0
         self._init_database()
     
     def _init_database(self):
         """Инициализация таблицы ML данных"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ml_training_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                features TEXT NOT NULL,
-                action INTEGER NOT NULL,
-                result REAL NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                user_id INTEGER,
-                game_context TEXT
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        with self.database.raw_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ml_training_data (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    features TEXT NOT NULL,
+                    action INTEGER NOT NULL,
+                    result REAL NOT NULL,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    user_id INTEGER,
+                    game_context TEXT
+                )
+            ''')
+            # get_training_data: ORDER BY timestamp DESC LIMIT ?
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS ix_ml_training_data_timestamp
+                ON ml_training_data (timestamp)
+            ''')
+            conn.commit()
         logger.info("ML database initialized")
     
     def record_decision(self, user_id: int, game_state: Dict[str, Any], 
                        action: str, result: float, context: str = ""):
-        """Запись точки принятия решения"""
-        try:
-            features = self._extract_features(game_state)
-            action_idx = self._action_to_index(action)
-            
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO ml_training_data 
-                (features, action, result, user_id, game_context)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                json.dumps(features),
-                action_idx,
-                result,
-                user_id,
-                context
-            ))
-            
-            conn.commit()
-            conn.close()
-            logger.debug(f"Recorded ML data for user {user_id}")
-            
-        except Exception as e:
-            logger.error(f"Error recording ML data: {e}")
+        """Запись точки принятия решения (в буфер, на диск пишет фоновый поток)"""
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append((user_id, game_state, action, result, context))
+        self._ensure_writer()
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+    
+    def _ensure_writer(self):
+        """Запуск фонового писателя при первой записи и перезапуск, если он упал"""
+        writer = self._writer
+        if (writer is not None and writer.is_alive()) or self._stopping:
+            return
+        with self._writer_lock:
+            if self._stopping or (self._writer is not None and self._writer.is_alive()):
+                return
+            if self._writer is None:
+                atexit.register(self.close)
+            else:
+                logger.warning("ML data writer is not running, restarting")
+            self._writer = threading.Thread(target=self._run_writer, name="ml-data-writer", daemon=True)
+            self._writer.start()
+    
+    def _run_writer(self):
+        """Цикл писателя: пачки по размеру или по таймеру в одном соединении"""
+        while True:
+            try:
+                # Соединение из пула держится писателем все время работы;
+                # в WAL с synchronous=NORMAL коммит не делает fsync
+                with self.database.raw_connection() as conn:
+                    while not self._stopping:
+                        self._wakeup.wait(self.flush_interval)
+                        self._wakeup.clear()
+                        self._write_pending(conn)
+                    self._write_pending(conn)
+                    # Перенос WAL в основной файл с fsync перед выходом
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                return
+            except Exception as e:
+                # Ошибка соединения: буфер сохраняется, писатель переподключается
+                logger.error(f"ML data writer error: {e}")
+                if self._stopping:
+                    return
+                time.sleep(self.flush_interval)
+    
+    def _prepare_batch(self) -> List[tuple]:
+        """Следующая пачка строк из буфера"""
+        rows = []
+        while self._buffer and len(rows) < self.batch_size:
+            user_id, game_state, action, result, context = self._buffer.popleft()
+            try:
+                rows.append((
+                    json.dumps(self._extract_features(game_state)),
+                    self._action_to_index(action),
+                    result,
+                    user_id,
+                    context
+                ))
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error preparing ML data: {e}")
+        return rows
+    
+    def _write_pending(self, conn):
+        """Записать все накопленные решения пачками executemany.
+        
+        Неудачная пачка остается первой в очереди и повторяется в следующем
+        цикле; после max_retries попыток она отбрасывается и учитывается в failed.
+        """
+        while self._retry_rows or self._buffer:
+            rows = self._retry_rows or self._prepare_batch()
+            if not rows:
+                continue
+            try:
+                conn.executemany('''
+                    INSERT INTO ml_training_data 
+                    (features, action, result, user_id, game_context)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', rows)
+                conn.commit()
+            except Exception as e:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                self._retry_attempts += 1
+                if self._retry_attempts < self.max_retries and not self._stopping:
+                    self._retry_rows = rows
+                    logger.error(f"Error recording ML data (attempt {self._retry_attempts}): {e}")
+                    return
+                self.failed += len(rows)
+                self._retry_rows = []
+                self._retry_attempts = 0
+                logger.error(f"Error recording ML data, {len(rows)} decisions lost: {e}")
+                continue
+            self._retry_rows = []
+            self._retry_attempts = 0
+            self.written += len(rows)
+            logger.debug(f"Recorded {len(rows)} ML decisions")
+    
+    def close(self, timeout: float = 10.0):
+        """Остановить писателя, записав буфер на диск"""
+        with self._writer_lock:
+            writer = self._writer
+            self._stopping = True
+        if writer is None:
+            return
+        self._wakeup.set()
+        writer.join(timeout)
+        if writer.is_alive():
+            logger.warning(f"ML data writer did not stop, pending decisions: {len(self._buffer)}")
+    
+    @staticmethod
+    def hand_strength(hole: List[int]) -> float:
+        """Сила стартовой руки (0-1) по кодам карт rank * 4 + suit.
+
+        Одна эвристика для живых игр, MLEnhancedAI и self-play
+        (векторная версия - vector_env.preflop_hand_strength).
+        """
+        if len(hole) != 2:
+            return 0.5
+        rank1, rank2 = (hole[0] >> 2) + 2, (hole[1] >> 2) + 2
+        if rank1 == rank2:
+            return min(0.95, rank1 / 14.0 + 0.3)
+        suited_bonus = 0.1 if (hole[0] & 3) == (hole[1] & 3) else 0.0
+        connector_bonus = max(0.0, 0.1 - abs(rank1 - rank2) * 0.02)
+        return min(0.9, max(rank1, rank2) / 14.0 * 0.6 + suited_bonus + connector_bonus)
+    
+    @staticmethod
+    def heads_up_position(seat: int) -> str:
+        """Позиция места в heads-up: место 0 ставит SB и это баттон, место 1 - BB"""
+        return 'late' if seat == 0 else 'blinds'
     
     def _extract_features(self, game_state: Dict[str, Any]) -> List[float]:
         """Извлечение 47 фич из состояния игры"""
@@ -70,18 +207,16 @@ class DataPipeline:
         
         # 2. Позиционные фичи (4 фичи)
         position = game_state.get('position', 'middle')
-        position_map = {'early': 0.0, 'middle': 0.5, 'late': 1.0, 'blinds': 0.25}
-        features.append(position_map.get(position, 0.5))
+        features.append(self.POSITION_MAP.get(position, 0.5))
         
         # 3. Фичи стека и банка (5 фич)
         features.append(game_state.get('stack_ratio', 1.0))
         features.append(game_state.get('pot_ratio', 0.1))
-        features.append(game_state.get('effective_stack', 50.0))
+        features.append(game_state.get('effective_stack', 1.0))
         
         # 4. Стадия игры (4 фичи)
         street = game_state.get('street', 'preflop')
-        street_map = {'preflop': 0.0, 'flop': 0.33, 'turn': 0.66, 'river': 1.0}
-        features.append(street_map.get(street, 0.0))
+        features.append(self.STREET_MAP.get(street, 0.0))
         
         # 5. Стиль оппонента (4 фичи)
         features.append(game_state.get('opponent_aggression', 0.5))
@@ -91,33 +226,24 @@ class DataPipeline:
         # ... остальные фичи пока заполняем нулями
         
         # Добиваем до 47 фич нулями (временная мера)
-        while len(features) < 47:
+        while len(features) < self.FEATURE_DIM:
             features.append(0.0)
             
-        return features[:47]  # Обрезаем до 47 фич
+        return features[:self.FEATURE_DIM]  # Обрезаем до 47 фич
     
     def _action_to_index(self, action: str) -> int:
         """Конвертация действия в числовой индекс"""
-        action_map = {
-            'fold': 0,
-            'check': 1, 
-            'call': 2,
-            'raise': 3
-        }
-        return action_map.get(action.lower(), 0)
+        return self.ACTION_MAP.get(action.lower(), 0)
     
     def get_training_data(self, limit: int = 10000) -> tuple:
         """Получение данных для обучения"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT features, action, result FROM ml_training_data 
-            ORDER BY timestamp DESC LIMIT ?
-        ''', (limit,))
-        
-        data = cursor.fetchall()
-        conn.close()
+        with self.database.raw_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT features, action, result FROM ml_training_data 
+                ORDER BY timestamp DESC LIMIT ?
+            ''', (limit,))
+            data = cursor.fetchall()
         
         features = []
         actions = []
@@ -1,8 +1,9 @@
 import logging
-import sqlite3
 import json
 import numpy as np
 from datetime import datetime
+from sqlalchemy import text
+from app.database import db
 
 logger = logging.getLogger(__name__)
 
@@ -48,20 +49,14 @@ class ModelTrainer:
     
     def _get_training_data(self):
         """Получение данных для обучения"""
-        conn = sqlite3.connect('poker_mentor.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM ml_training_data')
-        count = cursor.fetchone()[0]
-        conn.close()
+        with db.session_scope() as session:
+            count = session.execute(text('SELECT COUNT(*) FROM ml_training_data')).scalar()
         return [None] * count  # Заглушка
     
     def get_training_status(self):
         """Статус обучения"""
-        conn = sqlite3.connect('poker_mentor.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM ml_training_data')
-        data_count = cursor.fetchone()[0]
-        conn.close()
+        with db.session_scope() as session:
+            data_count = session.execute(text('SELECT COUNT(*) FROM ml_training_data')).scalar()
         
         return {
             'data_collected': data_count,
@@ -0,0 +1,351 @@
+import logging
+from typing import Callable, Dict, Optional, Tuple
+import numpy as np
+
+from app.ml.data_pipeline import DataPipeline
+
+logger = logging.getLogger(__name__)
+
+# Индексы действий совпадают с DataPipeline.ACTION_MAP
+FOLD, CHECK, CALL, RAISE = 0, 1, 2, 3
+
+# Улицы; DONE - раздача завершена
+PREFLOP, FLOP, TURN, RIVER, DONE = 0, 1, 2, 3, 4
+STREET_NAMES = ('preflop', 'flop', 'turn', 'river')
+
+# Раскладка колоды как в PokerGame: 2+2 карманные, сжечь, флоп, сжечь, терн, сжечь, ривер
+HOLE_SLOTS = np.array([[0, 1], [2, 3]])
+BOARD_SLOTS = np.array([5, 6, 7, 9, 11])
+BOARD_VISIBLE = np.array([0, 3, 4, 5, 5])
+
+_RANKS = np.arange(13)
+
+
+def _top_ranks(mask: np.ndarray, k: int) -> np.ndarray:
+    """k старших рангов из булевой маски (M, 13), отсутствующие = -1"""
+    values = np.where(mask, _RANKS, -1)
+    return -np.sort(-values, axis=1)[:, :k]
+
+
+def _straight_high(present: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Старшая карта стрита по маске рангов (M, 13) с учетом wheel"""
+    extended = np.concatenate([present[:, 12:13], present], axis=1)
+    windows = extended[:, 0:10].copy()
+    for offset in range(1, 5):
+        windows &= extended[:, offset:offset + 10]
+    has_straight = windows.any(axis=1)
+    high = 9 - np.argmax(windows[:, ::-1], axis=1) + 3
+    return has_straight, high
+
+
+def _pack(category: int, ranks: np.ndarray) -> np.ndarray:
+    """Векторная версия equity._pack"""
+    value = np.full(ranks.shape[0], category, dtype=np.int64)
+    for i in range(5):
+        column = np.maximum(ranks[:, i], 0) if i < ranks.shape[1] else 0
+        value = (value << 4) | column
+    return value
+
+
+def evaluate_batch(cards: np.ndarray) -> np.ndarray:
+    """Векторная оценка рук (M, 5..7) в кодировке app.equity.
+
+    Значения совпадают с equity.evaluate_cards, поэтому руки можно
+    сравнивать между векторным и скалярным кодом.
+    """
+    cards = np.asarray(cards, dtype=np.int64)
+    ranks = cards >> 2
+    suits = cards & 3
+    rank_hits = ranks[..., None] == _RANKS
+    rank_counts = rank_hits.sum(axis=1)
+    suit_counts = (suits[..., None] == np.arange(4)).sum(axis=1)
+    present = rank_counts > 0
+
+    flush_suit = np.argmax(suit_counts, axis=1)
+    is_flush = suit_counts.max(axis=1) >= 5
+    flush_mask = (rank_hits & (suits == flush_suit[:, None])[..., None]).any(axis=1)
+    has_sf, sf_high = _straight_high(flush_mask)
+    has_straight, straight_high = _straight_high(present)
+
+    quad_mask = rank_counts == 4
+    trip_mask = rank_counts == 3
+    pair_mask = rank_counts == 2
+    single_mask = rank_counts == 1
+
+    quad = _top_ranks(quad_mask, 1)
+    trips = _top_ranks(trip_mask, 2)
+    pairs = _top_ranks(pair_mask, 2)
+    not_quad = _RANKS != quad
+    not_trip = _RANKS != trips[:, :1]
+    not_pairs = (_RANKS != pairs[:, :1]) & (_RANKS != pairs[:, 1:2])
+
+    column = lambda values: values.reshape(-1, 1)
+    candidates = [
+        (is_flush & has_sf, _pack(9, column(sf_high))),
+        (quad[:, 0] >= 0, _pack(8, np.hstack([quad, _top_ranks(present & not_quad, 1)]))),
+        ((trips[:, 0] >= 0) & ((trips[:, 1] >= 0) | (pairs[:, 0] >= 0)),
+         _pack(7, np.hstack([trips[:, :1], _top_ranks((rank_counts >= 2) & not_trip, 1)]))),
+        (is_flush, _pack(6, _top_ranks(flush_mask, 5))),
+        (has_straight, _pack(5, column(straight_high))),
+        (trips[:, 0] >= 0, _pack(4, np.hstack([trips[:, :1], _top_ranks(single_mask, 2)]))),
+        (pairs[:, 1] >= 0, _pack(3, np.hstack([pairs, _top_ranks(present & not_pairs, 1)]))),
+        (pairs[:, 0] >= 0, _pack(2, np.hstack([pairs[:, :1], _top_ranks(single_mask, 3)]))),
+    ]
+    conditions = [condition for condition, _ in candidates]
+    values = [value for _, value in candidates]
+    return np.select(conditions, values, default=_pack(1, _top_ranks(single_mask, 5)))
+
+
+def preflop_hand_strength(hole: np.ndarray) -> np.ndarray:
+    """Векторная версия DataPipeline.hand_strength (0-1)"""
+    rank_values = (hole >> 2) + 2
+    rank1, rank2 = rank_values[:, 0], rank_values[:, 1]
+    suited = (hole[:, 0] & 3) == (hole[:, 1] & 3)
+    gap = np.abs(rank1 - rank2)
+    base = np.maximum(rank1, rank2) / 14.0 * 0.6
+    strength = np.minimum(0.9, base + np.where(suited, 0.1, 0.0) + np.maximum(0, 0.1 - gap * 0.02))
+    pair_strength = np.minimum(0.95, rank1 / 14.0 + 0.3)
+    return np.where(rank1 == rank2, pair_strength, strength)
+
+
+class VectorPokerEnv:
+    """Векторизованное heads-up окружение для self-play.
+
+    Состояние тысяч столов хранится как struct-of-arrays NumPy, шаг
+    выполняется для всех столов сразу по массиву действий. Правила как
+    в PokerGame/GameManager: стек 100, блайнды 1/2, место 0 ставит SB и
+    ходит первым на каждой улице. Рейз - удвоение текущей ставки, не
+    больше max_raises рейзов за улицу.
+    """
+
+    def __init__(self, num_tables: int = 1024, small_blind: int = 1, big_blind: int = 2,
+                 starting_stack: int = 100, max_raises: int = 4,
+                 seed: Optional[int] = None):
+        self.num_tables = num_tables
+        self.small_blind = small_blind
+        self.big_blind = big_blind
+        self.starting_stack = starting_stack
+        self.max_raises = max_raises
+        self.rng = np.random.default_rng(seed)
+
+        n = num_tables
+        self.deck = np.zeros((n, 52), dtype=np.int8)
+        self.hole = np.zeros((n, 2, 2), dtype=np.int8)
+        self.board = np.zeros((n, 5), dtype=np.int8)
+        self.stacks = np.zeros((n, 2), dtype=np.int32)
+        self.committed = np.zeros((n, 2), dtype=np.int32)
+        self.pot = np.zeros(n, dtype=np.int32)
+        self.current_bet = np.zeros(n, dtype=np.int32)
+        self.street = np.zeros(n, dtype=np.int8)
+        self.to_act = np.zeros(n, dtype=np.int8)
+        self.acted = np.zeros((n, 2), dtype=bool)
+        self.raises = np.zeros(n, dtype=np.int8)
+        self.hand_id = np.zeros(n, dtype=np.int64)
+        self.next_hand_id = 0
+
+        # Стиль оппонента для фич (как opponent_aggression/tightness в GameManager)
+        self.opponent_aggression = np.full((n, 2), 0.5, dtype=np.float32)
+        self.opponent_tightness = np.full((n, 2), 0.5, dtype=np.float32)
+
+        self.reset()
+
+    def reset(self, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Начать новые раздачи на столах из mask (по умолчанию на всех)"""
+        index = np.arange(self.num_tables) if mask is None else np.flatnonzero(mask)
+        count = len(index)
+        if count == 0:
+            return self.features()
+
+        decks = np.argsort(self.rng.random((count, 52)), axis=1).astype(np.int8)
+        self.deck[index] = decks
+        self.hole[index] = decks[:, HOLE_SLOTS]
+        self.board[index] = decks[:, BOARD_SLOTS]
+
+        self.stacks[index] = self.starting_stack
+        self.stacks[index, 0] -= self.small_blind
+        self.stacks[index, 1] -= self.big_blind
+        self.committed[index] = (self.small_blind, self.big_blind)
+        self.pot[index] = self.small_blind + self.big_blind
+        self.current_bet[index] = self.big_blind
+        self.street[index] = PREFLOP
+        self.to_act[index] = 0
+        self.acted[index] = False
+        self.raises[index] = 0
+        self.hand_id[index] = np.arange(self.next_hand_id, self.next_hand_id + count)
+        self.next_hand_id += count
+        return self.features()
+
+    def legal_actions(self) -> np.ndarray:
+        """Маска легальных действий (N, 4)"""
+        seat = self.to_act
+        rows = np.arange(self.num_tables)
+        to_call = self.current_bet - self.committed[rows, seat]
+        legal = np.zeros((self.num_tables, 4), dtype=bool)
+        legal[:, FOLD] = to_call > 0
+        legal[:, CHECK] = to_call == 0
+        legal[:, CALL] = to_call > 0
+        legal[:, RAISE] = ~self._raise_blocked(seat, to_call)
+        legal[self.street == DONE] = False
+        return legal
+
+    def _raise_blocked(self, seat: np.ndarray, to_call: np.ndarray) -> np.ndarray:
+        """Рейз невозможен: не хватает стека, лимит рейзов или оппонент олл-ин"""
+        rows = np.arange(self.num_tables)
+        return ((self.stacks[rows, seat] <= to_call) | (self.raises >= self.max_raises)
+                | (self.stacks[rows, 1 - seat] == 0))
+
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Применить по одному действию на каждом столе.
+
+        Нелегальные действия приводятся к ближайшим легальным (чек при
+        ставке - колл, колл без ставки - чек, невозможный рейз - колл).
+        Возвращает (features, rewards (N, 2), done (N,)); завершенные
+        столы сразу начинают новую раздачу.
+        """
+        actions = np.asarray(actions, dtype=np.int8).copy()
+        rows = np.arange(self.num_tables)
+        seat = self.to_act.astype(np.int64)
+        other = 1 - seat
+        to_call = self.current_bet - self.committed[rows, seat]
+        stack = self.stacks[rows, seat]
+
+        actions[(actions == CHECK) & (to_call > 0)] = CALL
+        actions[(actions == FOLD) & (to_call == 0)] = CHECK
+        actions[(actions == CALL) & (to_call == 0)] = CHECK
+        blocked = (actions == RAISE) & self._raise_blocked(seat, to_call)
+        actions[blocked & (to_call > 0)] = CALL
+        actions[blocked & (to_call == 0)] = CHECK
+
+        # Ставки: колл ограничен стеком, рейз - до удвоенной ставки
+        raise_to = np.maximum(self.current_bet * 2, self.big_blind * 2)
+        put_in = np.zeros(self.num_tables, dtype=np.int32)
+        put_in = np.where(actions == CALL, np.minimum(to_call, stack), put_in)
+        put_in = np.where(actions == RAISE, np.minimum(raise_to - self.committed[rows, seat], stack), put_in)
+
+        self.stacks[rows, seat] -= put_in
+        self.committed[rows, seat] += put_in
+        self.pot += put_in
+        raised = actions == RAISE
+        self.current_bet = np.maximum(self.current_bet, self.committed[rows, seat])
+        self.raises += raised
+        self.acted[rows, seat] = True
+        # После рейза оппонент снова должен ответить
+        self.acted[rows[raised], other[raised]] = False
+
+        rewards = np.zeros((self.num_tables, 2), dtype=np.float32)
+        folded = actions == FOLD
+        done = folded.copy()
+        winner_on_fold = other
+
+        # Улица закрыта, когда оба походили и ставки уравнены
+        all_in = (self.stacks == 0).any(axis=1)
+        matched = (self.committed[:, 0] == self.committed[:, 1]) | all_in
+        street_closed = ~folded & self.acted.all(axis=1) & matched
+        go_showdown = street_closed & ((self.street == RIVER) | all_in)
+        advance = street_closed & ~go_showdown
+
+        self.street[advance] += 1
+        self.committed[advance] = 0
+        self.current_bet[advance] = 0
+        self.acted[advance] = False
+        self.raises[advance] = 0
+        self.to_act = np.where(advance, 0, other).astype(np.int8)
+
+        # Фолд: банк забирает оппонент
+        if folded.any():
+            index = np.flatnonzero(folded)
+            self.stacks[index, winner_on_fold[index]] += self.pot[index]
+
+        # Шоудаун
+        if go_showdown.any():
+            index = np.flatnonzero(go_showdown)
+            self._settle_showdown(index)
+            done |= go_showdown
+
+        if done.any():
+            rewards[done] = self.stacks[done] - self.starting_stack
+            self.street[done] = DONE
+            self.reset(done)
+
+        return self.features(), rewards, done
+
+    def _settle_showdown(self, index: np.ndarray):
+        """Раздать банк по силе рук (сплит делится пополам)"""
+        board = self.board[index]
+        values = [evaluate_batch(np.hstack([self.hole[index, seat], board])) for seat in (0, 1)]
+        pot = self.pot[index]
+        seat0_share = np.where(values[0] > values[1], pot, np.where(values[0] == values[1], pot - pot // 2, 0))
+        self.stacks[index, 0] += seat0_share
+        self.stacks[index, 1] += pot - seat0_share
+
+    def features(self) -> np.ndarray:
+        """Фичи (N, 47) для игрока, который ходит, в раскладке DataPipeline._extract_features"""
+        rows = np.arange(self.num_tables)
+        seat = self.to_act.astype(np.int64)
+        street = np.minimum(self.street, RIVER)
+        position_map = DataPipeline.POSITION_MAP
+        street_values = np.array([DataPipeline.STREET_MAP[name] for name in STREET_NAMES], dtype=np.float32)
+
+        features = np.zeros((self.num_tables, DataPipeline.FEATURE_DIM), dtype=np.float32)
+        features[:, 0] = preflop_hand_strength(self.hole[rows, seat].astype(np.int64))
+        # Как DataPipeline.heads_up_position: SB - баттон, BB - блайнды
+        features[:, 1] = np.where(seat == 0, position_map[DataPipeline.heads_up_position(0)],
+                                  position_map[DataPipeline.heads_up_position(1)])
+        features[:, 2] = self.stacks[rows, seat] / 100.0
+        features[:, 3] = self.pot / 100.0
+        features[:, 4] = self.stacks.min(axis=1) / 100.0
+        features[:, 5] = street_values[street]
+        features[:, 6] = self.opponent_aggression[rows, seat]
+        features[:, 7] = self.opponent_tightness[rows, seat]
+        return features
+
+    def visible_board(self) -> np.ndarray:
+        """Открытые карты борда (N, 5), закрытые = -1"""
+        visible = BOARD_VISIBLE[np.minimum(self.street, DONE)]
+        return np.where(np.arange(5) < visible[:, None], self.board, -1)
+
+
+def collect_self_play(env: VectorPokerEnv, policy: Callable[[np.ndarray, np.ndarray], np.ndarray],
+                      num_steps: int) -> Dict[str, np.ndarray]:
+    """Сыграть num_steps векторных шагов и вернуть размеченные решения.
+
+    policy(features, legal) -> actions (N,). Метка каждого решения -
+    итоговый результат раздачи в фишках для сделавшего его игрока.
+    Решения из незавершенных раздач отбрасываются.
+    """
+    features, actions, seats, hands = [], [], [], []
+    finished_hands, finished_rewards = [], []
+
+    for _ in range(num_steps):
+        observation = env.features()
+        legal = env.legal_actions()
+        chosen = np.asarray(policy(observation, legal), dtype=np.int8)
+        features.append(observation)
+        actions.append(chosen)
+        seats.append(env.to_act.astype(np.int64))
+        hands.append(env.hand_id.copy())
+
+        hand_ids = env.hand_id.copy()
+        _, rewards, done = env.step(chosen)
+        finished_hands.append(hand_ids[done])
+        finished_rewards.append(rewards[done])
+
+    hands = np.concatenate(hands)
+    seats = np.concatenate(seats)
+    results = np.full((env.next_hand_id, 2), np.nan, dtype=np.float32)
+    results[np.concatenate(finished_hands)] = np.concatenate(finished_rewards)
+    labels = results[hands, seats]
+    known = ~np.isnan(labels)
+
+    logger.info(f"Self-play: {known.sum()} размеченных решений из {len(hands)}")
+    return {
+        'features': np.concatenate(features)[known],
+        'actions': np.concatenate(actions)[known],
+        'results': labels[known],
+    }
+
+
+def random_policy(features: np.ndarray, legal: np.ndarray) -> np.ndarray:
+    """Случайная политика среди легальных действий"""
+    weights = np.random.random(legal.shape) * legal
+    return np.argmax(weights, axis=1)
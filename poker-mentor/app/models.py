@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, JSON, Boolean, Enum
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, JSON, Boolean, Enum, LargeBinary, Index, Date
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -54,7 +54,14 @@ class GameSession(Base):
     
     # Статистика сессии
     hands_played = Column(Integer, default=0)
-    net_profit = Column(Integer, default=0)  # в big blinds
+    net_profit = Column(Integer, default=0)  # в фишках (poker_engine.BIG_BLIND)
+    
+    __table_args__ = (
+        # Последняя сессия пользователя против AI (Database.save_hands)
+        Index('ix_game_sessions_user_ai', 'user_id', 'ai_opponent_type', 'id'),
+        # Keyset-пагинация истории (HistoryManager)
+        Index('ix_game_sessions_user_created', 'user_id', 'created_at', 'id'),
+    )
     
     def __repr__(self):
         return f"<GameSession(id={self.id}, user_id={self.user_id}, status={self.status})>"
@@ -77,6 +84,12 @@ class HandHistory(Base):
     analysis = Column(JSON)  # {equity: %, ev: value, mistakes: [], rating: 1-10}
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        Index('ix_hand_histories_session_hand', 'session_id', 'hand_number'),
+        # Выборка месяца для архива (app.hand_archive)
+        Index('ix_hand_histories_created', 'created_at'),
+    )
+    
     def __repr__(self):
         return f"<HandHistory(id={self.id}, session_id={self.session_id}, hand_number={self.hand_number})>"
 
@@ -89,7 +102,7 @@ class UserStats(Base):
     # Общая статистика
     total_hands_played = Column(Integer, default=0)
     total_sessions = Column(Integer, default=0)
-    total_profit = Column(Integer, default=0)  # в big blinds
+    total_profit = Column(Integer, default=0)  # в фишках (poker_engine.BIG_BLIND)
     
     # Winrate по типам игр
     cash_winrate = Column(Float, default=0.0)
@@ -100,10 +113,111 @@ class UserStats(Base):
     vs_tag_winrate = Column(Float, default=0.0)
     vs_lag_winrate = Column(Float, default=0.0)
     vs_nit_winrate = Column(Float, default=0.0)
-    
-    # Анализ ошибок
-    common_mistakes = Column(JSON, default=[])
+    vs_equity_winrate = Column(Float, default=0.0)
+    
+    # Раздачи и результат по типам AI (основа winrate, StatsAggregator)
+    vs_fish_hands = Column(Integer, default=0)
+    vs_fish_profit = Column(Integer, default=0)
+    vs_nit_hands = Column(Integer, default=0)
+    vs_nit_profit = Column(Integer, default=0)
+    vs_tag_hands = Column(Integer, default=0)
+    vs_tag_profit = Column(Integer, default=0)
+    vs_lag_hands = Column(Integer, default=0)
+    vs_lag_profit = Column(Integer, default=0)
+    vs_equity_hands = Column(Integer, default=0)
+    vs_equity_profit = Column(Integer, default=0)
+    
+    # Счетчики стиля игры (OpponentTracker)
+    tracked_hands = Column(Integer, default=0)
+    vpip_hands = Column(Integer, default=0)
+    pfr_hands = Column(Integer, default=0)
+    three_bet_opportunities = Column(Integer, default=0)
+    three_bets = Column(Integer, default=0)
+    aggressive_actions = Column(Integer, default=0)
+    passive_actions = Column(Integer, default=0)
+    cbets_faced = Column(Integer, default=0)
+    folds_to_cbet = Column(Integer, default=0)
+    
+    # Анализ ошибок: {ошибка: количество}
+    common_mistakes = Column(JSON, default={})
     last_updated = Column(DateTime, default=datetime.utcnow)
     
     def __repr__(self):
-        return f"<UserStats(user_id={self.user_id}, hands_played={self.total_hands_played})>"
\ No newline at end of file
+        return f"<UserStats(user_id={self.user_id}, hands_played={self.total_hands_played})>"
+
+class UserDailyStats(Base):
+    __tablename__ = 'user_daily_stats'
+    
+    # Дневные итоги пользователя (app.rollups), день - дата UTC
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    day = Column(Date, nullable=False)
+    
+    hands = Column(Integer, default=0)
+    net = Column(Integer, default=0)  # в фишках, как game_sessions.net_profit
+    # Сессии относятся к дню начала
+    sessions = Column(Integer, default=0)
+    session_seconds = Column(Integer, default=0)
+    
+    # Результаты по типам AI
+    fish_hands = Column(Integer, default=0)
+    fish_net = Column(Integer, default=0)
+    nit_hands = Column(Integer, default=0)
+    nit_net = Column(Integer, default=0)
+    tag_hands = Column(Integer, default=0)
+    tag_net = Column(Integer, default=0)
+    lag_hands = Column(Integer, default=0)
+    lag_net = Column(Integer, default=0)
+    equity_hands = Column(Integer, default=0)
+    equity_net = Column(Integer, default=0)
+    
+    __table_args__ = (
+        # Ключ upsert и диапазон дней пользователя
+        Index('ux_user_daily_stats_user_day', 'user_id', 'day', unique=True),
+    )
+    
+    def __repr__(self):
+        return f"<UserDailyStats(user_id={self.user_id}, day={self.day}, hands={self.hands})>"
+
+class GameSnapshot(Base):
+    __tablename__ = 'game_snapshots'
+    
+    # Выгруженная из памяти активная игра (GameStore)
+    user_id = Column(String(50), primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<GameSnapshot(user_id={self.user_id}, size={len(self.data or b'')})>"
+
+class ImportedHand(Base):
+    __tablename__ = 'imported_hands'
+    
+    # Номер раздачи в руме (hh_import): повторный импорт файла ее пропускает.
+    # Отдельная таблица - ключ переживает перенос раздачи в архив
+    user_id = Column(Integer, primary_key=True)
+    source_id = Column(String(64), primary_key=True)
+    hand_id = Column(Integer, nullable=False)
+    
+    def __repr__(self):
+        return f"<ImportedHand(user_id={self.user_id}, source_id={self.source_id}, hand_id={self.hand_id})>"
+
+class HandBitmap(Base):
+    __tablename__ = 'hand_bitmaps'
+    
+    # Битовый индекс раздач пользователя (app.hand_index): бит i сегмента -
+    # i-я проиндексированная раздача; attribute '_ids' хранит id раздач сегмента
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    attribute = Column(String(20), nullable=False)  # hand, position, board, street, action, result...
+    value = Column(String(20), nullable=False)  # AKs, BTN, monotone, river, river_call, win...
+    segment = Column(Integer, nullable=False)
+    cardinality = Column(Integer, default=0)
+    data = Column(LargeBinary)  # zlib
+    
+    __table_args__ = (
+        Index('ux_hand_bitmaps_key', 'user_id', 'attribute', 'value', 'segment', unique=True),
+    )
+    
+    def __repr__(self):
+        return f"<HandBitmap(user_id={self.user_id}, {self.attribute}={self.value}, segment={self.segment})>"
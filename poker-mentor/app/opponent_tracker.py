@@ -0,0 +1,224 @@
+import math
+import logging
+from typing import Callable, Dict, Iterable, Optional
+from app.database import db
+
+logger = logging.getLogger(__name__)
+
+# Счетчики, которые хранятся в UserStats и сбрасываются туда пачками
+COUNTER_FIELDS = (
+    'tracked_hands',
+    'vpip_hands',
+    'pfr_hands',
+    'three_bet_opportunities',
+    'three_bets',
+    'aggressive_actions',
+    'passive_actions',
+    'cbets_faced',
+    'folds_to_cbet',
+)
+
+
+class PlayerTendencies:
+    """Инкрементальные счетчики стиля игры одного пользователя"""
+
+    __slots__ = COUNTER_FIELDS + ('hand_vpip', 'hand_pfr', 'hand_three_bet',
+                                  'hand_cbet_faced', 'ai_preflop_aggressor')
+
+    def __init__(self, counters: Optional[Dict[str, int]] = None):
+        for field in COUNTER_FIELDS:
+            setattr(self, field, int((counters or {}).get(field) or 0))
+        self.reset_hand()
+
+    def reset_hand(self):
+        """Сбросить флаги текущей раздачи"""
+        self.hand_vpip = False
+        self.hand_pfr = False
+        self.hand_three_bet = False
+        self.hand_cbet_faced = False
+        self.ai_preflop_aggressor = False
+
+    @staticmethod
+    def _ratio(part: int, total: int, default: float) -> float:
+        return part / total if total else default
+
+    @property
+    def vpip(self) -> float:
+        return self._ratio(self.vpip_hands, self.tracked_hands, 0.0)
+
+    @property
+    def pfr(self) -> float:
+        return self._ratio(self.pfr_hands, self.tracked_hands, 0.0)
+
+    @property
+    def three_bet(self) -> float:
+        return self._ratio(self.three_bets, self.three_bet_opportunities, 0.0)
+
+    @property
+    def aggression_factor(self) -> float:
+        """AF = (бет + рейз) / колл, без коллов - бесконечность (как в StatsEngine)"""
+        if self.passive_actions == 0:
+            return math.inf if self.aggressive_actions else 0.0
+        return self.aggressive_actions / self.passive_actions
+
+    @property
+    def aggression_share(self) -> float:
+        """Доля агрессивных действий постфлопа, AF / (1 + AF) без бесконечности"""
+        return self._ratio(self.aggressive_actions, self.aggressive_actions + self.passive_actions, 0.0)
+
+    @property
+    def fold_to_cbet(self) -> float:
+        return self._ratio(self.folds_to_cbet, self.cbets_faced, 0.0)
+
+    def to_dict(self) -> Dict[str, int]:
+        return {field: getattr(self, field) for field in COUNTER_FIELDS}
+
+
+class OpponentTracker:
+    """In-memory хранилище статистики игроков с O(1) обновлением на действие.
+
+    Итоговые значения держатся в памяти для AI, а приращения копятся
+    отдельно и периодически сбрасываются в UserStats одним батчем.
+    """
+
+    def __init__(self, loader: Optional[Callable[[int], Optional[Dict[str, int]]]] = None):
+        self.loader = loader
+        self._players: Dict[int, PlayerTendencies] = {}
+        self._dirty: Dict[int, Dict[str, int]] = {}
+
+    def get(self, telegram_id: int) -> PlayerTendencies:
+        """Получить счетчики игрока (из БД загружаются один раз)"""
+        stats = self._players.get(telegram_id)
+        if stats is None:
+            counters = None
+            if self.loader:
+                try:
+                    counters = self.loader(telegram_id)
+                except Exception as e:
+                    logger.error(f"Ошибка загрузки статистики игрока {telegram_id}: {e}")
+            stats = PlayerTendencies(counters)
+            self._players[telegram_id] = stats
+        return stats
+
+    def peek(self, telegram_id: int) -> Optional[PlayerTendencies]:
+        """Счетчики игрока, если они уже в памяти (без обращения к БД)"""
+        return self._players.get(telegram_id)
+
+    def _bump(self, telegram_id: int, stats: PlayerTendencies, field: str):
+        setattr(stats, field, getattr(stats, field) + 1)
+        delta = self._dirty.setdefault(telegram_id, {})
+        delta[field] = delta.get(field, 0) + 1
+
+    def start_hand(self, telegram_id: int):
+        """Новая раздача пользователя"""
+        stats = self.get(telegram_id)
+        stats.reset_hand()
+        self._bump(telegram_id, stats, 'tracked_hands')
+
+    def record_action(self, telegram_id: int, street: str, action: str,
+                      facing_raise: bool = False, facing_cbet: bool = False):
+        """Учесть действие пользователя"""
+        stats = self.get(telegram_id)
+        aggressive = action in ('raise', 'all_in')
+
+        if street == 'preflop':
+            if action in ('call', 'raise', 'all_in') and not stats.hand_vpip:
+                stats.hand_vpip = True
+                self._bump(telegram_id, stats, 'vpip_hands')
+            if aggressive and not stats.hand_pfr:
+                stats.hand_pfr = True
+                self._bump(telegram_id, stats, 'pfr_hands')
+            if facing_raise and not stats.hand_three_bet:
+                stats.hand_three_bet = True
+                self._bump(telegram_id, stats, 'three_bet_opportunities')
+                if aggressive:
+                    self._bump(telegram_id, stats, 'three_bets')
+        else:
+            if aggressive:
+                self._bump(telegram_id, stats, 'aggressive_actions')
+            elif action == 'call':
+                self._bump(telegram_id, stats, 'passive_actions')
+
+        if facing_cbet and not stats.hand_cbet_faced:
+            stats.hand_cbet_faced = True
+            self._bump(telegram_id, stats, 'cbets_faced')
+            if action == 'fold':
+                self._bump(telegram_id, stats, 'folds_to_cbet')
+
+    def record_ai_action(self, telegram_id: int, street: str, action: str):
+        """Учесть действие AI, нужное для контекста (префлоп-агрессор)"""
+        stats = self.get(telegram_id)
+        if street == 'preflop' and action in ('raise', 'all_in'):
+            stats.ai_preflop_aggressor = True
+
+    def facing_cbet(self, telegram_id: int, street: str, current_bet: int) -> bool:
+        """Стоит ли пользователь перед контбетом AI"""
+        stats = self.peek(telegram_id)
+        return bool(stats and street == 'flop' and stats.ai_preflop_aggressor and current_bet > 0)
+
+    def evict(self, telegram_ids: Iterable[int], database) -> int:
+        """Сбросить приращения игроков и убрать их из памяти.
+
+        Вызывается вместе с выгрузкой игр из GameStore, чтобы память
+        трекера не росла с числом когда-либо игравших пользователей.
+        Игроки, чьи приращения записать не удалось, остаются в памяти.
+        """
+        telegram_ids = list(telegram_ids)
+        dirty = {telegram_id: self._dirty.pop(telegram_id) for telegram_id in telegram_ids
+                 if telegram_id in self._dirty}
+        if dirty:
+            try:
+                database.apply_tendency_deltas(dirty)
+            except Exception as e:
+                logger.error(f"Ошибка сброса статистики выгружаемых игроков: {e}")
+                self.restore_dirty(dirty)
+        evicted = 0
+        for telegram_id in telegram_ids:
+            if telegram_id not in self._dirty and self._players.pop(telegram_id, None) is not None:
+                evicted += 1
+        return evicted
+
+    def take_dirty(self) -> Dict[int, Dict[str, int]]:
+        """Забрать накопленные приращения для записи в БД"""
+        dirty, self._dirty = self._dirty, {}
+        return dirty
+
+    def take_hand(self, telegram_id: int) -> Dict[str, int]:
+        """Забрать приращения игрока по завершенной раздаче.
+
+        Они уходят в UserStats вместе с раздачей (Database.save_hands),
+        в периодический сброс попадают только незавершенные раздачи.
+        """
+        return self._dirty.pop(telegram_id, {})
+
+    def restore_dirty(self, dirty: Dict[int, Dict[str, int]]):
+        """Вернуть приращения обратно после неудачной записи"""
+        for telegram_id, delta in dirty.items():
+            current = self._dirty.setdefault(telegram_id, {})
+            for field, value in delta.items():
+                current[field] = current.get(field, 0) + value
+
+    def flush(self, database) -> int:
+        """Сбросить приращения в UserStats, вернуть число игроков"""
+        dirty = self.take_dirty()
+        if not dirty:
+            return 0
+        try:
+            database.apply_tendency_deltas(dirty)
+            logger.debug(f"Статистика {len(dirty)} игроков сброшена в БД")
+            return len(dirty)
+        except Exception as e:
+            logger.error(f"Ошибка сброса статистики игроков: {e}")
+            self.restore_dirty(dirty)
+            return 0
+
+    async def run_periodic_flush(self, database, interval: float = 30.0):
+        """Фоновая задача периодического сброса"""
+        import asyncio
+        while True:
+            await asyncio.sleep(interval)
+            self.flush(database)
+
+
+# Глобальный трекер статистики игроков
+opponent_tracker = OpponentTracker(loader=db.load_player_tendencies)
@@ -5,6 +5,15 @@ from typing import List, Dict, Tuple, Optional
 
 logger = logging.getLogger(__name__)
 
+# Big blind тренажера в фишках. Суммы хранятся в фишках, в BB - только при выводе
+BIG_BLIND = 2
+
+
+def format_bb(chips, signed: bool = False) -> str:
+    """Сумма в фишках -> текст в big blinds ("+2.5 BB")"""
+    text = f"{chips / BIG_BLIND:{'+' if signed else ''}.1f}"
+    return f"{text[:-2] if text.endswith('.0') else text} BB"
+
 class Suit(Enum):
     HEARTS = "♥"
     DIAMONDS = "♦"
@@ -45,10 +54,15 @@ class HandType(Enum):
     STRAIGHT_FLUSH = 9
     ROYAL_FLUSH = 10
 
+# Индексы для компактного кода карты: rank * 4 + suit (0..51)
+RANK_CODES = {rank: code for code, rank in enumerate(Rank)}
+SUIT_CODES = {suit: code for code, suit in enumerate(Suit)}
+
 class Card:
     def __init__(self, rank: Rank, suit: Suit):
         self.rank = rank
         self.suit = suit
+        self.code = RANK_CODES[rank] * 4 + SUIT_CODES[suit]
     
     def __repr__(self):
         return f"{self.rank.value}{self.suit.value}"
@@ -161,7 +175,9 @@ class PokerHand:
         return self.hand_type == other.hand_type and self.hand_value == other.hand_value
 
 class PokerGame:
-    def __init__(self, players: List[str], small_blind: int = 1, big_blind: int = 2):
+    STREETS = {0: "preflop", 3: "flop", 4: "turn", 5: "river"}
+    
+    def __init__(self, players: List[str], small_blind: int = BIG_BLIND // 2, big_blind: int = BIG_BLIND):
         self.players = players
         self.small_blind = small_blind
         self.big_blind = big_blind
@@ -169,7 +185,7 @@ class PokerGame:
         self.community_cards = []
         self.pot = 0
         self.current_bet = 0
-        self.player_stacks = {player: 100 for player in players}  # Стартовый стек 100 BB
+        self.player_stacks = {player: 100 for player in players}  # Стартовый стек 100 фишек (50 BB)
         self.player_cards = {player: [] for player in players}
         self.current_player_idx = 0
         self.hand_history = []
@@ -201,9 +217,24 @@ class PokerGame:
         self.player_stacks[bb_player] -= self.big_blind
         self.pot = self.small_blind + self.big_blind
         self.current_bet = self.big_blind
+        self.record_action(sb_player, "small_blind", self.small_blind)
+        self.record_action(bb_player, "big_blind", self.big_blind)
         
         logger.info(f"Блайнды: {sb_player} ({self.small_blind}), {bb_player} ({self.big_blind})")
     
+    def current_street(self) -> str:
+        """Текущая улица по количеству карт на столе"""
+        return self.STREETS.get(len(self.community_cards), "preflop")
+    
+    def record_action(self, player: str, action: str, amount: int = 0):
+        """Добавить действие в лог событий раздачи"""
+        self.hand_history.append({
+            'street': self.current_street(),
+            'player': player,
+            'action': action,
+            'amount': amount
+        })
+    
     def deal_flop(self):
         """Раздать флоп"""
         self.deck.deal(1)  # Сжечь карту
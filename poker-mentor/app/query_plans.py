@@ -0,0 +1,167 @@
+"""
+Проверка планов горячих запросов (python -m app.query_plans).
+
+Для каждого запроса из HOT_QUERIES выполняется EXPLAIN QUERY PLAN;
+проверка падает (код выхода 1), если SQLite читает таблицу целиком
+или строит временное B-дерево для ORDER BY. Запросы собраны теми же
+конструкциями, что и в Database/DataPipeline, выгрузке, пересборке
+дневных итогов и архиве (для одного пользователя: выгрузка и пересборка
+всех пользователей читают таблицы целиком намеренно). При изменении
+запросов в коде список нужно обновить вместе с миграцией индексов.
+"""
+
+import re
+import sys
+import logging
+from datetime import date, datetime
+
+from sqlalchemy import delete, func, inspect, select, text, tuple_
+from sqlalchemy.exc import DBAPIError
+
+from app.models import (User, UserStats, UserDailyStats, GameSession, HandHistory, GameSnapshot, HandBitmap,
+                        ImportedHand)
+
+logger = logging.getLogger(__name__)
+
+# "SCAN users" / "SCAN TABLE users" без USING INDEX - полный просмотр таблицы
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\w+( AS \w+)?$')
+TEMP_SORT = 'USE TEMP B-TREE'
+
+# (название, таблицы, запрос)
+HOT_QUERIES = (
+    ('users по telegram_id (add_user, get_user_info)', ('users',),
+     select(User).where(User.telegram_id == 1).limit(1)),
+    ('users по списку telegram_id (save_hands, apply_tendency_deltas)', ('users',),
+     select(User.telegram_id, User.id).where(User.telegram_id.in_([1, 2, 3]))),
+    ('user_stats по user_id (get_user_stats)', ('user_stats', 'users'),
+     select(UserStats, User.telegram_id).join(User, User.id == UserStats.user_id)
+     .where(UserStats.user_id == 1).limit(1)),
+    ('user_stats по telegram_id (load_player_tendencies)', ('user_stats', 'users'),
+     select(UserStats).join(User, User.id == UserStats.user_id)
+     .where(User.telegram_id == 1).limit(1)),
+    ('последняя сессия против AI (save_hands)', ('game_sessions',),
+     select(GameSession).where(GameSession.user_id == 1, GameSession.ai_opponent_type == 'fish')
+     .order_by(GameSession.id.desc()).limit(1)),
+    ('раздачи сессии по порядку', ('hand_histories',),
+     select(HandHistory).where(HandHistory.session_id == 1).order_by(HandHistory.hand_number)),
+    ('страница истории сессий (HistoryManager)', ('game_sessions',),
+     select(GameSession.id, GameSession.created_at, GameSession.hands_played)
+     .where(GameSession.user_id == 1,
+            tuple_(GameSession.created_at, GameSession.id) < tuple_(datetime(2024, 1, 1), 100))
+     .order_by(GameSession.created_at.desc(), GameSession.id.desc()).limit(11)),
+    ('страница раздач сессии (HistoryManager)', ('hand_histories',),
+     select(HandHistory.id, HandHistory.hand_number)
+     .where(HandHistory.session_id == 1, HandHistory.hand_number > 10)
+     .order_by(HandHistory.hand_number).limit(11)),
+    ('логи раздач пользователя (get_user_hand_rows)', ('game_sessions', 'hand_histories'),
+     select(HandHistory.id, GameSession.ai_opponent_type, HandHistory.hole_cards, HandHistory.actions,
+            HandHistory.result)
+     .join(HandHistory, HandHistory.session_id == GameSession.id)
+     .where(GameSession.user_id == 1, HandHistory.id > 100)),
+    ('дневные итоги за месяц (get_daily_totals)', ('user_daily_stats', 'users'),
+     select(func.sum(UserDailyStats.net)).join(User, User.id == UserDailyStats.user_id)
+     .where(User.telegram_id == 1, UserDailyStats.day >= date(2024, 1, 1))),
+    ('раздачи месяца для архива (archive_month)', ('hand_histories', 'game_sessions', 'users'),
+     select(HandHistory.id, GameSession.user_id, User.telegram_id)
+     .join(GameSession, GameSession.id == HandHistory.session_id)
+     .join(User, User.id == GameSession.user_id)
+     .where(HandHistory.created_at >= datetime(2024, 1, 1), HandHistory.created_at < datetime(2024, 2, 1))),
+    ('удаление заархивированных раздач (archive_month)', ('hand_histories',),
+     delete(HandHistory).where(HandHistory.id.in_([1, 2, 3]))),
+    ('раздачи пользователя для выгрузки (export_hands)', ('hand_histories', 'game_sessions', 'users'),
+     select(HandHistory.id, HandHistory.session_id, User.telegram_id, GameSession.ai_opponent_type,
+            HandHistory.actions)
+     .join(GameSession, GameSession.id == HandHistory.session_id)
+     .join(User, User.id == GameSession.user_id)
+     .where(GameSession.user_id == 1)),
+    ('статистика пользователя для выгрузки (export_stats)', ('user_stats', 'users'),
+     select(User.telegram_id, User.username, UserStats.total_hands_played)
+     .join(User, User.id == UserStats.user_id).where(UserStats.user_id == 1)),
+    ('дневные итоги пользователя для выгрузки (export_daily)', ('user_daily_stats', 'users'),
+     select(User.telegram_id, UserDailyStats.day, UserDailyStats.net)
+     .join(User, User.id == UserDailyStats.user_id).where(UserDailyStats.user_id == 1)),
+    ('очистка дневных итогов пользователя (rollups.backfill)', ('user_daily_stats',),
+     delete(UserDailyStats).where(UserDailyStats.user_id == 1)),
+    ('сессии пользователя для пересборки итогов (rollups.backfill)', ('game_sessions',),
+     select(GameSession.user_id, GameSession.created_at, GameSession.completed_at)
+     .where(GameSession.user_id == 1)),
+    ('раздачи пользователя для пересборки итогов (rollups.backfill)', ('hand_histories', 'game_sessions', 'users'),
+     select(GameSession.user_id, GameSession.ai_opponent_type, User.telegram_id,
+            HandHistory.created_at, HandHistory.result)
+     .join(GameSession, GameSession.id == HandHistory.session_id)
+     .join(User, User.id == GameSession.user_id)
+     .where(GameSession.user_id == 1)),
+    ('последний сегмент битового индекса (HandIndexer)', ('hand_bitmaps',),
+     select(HandBitmap).where(HandBitmap.user_id == 1, HandBitmap.attribute == '_ids', HandBitmap.value == '')
+     .order_by(HandBitmap.segment.desc()).limit(1)),
+    ('битовые карты фильтра (HandIndex.search)', ('hand_bitmaps',),
+     select(HandBitmap.attribute, HandBitmap.value, HandBitmap.segment, HandBitmap.data)
+     .where(HandBitmap.user_id == 1, HandBitmap.attribute.in_(['hand', 'board', '_ids']))),
+    ('уже импортированные раздачи (hh_import)', ('imported_hands',),
+     select(ImportedHand.source_id).where(ImportedHand.user_id == 1, ImportedHand.source_id.in_(['1', '2']))),
+    ('снимок игры (GameStore)', ('game_snapshots',),
+     select(GameSnapshot).where(GameSnapshot.user_id == 'user_1')),
+    ('последние ML-решения (get_training_data)', ('ml_training_data',),
+     text('SELECT features, action, result FROM ml_training_data ORDER BY timestamp DESC LIMIT 10000')),
+)
+
+
+def _compile(engine, statement):
+    if hasattr(statement, 'text'):
+        return statement.text
+    return str(statement.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+
+
+def check_query_plans(engine):
+    """Список (название, план, проблема); проблема None - запрос использует индексы"""
+    tables = set(inspect(engine).get_table_names())
+    results = []
+    with engine.connect() as conn:
+        for name, required_tables, statement in HOT_QUERIES:
+            missing = [table for table in required_tables if table not in tables]
+            if missing:
+                results.append((name, [], f"нет таблицы {', '.join(missing)}"))
+                continue
+            try:
+                rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + _compile(engine, statement)).fetchall()
+            except DBAPIError as e:
+                results.append((name, [], f"запрос не выполняется (схема устарела?): {e.orig}"))
+                continue
+            plan = [row[-1] for row in rows]
+            problem = None
+            for detail in plan:
+                if FULL_SCAN.match(detail):
+                    problem = f"полный просмотр: {detail}"
+                    break
+                if detail.startswith(TEMP_SORT):
+                    problem = f"сортировка без индекса: {detail}"
+                    break
+            results.append((name, plan, problem))
+    return results
+
+
+def main():
+    from app.database import db
+
+    if not db.is_sqlite:
+        print("⚠️ Проверка планов поддерживает только SQLite")
+        return 0
+
+    failed = 0
+    for name, plan, problem in check_query_plans(db.engine):
+        print(f"{'❌' if problem else '✅'} {name}")
+        for detail in plan:
+            print(f"      {detail}")
+        if problem:
+            print(f"   → {problem}")
+            failed += 1
+
+    if failed:
+        print(f"\n💥 Проблемных запросов: {failed}. Выполните: alembic upgrade head")
+        return 1
+    print("\n🎯 Все горячие запросы используют индексы")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Дневные итоги пользователей (user_daily_stats).
+
+DailyRollup копит приращения по (user_id, день) и пишет их upsert'ом
+"колонка + приращение" в транзакции Database.save_hands. Запросы за
+месяц читают не больше ~31 строки по индексу (user_id, day) вместо
+просмотра раздач. backfill() пересобирает итоги из game_sessions и
+hand_histories и колоночного архива потоково, пачками
+(python -m app.rollups). Суммы net - в фишках, в BB переводит вывод
+(poker_engine.format_bb).
+"""
+
+import sys
+import logging
+from datetime import date, datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete
+
+from app.models import GameSession, HandHistory, User, UserDailyStats
+from app.hand_archive import hand_archive
+from app.stats_aggregator import OPPONENT_TYPES
+
+logger = logging.getLogger(__name__)
+
+COUNTER_COLUMNS = ('hands', 'net', 'sessions', 'session_seconds') + tuple(
+    f"{ai_type}_{kind}" for ai_type in OPPONENT_TYPES for kind in ('hands', 'net'))
+
+
+def _upsert_statement(session):
+    """INSERT ... ON CONFLICT (user_id, day) DO UPDATE SET колонка = колонка + excluded"""
+    if session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    statement = insert(UserDailyStats)
+    return statement.on_conflict_do_update(
+        index_elements=[UserDailyStats.user_id, UserDailyStats.day],
+        set_={column: getattr(UserDailyStats, column) + getattr(statement.excluded, column)
+              for column in COUNTER_COLUMNS}
+    )
+
+
+class DailyRollup:
+    """Приращения дневных итогов по пачке раздач и сессий"""
+
+    def __init__(self):
+        self._rows: Dict[Tuple[int, date], Dict[str, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _row(self, user_id: int, day: date) -> Dict[str, int]:
+        row = self._rows.get((user_id, day))
+        if row is None:
+            row = self._rows[(user_id, day)] = dict.fromkeys(COUNTER_COLUMNS, 0)
+        return row
+
+    def add_hand(self, user_id: int, day: date, ai_type: str, net: int):
+        row = self._row(user_id, day)
+        row['hands'] += 1
+        row['net'] += net
+        if ai_type in OPPONENT_TYPES:
+            row[f"{ai_type}_hands"] += 1
+            row[f"{ai_type}_net"] += net
+
+    def add_session(self, user_id: int, day: date, seconds: int = 0):
+        row = self._row(user_id, day)
+        row['sessions'] += 1
+        row['session_seconds'] += seconds
+
+    def add_session_time(self, user_id: int, day: date, seconds: int):
+        """Сессия продлилась (новая раздача): время относится к дню ее начала"""
+        if seconds > 0:
+            self._row(user_id, day)['session_seconds'] += seconds
+
+    def apply(self, session) -> int:
+        """Записать приращения в текущей транзакции (executemany upsert)"""
+        if not self._rows:
+            return 0
+        params = [dict(row, user_id=user_id, day=day) for (user_id, day), row in self._rows.items()]
+        session.execute(_upsert_statement(session), params)
+        written = len(params)
+        self._rows = {}
+        return written
+
+
+def _flush(database, rollup: DailyRollup) -> int:
+    with database.session_scope() as session:
+        return rollup.apply(session)
+
+
+def backfill(database, batch_size: int = 5000, user_id: Optional[int] = None) -> Dict[str, int]:
+    """Пересобрать дневные итоги (всех или одного пользователя по users.id).
+
+    Строки читаются курсором (yield_per), приращения сбрасываются каждые
+    batch_size строк отдельной транзакцией - память не зависит от объема
+    истории. Запускать, пока бот не пишет раздачи: иначе раздачи,
+    сохраненные во время пересборки, могут учесться дважды.
+    """
+    with database.session_scope() as session:
+        statement = delete(UserDailyStats)
+        if user_id is not None:
+            statement = statement.where(UserDailyStats.user_id == user_id)
+        session.execute(statement)
+
+    totals = {'sessions': 0, 'hands': 0, 'rows_written': 0}
+    rollup = DailyRollup()
+    read_session = database.get_session()
+    try:
+        sessions = read_session.query(GameSession.user_id, GameSession.created_at, GameSession.completed_at)
+        if user_id is not None:
+            sessions = sessions.filter(GameSession.user_id == user_id)
+        for owner, created_at, completed_at in sessions.yield_per(batch_size):
+            if created_at is None:
+                continue
+            seconds = int((completed_at - created_at).total_seconds()) if completed_at else 0
+            rollup.add_session(owner, created_at.date(), max(seconds, 0))
+            totals['sessions'] += 1
+            if len(rollup) >= batch_size:
+                totals['rows_written'] += _flush(database, rollup)
+
+        hands = read_session.query(GameSession.user_id, GameSession.ai_opponent_type, User.telegram_id,
+                                   HandHistory.created_at, HandHistory.result)\
+            .join(GameSession, GameSession.id == HandHistory.session_id)\
+            .join(User, User.id == GameSession.user_id)
+        if user_id is not None:
+            hands = hands.filter(GameSession.user_id == user_id)
+        for owner, ai_type, telegram_id, created_at, result in hands.yield_per(batch_size):
+            if created_at is None:
+                continue
+            net = ((result or {}).get('net') or {}).get(f"user_{telegram_id}", 0)
+            rollup.add_hand(owner, created_at.date(), ai_type, net)
+            totals['hands'] += 1
+            if len(rollup) >= batch_size:
+                totals['rows_written'] += _flush(database, rollup)
+    finally:
+        read_session.close()
+
+    # Раздачи прошлых месяцев из колоночного архива
+    for partition in hand_archive.partitions():
+        lo, hi = partition.user_range(user_id) if user_id is not None else (0, len(partition))
+        ai_types = [str(name) for name in partition['ai_types']]
+        for owner, day, ai_code, net in zip(partition['user_id'][lo:hi].tolist(),
+                                            partition['created_at'][lo:hi].astype('datetime64[D]').tolist(),
+                                            partition['ai_type'][lo:hi].tolist(),
+                                            partition['net'][lo:hi].tolist()):
+            rollup.add_hand(owner, day, ai_types[ai_code], net)
+            totals['hands'] += 1
+            if len(rollup) >= batch_size:
+                totals['rows_written'] += _flush(database, rollup)
+
+    totals['rows_written'] += _flush(database, rollup)
+    logger.info(f"Дневные итоги пересобраны: {totals}")
+    return totals
+
+
+def main():
+    from app.database import db
+
+    db.init_db()
+    started = datetime.now()
+    totals = backfill(db)
+    print(f"✅ Сессий: {totals['sessions']}, раздач: {totals['hands']}, "
+          f"записано строк: {totals['rows_written']} за {(datetime.now() - started).total_seconds():.1f} с")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,23 @@
+import math
 import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from app.database import db
+from app.opponent_tracker import PlayerTendencies
+from app.stats_engine import analyze_columns, build_columns, concat_columns, MIN_HANDS_FOR_LEAKS
+from app.poker_engine import BIG_BLIND, format_bb
+from app.hand_archive import hand_archive
 
 logger = logging.getLogger(__name__)
 
 class StatisticsManager:
-    def __init__(self):
+    def __init__(self, max_cached_users: int = 256):
         self.db = db
+        # Колонки раздач последних пользователей: telegram_id -> (HandColumns, id последней раздачи)
+        self.max_cached_users = max_cached_users
+        self._columns = OrderedDict()
+        self._columns_lock = threading.Lock()
     
     def get_user_stats(self, telegram_id: int):
         """Полная статистика пользователя"""
@@ -22,10 +33,18 @@ class StatisticsManager:
             total_sessions = user_stats['total_sessions'] if user_stats else 0
             total_profit = user_stats['total_profit'] if user_stats else 0
             
-            # Более реалистичные расчеты
+            # Итоги за 30 дней из дневных сводок (не больше 31 строки)
+            month = self.db.get_daily_totals(telegram_id, datetime.utcnow().date() - timedelta(days=30))
+            
+            # Показатели по логам раздач (пересчет только при новых раздачах)
+            analysis = self._get_hand_analysis(telegram_id, user_info['id'], total_hands)
             win_rate = self._calculate_win_rate(total_hands, total_profit)
-            vpip, pfr = self._calculate_vpip_pfr(telegram_id)
-            aggression = self._calculate_aggression_factor(telegram_id)
+            if analysis.get('hands'):
+                vpip, pfr = f"{analysis['vpip']:.0%}", f"{analysis['pfr']:.0%}"
+                aggression = self._format_aggression(analysis['aggression'])
+            else:
+                vpip, pfr = self._calculate_vpip_pfr(user_stats)
+                aggression = self._calculate_aggression_factor(user_stats)
             
             return {
                 'level': user_info.get('level', 'beginner'),
@@ -36,11 +55,11 @@ class StatisticsManager:
                 'vpip': vpip,
                 'pfr': pfr,
                 'aggression': aggression,
-                'best_hand': self._get_best_hand(telegram_id),
-                'worst_leak': self._identify_leak(telegram_id),
-                'monthly_progress': self._get_monthly_progress(telegram_id),
-                'favorite_opponent': self._get_favorite_opponent(telegram_id),
-                'session_time_avg': self._get_avg_session_time(telegram_id)
+                'best_hand': self._get_best_hand(analysis),
+                'worst_leak': self._identify_leak(analysis),
+                'monthly_progress': self._get_monthly_progress(month),
+                'favorite_opponent': self._get_favorite_opponent(analysis),
+                'session_time_avg': self._get_avg_session_time(month)
             }
             
         except Exception as e:
@@ -48,48 +67,91 @@ class StatisticsManager:
             return self._get_default_stats()
     
     def _calculate_win_rate(self, hands: int, profit: int) -> str:
-        """Расчет винрейта"""
+        """Расчет винрейта в BB/100 (profit - в фишках)"""
         if hands == 0:
-            return "0%"
-        win_rate = (profit / hands) * 100
-        return f"{win_rate:+.1f}%"
+            return "0 BB/100"
+        win_rate = profit / BIG_BLIND / hands * 100
+        return f"{win_rate:+.1f} BB/100"
+    
+    def _calculate_vpip_pfr(self, user_stats: dict) -> tuple:
+        """Расчет VPIP/PFR по счетчикам UserStats (их сбрасывают игровые воркеры)"""
+        tendencies = PlayerTendencies(user_stats)
+        return f"{tendencies.vpip:.0%}", f"{tendencies.pfr:.0%}"
+    
+    def _calculate_aggression_factor(self, user_stats: dict) -> str:
+        """Коэффициент агрессии по счетчикам UserStats"""
+        return self._format_aggression(PlayerTendencies(user_stats).aggression_factor)
     
-    def _calculate_vpip_pfr(self, telegram_id: int) -> tuple:
-        """Расчет VPIP/PFR (заглушки)"""
-        # В реальности нужно анализировать историю рук
-        return "28%", "22%"
+    def _format_aggression(self, value: float) -> str:
+        """AF без коллов на постфлопе - бесконечность"""
+        return "∞" if math.isinf(value) else f"{value:.1f}"
     
-    def _calculate_aggression_factor(self, telegram_id: int) -> str:
-        """Коэффициент агрессии"""
-        return "1.8"
+    def _get_hand_analysis(self, telegram_id: int, user_id: int, total_hands: int) -> dict:
+        """Результат StatsEngine из кэша, пересчет при изменении числа раздач"""
+        cached = self.db.user_cache.get(telegram_id, 'hand_stats')
+        if cached is not None and cached.get('total_hands') == total_hands:
+            return cached
+        if total_hands == 0:
+            return {'hands': 0}
+        analysis = analyze_columns(self._get_columns(telegram_id, user_id))
+        analysis['total_hands'] = total_hands
+        self.db.user_cache.put(telegram_id, 'hand_stats', analysis)
+        return analysis
+    
+    def _get_columns(self, telegram_id: int, user_id: int):
+        """Колонки всех раздач пользователя: из hand_histories разбираются только новые.
+        
+        Первая сборка - колоночный архив прошлых месяцев и живые строки,
+        дальше дописываются раздачи с id больше последнего учтенного.
+        Архивация переносит уже учтенные раздачи, поэтому колонки остаются верны.
+        """
+        with self._columns_lock:
+            cached = self._columns.get(telegram_id)
+        columns, last_id = cached if cached is not None else (None, 0)
+        rows = self.db.get_user_hand_rows(telegram_id, after_id=last_id)
+        if rows or columns is None:
+            added = build_columns([row[1:] for row in rows], telegram_id)
+            if columns is None:
+                archived = hand_archive.user_columns(user_id)
+                columns = concat_columns([archived, added]) if archived is not None else added
+            else:
+                columns = concat_columns([columns, added])
+            last_id = max([last_id] + [row[0] for row in rows])
+        with self._columns_lock:
+            self._columns[telegram_id] = (columns, last_id)
+            self._columns.move_to_end(telegram_id)
+            while len(self._columns) > self.max_cached_users:
+                self._columns.popitem(last=False)
+        return columns
     
-    def _get_best_hand(self, telegram_id: int) -> str:
-        """Лучшая сыгранная рука"""
-        return "A♠ A♥"
+    def _get_best_hand(self, analysis: dict) -> str:
+        """Лучшая сыгранная рука (сильнейшая комбинация на выигранном вскрытии)"""
+        best = analysis.get('best_hand')
+        if not best:
+            return "N/A"
+        return f"{best['cards']} ({best['hand_type']}, {format_bb(best['net'], signed=True)})"
     
-    def _identify_leak(self, telegram_id: int) -> str:
+    def _identify_leak(self, analysis: dict) -> str:
         """Идентификация основной утечки"""
-        leaks = [
-            "Слишком много блефов",
-            "Пассивная игра на постфлопе", 
-            "Игра вне позиции",
-            "Недостаточная агрессия с сильными руками",
-            "Слишком тайтовый префлоп"
-        ]
-        return leaks[telegram_id % len(leaks)]
+        leaks = analysis.get('leaks')
+        if leaks is None or analysis.get('hands', 0) < MIN_HANDS_FOR_LEAKS:
+            return "Недостаточно данных"
+        return leaks[0] if leaks else "Явных утечек не найдено"
     
-    def _get_monthly_progress(self, telegram_id: int) -> str:
-        """Прогресс за месяц"""
-        return "+125 BB"
+    def _get_monthly_progress(self, month: dict) -> str:
+        """Прогресс за месяц в BB (дневные итоги хранят фишки)"""
+        return format_bb(month['net'], signed=True) if month['hands'] else "0 BB"
     
-    def _get_favorite_opponent(self, telegram_id: int) -> str:
-        """Любимый оппонент"""
-        opponents = ["Fish AI", "Nit AI", "TAG AI", "LAG AI"]
-        return opponents[telegram_id % len(opponents)]
+    def _get_favorite_opponent(self, analysis: dict) -> str:
+        """Любимый оппонент (больше всего раздач)"""
+        opponents = {'fish': "Fish AI", 'nit': "Nit AI", 'tag': "TAG AI", 'lag': "LAG AI", 'equity': "Equity AI"}
+        return opponents.get(analysis.get('favorite_opponent'), "N/A")
     
-    def _get_avg_session_time(self, telegram_id: int) -> str:
-        """Среднее время сессии"""
-        return "25 мин"
+    def _get_avg_session_time(self, month: dict) -> str:
+        """Среднее время сессии за месяц"""
+        if not month['sessions']:
+            return "0 мин"
+        return f"{round(month['session_seconds'] / month['sessions'] / 60)} мин"
     
     def _get_default_stats(self):
         return {
@@ -97,7 +159,7 @@ class StatisticsManager:
             'total_hands': 0,
             'total_sessions': 0,
             'total_profit': 0,
-            'win_rate': "0%",
+            'win_rate': "0 BB/100",
             'vpip': "0%",
             'pfr': "0%",
             'aggression': "0.0",
@@ -116,7 +178,7 @@ class StatisticsManager:
 🎓 **Уровень:** {stats['level'].title()}
 🃏 **Сыграно рук:** {stats['total_hands']}
 🏆 **Сессий:** {stats['total_sessions']}
-💰 **Общий результат:** {stats['total_profit']} BB
+💰 **Общий результат:** {format_bb(stats['total_profit'], signed=True)}
 
 📈 **Ключевые метрики:**
 • 🎯 **Винрейт:** {stats['win_rate']}
@@ -0,0 +1,120 @@
+import logging
+from datetime import datetime
+from typing import Any, Dict, List
+
+from sqlalchemy import func
+
+from app.models import UserStats
+from app.game_codec import AI_TYPES
+from app.poker_engine import BIG_BLIND
+from app.opponent_tracker import COUNTER_FIELDS
+from app.hand_analyzer import hand_analyzer, history_analyzer
+
+logger = logging.getLogger(__name__)
+
+# Типы AI, для которых в UserStats есть колонки vs_<тип>_* (и <тип>_* в user_daily_stats)
+OPPONENT_TYPES = AI_TYPES
+
+_RANK_ORDER = {rank: order for order, rank in enumerate('23456789TJQKA')}
+
+
+def analyze_hand(hand: Dict[str, Any]) -> Dict[str, Any]:
+    """Анализ решений пользователя в раздаче (HandHistoryAnalyzer)"""
+    player = f"user_{hand['telegram_id']}"
+    cards = hand['hole_cards'].get(player) or []
+    strength = 0.5
+    if len(cards) == 2:
+        ranks = sorted((card[:-1] for card in cards), key=_RANK_ORDER.get, reverse=True)
+        strength = hand_analyzer.hand_strengths.get(tuple(ranks), 0.5)
+    preflop_action = next((event['action'] for event in hand['actions']
+                           if event['player'] == player and event['street'] == 'preflop'
+                           and event['action'] not in ('small_blind', 'big_blind')), '')
+    analysis = history_analyzer.analyze_completed_hand({
+        'hand_strength': strength,
+        'preflop_action': preflop_action,
+        'position': hand['positions'].get(player, ''),
+    })
+    analysis['mistakes'] = analysis.get('preflop_mistakes', []) + analysis.get('postflop_mistakes', [])
+    return analysis
+
+
+class StatsAggregator:
+    """Приращения UserStats по пачке раздач.
+
+    Database.save_hands добавляет каждую сохраненную раздачу, затем
+    apply() пишет по одному UPDATE на пользователя в той же транзакции.
+    Счетчики увеличиваются выражениями SQL (колонка + приращение), так
+    что параллельные писатели из разных процессов не теряют обновления,
+    а чтение статистики остается O(1) независимо от длины истории.
+    """
+
+    def __init__(self):
+        self._deltas: Dict[int, Dict[str, int]] = {}
+        self._mistakes: Dict[int, Dict[str, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._deltas)
+
+    def add_hand(self, user_id: int, hand: Dict[str, Any], new_session: bool = False,
+                 analysis: Dict[str, Any] = None):
+        """Учесть раздачу пользователя"""
+        delta = self._deltas.setdefault(user_id, {})
+        net = hand['result']['net'].get(f"user_{hand['telegram_id']}", 0)
+
+        def bump(field, value):
+            delta[field] = delta.get(field, 0) + value
+
+        bump('total_hands_played', 1)
+        bump('total_profit', net)
+        if new_session:
+            bump('total_sessions', 1)
+        if hand['ai_type'] in OPPONENT_TYPES:
+            bump(f"vs_{hand['ai_type']}_hands", 1)
+            bump(f"vs_{hand['ai_type']}_profit", net)
+        # Счетчики стиля игры за раздачу (OpponentTracker.take_hand)
+        for field, value in (hand.get('tendencies') or {}).items():
+            if field in COUNTER_FIELDS:
+                bump(field, value)
+
+        if analysis:
+            mistakes = self._mistakes.setdefault(user_id, {})
+            for mistake in analysis.get('mistakes', []):
+                mistakes[mistake] = mistakes.get(mistake, 0) + 1
+
+    @staticmethod
+    def _winrate(hands_field: str, profit_field: str, delta: Dict[str, int]):
+        """BB/100 после приращения (profit - в фишках), одним выражением SQL"""
+        hands = func.coalesce(getattr(UserStats, hands_field), 0) + delta[hands_field]
+        profit = func.coalesce(getattr(UserStats, profit_field), 0) + delta[profit_field]
+        return profit * 100.0 / BIG_BLIND / hands
+
+    def apply(self, session) -> List[int]:
+        """Записать приращения в текущей транзакции, вернуть user_id"""
+        for user_id, delta in self._deltas.items():
+            values = {
+                getattr(UserStats, field): func.coalesce(getattr(UserStats, field), 0) + value
+                for field, value in delta.items()
+            }
+            # Все раздачи тренажера - кэш-игра
+            values[UserStats.cash_winrate] = self._winrate('total_hands_played', 'total_profit', delta)
+            for ai_type in OPPONENT_TYPES:
+                if f"vs_{ai_type}_hands" in delta:
+                    values[getattr(UserStats, f"vs_{ai_type}_winrate")] = \
+                        self._winrate(f"vs_{ai_type}_hands", f"vs_{ai_type}_profit", delta)
+            values[UserStats.last_updated] = datetime.utcnow()
+            session.query(UserStats).filter(UserStats.user_id == user_id)\
+                .update(values, synchronize_session=False)
+
+        # Ошибки - словарь {ошибка: количество}, JSON обновляется чтением в той же транзакции
+        for user_id, mistakes in self._mistakes.items():
+            if not mistakes:
+                continue
+            stats = session.query(UserStats).filter(UserStats.user_id == user_id).first()
+            if stats is None:
+                continue
+            common = dict(stats.common_mistakes) if isinstance(stats.common_mistakes, dict) else {}
+            for mistake, count in mistakes.items():
+                common[mistake] = common.get(mistake, 0) + count
+            stats.common_mistakes = common
+
+        return list(self._deltas)
@@ -0,0 +1,278 @@
+"""
+Статистика игрока по сохраненным логам раздач.
+
+Раздачи пользователя раскладываются в колонки NumPy: массивы по
+раздачам (результат, вскрытие, тип AI, комбинация) и по событиям
+лога (номер раздачи, улица, действие, кто ходил). Все показатели
+(VPIP, PFR, 3-бет, AF, WTSD, W$SD, фолд на рейз, BB/100) считаются
+векторно, без цикла по раздачам, поэтому полный пересчет для 100k
+раздач занимает доли секунды; дольше всего - разбор JSON из БД.
+Архивные раздачи приходят готовыми колонками из app.hand_archive
+(срезы memmap) и склеиваются с живыми через concat_columns.
+"""
+
+import math
+import logging
+from itertools import chain, repeat
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.game_codec import ACTIONS, AI_TYPES, CARDS, EMPTY, STREETS
+from app.poker_engine import BIG_BLIND, HandType
+
+logger = logging.getLogger(__name__)
+
+_ACTION_CODES = {name: code for code, name in enumerate(ACTIONS)}
+_STREET_CODES = {name: code for code, name in enumerate(STREETS)}
+_AI_CODES = {name: code for code, name in enumerate(AI_TYPES)}
+_HAND_TYPES = {hand_type.name: hand_type.value for hand_type in HandType}
+_CARD_CODES = {str(card): card.code for card in CARDS}
+_NO_CARDS = (EMPTY, EMPTY)
+
+CALL = _ACTION_CODES['call']
+RAISE = _ACTION_CODES['raise']
+ALL_IN = _ACTION_CODES['all_in']
+FOLD = _ACTION_CODES['fold']
+PREFLOP = _STREET_CODES['preflop']
+
+HAND_TYPE_NAMES = {
+    'HIGH_CARD': 'Старшая карта',
+    'ONE_PAIR': 'Пара',
+    'TWO_PAIR': 'Две пары',
+    'THREE_OF_A_KIND': 'Сет',
+    'STRAIGHT': 'Стрит',
+    'FLUSH': 'Флеш',
+    'FULL_HOUSE': 'Фулл-хаус',
+    'FOUR_OF_A_KIND': 'Каре',
+    'STRAIGHT_FLUSH': 'Стрит-флеш',
+    'ROYAL_FLUSH': 'Роял-флеш',
+}
+
+# Меньше раздач - утечки не ищем
+MIN_HANDS_FOR_LEAKS = 30
+
+# (показатель, нижняя граница, верхняя граница, текст ниже, текст выше, знаменатель)
+LEAK_RULES = (
+    ('vpip', 0.20, 0.45, "Слишком тайтовый префлоп", "Слишком много рук на префлопе", 'hands'),
+    ('pfr_to_vpip', 0.45, 1.01, "Пассивный префлоп: коллы вместо рейзов", None, 'vpip_hands'),
+    ('aggression', 1.0, 4.0, "Пассивная игра на постфлопе", "Слишком много блефов", 'postflop_actions'),
+    ('wtsd', 0.20, 0.45, "Слишком часто сдаетесь до вскрытия", "Слишком часто доходите до вскрытия", 'saw_flop'),
+    ('wsd', 0.45, 1.01, "Проигрываете на вскрытии: коллы со слабыми руками", None, 'showdowns'),
+    ('fold_to_raise', 0.0, 0.60, None, "Часто сбрасываете на рейз", 'raises_faced'),
+)
+
+
+class HandColumns:
+    """Раздачи пользователя в колоночном виде (hole_cards - коды карт n x 2, EMPTY - нет карты)"""
+
+    __slots__ = ('net', 'showdown', 'won', 'ai_type', 'hand_type', 'hole_cards',
+                 'event_hand', 'event_street', 'event_action', 'event_user')
+
+    def __init__(self, net, showdown, won, ai_type, hand_type, hole_cards,
+                 event_hand, event_street, event_action, event_user):
+        self.net = net
+        self.showdown = showdown
+        self.won = won
+        self.ai_type = ai_type
+        self.hand_type = hand_type
+        self.hole_cards = hole_cards
+        self.event_hand = event_hand
+        self.event_street = event_street
+        self.event_action = event_action
+        self.event_user = event_user
+
+    def __len__(self) -> int:
+        return len(self.net)
+
+
+def build_columns(rows: Iterable[Tuple[str, Dict, List, Dict]], telegram_id: int) -> HandColumns:
+    """Колонки из строк (ai_type, hole_cards, actions, result) одного пользователя"""
+    player = f"user_{telegram_id}"
+    rows = list(rows)
+    if not rows:
+        ai_types, hole_cards, actions, results = (), (), (), ()
+    else:
+        ai_types, hole_cards, actions, results = zip(*rows)
+    results = [result or {} for result in results]
+    actions = [hand_actions or () for hand_actions in actions]
+    winners = [result.get('winners') or () for result in results]
+    won = [player in hand_winners for hand_winners in winners]
+
+    # События всех раздач одним плоским списком, коды - через map без цикла Python
+    events = list(chain.from_iterable(actions))
+    event_hand = np.repeat(np.arange(len(actions), dtype=np.int32),
+                           np.fromiter(map(len, actions), dtype=np.int32, count=len(actions)))
+
+    return HandColumns(
+        np.fromiter(((result.get('net') or {}).get(player, 0) for result in results),
+                    dtype=np.int32, count=len(results)),
+        np.fromiter((bool(result.get('showdown')) for result in results), dtype=bool, count=len(results)),
+        np.array(won, dtype=bool),
+        np.fromiter(map(_AI_CODES.get, ai_types, repeat(-1)), dtype=np.int8, count=len(ai_types)),
+        np.fromiter((_HAND_TYPES.get(result.get('winning_hand'), 0) if user_won else 0
+                     for result, user_won in zip(results, won)), dtype=np.int8, count=len(results)),
+        _card_matrix([(cards or {}).get(player) for cards in hole_cards]),
+        event_hand,
+        np.fromiter(map(_STREET_CODES.get, map(itemgetter('street'), events), repeat(0)),
+                    dtype=np.int8, count=len(events)),
+        np.fromiter(map(_ACTION_CODES.get, map(itemgetter('action'), events), repeat(0)),
+                    dtype=np.int8, count=len(events)),
+        np.fromiter(map(player.__eq__, map(itemgetter('player'), events)), dtype=bool, count=len(events)),
+    )
+
+
+def _card_matrix(hands: List[Optional[List[str]]]) -> np.ndarray:
+    """Карманные карты текстом -> коды uint8 (n x 2)"""
+    codes = np.fromiter(chain.from_iterable(
+        (_CARD_CODES.get(card, EMPTY) for card in cards) if cards and len(cards) == 2 else _NO_CARDS
+        for cards in hands), dtype=np.uint8, count=2 * len(hands))
+    return codes.reshape(len(hands), 2)
+
+
+def cards_text(codes: Iterable[int]) -> str:
+    return ' '.join(str(CARDS[code]) for code in codes if code != EMPTY)
+
+
+def concat_columns(parts: List[HandColumns]) -> HandColumns:
+    """Склеить колонки (архивные месяцы и живые раздачи); одна часть возвращается как есть"""
+    parts = [part for part in parts if len(part)] or parts[:1]
+    if len(parts) == 1:
+        return parts[0]
+    offsets = np.cumsum([0] + [len(part) for part in parts[:-1]])
+    return HandColumns(*(
+        np.concatenate([part.event_hand + offset for part, offset in zip(parts, offsets)])
+        if name == 'event_hand' else np.concatenate([getattr(part, name) for part in parts])
+        for name in HandColumns.__slots__
+    ))
+
+
+def _ratio(part: int, total: int) -> float:
+    return part / total if total else 0.0
+
+
+def _hands_with(columns: HandColumns, mask: np.ndarray) -> np.ndarray:
+    """Булев массив по раздачам: есть ли в раздаче событие из mask"""
+    flags = np.zeros(len(columns), dtype=bool)
+    flags[columns.event_hand[mask]] = True
+    return flags
+
+
+def compute_stats(columns: HandColumns) -> Dict[str, Any]:
+    """Показатели игрока (доли 0..1, AF - отношение)"""
+    hands = len(columns)
+    if hands == 0:
+        return {'hands': 0}
+
+    hand = columns.event_hand
+    street = columns.event_street
+    action = columns.event_action
+    user = columns.event_user
+    preflop = street == PREFLOP
+    aggressive = (action == RAISE) | (action == ALL_IN)
+
+    vpip = _hands_with(columns, user & preflop & ((action == CALL) | aggressive))
+    pfr = _hands_with(columns, user & preflop & aggressive)
+
+    # Предыдущее событие той же раздачи: рейз AI (для 3-бета и фолда на рейз)
+    prev_ai_raise = np.zeros(len(hand), dtype=bool)
+    if len(hand) > 1:
+        prev_ai_raise[1:] = (hand[1:] == hand[:-1]) & ~user[:-1] & aggressive[:-1]
+    facing_raise = user & prev_ai_raise
+    three_bet_spots = _hands_with(columns, facing_raise & preflop)
+    three_bets = _hands_with(columns, facing_raise & preflop & aggressive)
+
+    postflop_user = user & ~preflop
+    postflop_aggressive = int(np.count_nonzero(postflop_user & aggressive))
+    postflop_calls = int(np.count_nonzero(postflop_user & (action == CALL)))
+
+    saw_flop = _hands_with(columns, ~preflop)
+    showdowns = columns.showdown & saw_flop
+    won_showdowns = showdowns & columns.won
+
+    vpip_hands = int(np.count_nonzero(vpip))
+    saw_flop_hands = int(np.count_nonzero(saw_flop))
+    showdown_hands = int(np.count_nonzero(showdowns))
+    raises_faced = int(np.count_nonzero(facing_raise))
+
+    return {
+        'hands': hands,
+        'profit': int(columns.net.sum()),
+        'bb_per_100': float(columns.net.sum()) / BIG_BLIND * 100 / hands,
+        'vpip_hands': vpip_hands,
+        'vpip': vpip_hands / hands,
+        'pfr': int(np.count_nonzero(pfr)) / hands,
+        'pfr_to_vpip': _ratio(int(np.count_nonzero(pfr & vpip)), vpip_hands),
+        'three_bet': _ratio(int(np.count_nonzero(three_bets)), int(np.count_nonzero(three_bet_spots))),
+        'postflop_actions': postflop_aggressive + postflop_calls,
+        # Без коллов AF не определен: агрессия без коллов - бесконечность, а не число действий
+        'aggression': postflop_aggressive / postflop_calls if postflop_calls
+        else (math.inf if postflop_aggressive else 0.0),
+        'saw_flop': saw_flop_hands,
+        'wtsd': _ratio(showdown_hands, saw_flop_hands),
+        'showdowns': showdown_hands,
+        'wsd': _ratio(int(np.count_nonzero(won_showdowns)), showdown_hands),
+        'raises_faced': raises_faced,
+        'fold_to_raise': _ratio(int(np.count_nonzero(facing_raise & (action == FOLD))), raises_faced),
+    }
+
+
+def find_leaks(stats: Dict[str, Any]) -> List[Tuple[float, str]]:
+    """Утечки по убыванию серьезности: (отклонение от нормы, описание)"""
+    if stats.get('hands', 0) < MIN_HANDS_FOR_LEAKS:
+        return []
+    leaks = []
+    for name, low, high, low_text, high_text, sample in LEAK_RULES:
+        if stats.get(sample, 0) < MIN_HANDS_FOR_LEAKS // 3:
+            continue
+        value = stats[name]
+        if not math.isfinite(value):
+            continue
+        if low_text and value < low:
+            leaks.append(((low - value) / max(low, 0.01), low_text))
+        elif high_text and value > high:
+            leaks.append(((value - high) / max(high, 0.01), high_text))
+    leaks.sort(reverse=True)
+    return leaks
+
+
+def best_hand(columns: HandColumns) -> Optional[Dict[str, Any]]:
+    """Сильнейшая комбинация, с которой пользователь выиграл вскрытие"""
+    if len(columns) == 0 or not columns.hand_type.any():
+        return None
+    # Сильнейшая комбинация, среди равных - самый большой выигрыш
+    order = np.lexsort((columns.net, columns.hand_type))
+    index = int(order[-1])
+    name = HandType(int(columns.hand_type[index])).name
+    return {
+        'cards': cards_text(columns.hole_cards[index]),
+        'hand_type': HAND_TYPE_NAMES.get(name, name),
+        'net': int(columns.net[index]),
+    }
+
+
+def favorite_opponent(columns: HandColumns) -> Optional[str]:
+    """Тип AI, против которого сыграно больше всего раздач"""
+    known = columns.ai_type[columns.ai_type >= 0]
+    if len(known) == 0:
+        return None
+    return AI_TYPES[int(np.bincount(known).argmax())]
+
+
+def analyze_columns(columns: HandColumns) -> Dict[str, Any]:
+    """Показатели, утечки, лучшая рука и любимый оппонент по готовым колонкам"""
+    stats = compute_stats(columns)
+    stats['leaks'] = [text for _, text in find_leaks(stats)]
+    stats['best_hand'] = best_hand(columns)
+    stats['favorite_opponent'] = favorite_opponent(columns)
+    return stats
+
+
+def analyze_user(rows: Iterable[Tuple[str, Dict, List, Dict]], telegram_id: int,
+                 archived: Optional[HandColumns] = None) -> Dict[str, Any]:
+    """Полный пересчет из строк раздач (и архивных колонок)"""
+    columns = build_columns(rows, telegram_id)
+    if archived is not None:
+        columns = concat_columns([archived, columns])
+    return analyze_columns(columns)
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _UserActor:
+    """Очередь задач одного пользователя"""
+
+    __slots__ = ('jobs', 'task', 'pending_keys', 'used_keys')
+
+    def __init__(self, used_keys: int):
+        self.jobs = deque()
+        self.task: Optional[asyncio.Task] = None
+        # Ключи обновлений в очереди: повторное нажатие той же кнопки отклоняется
+        self.pending_keys = set()
+        # Одноразовые ключи (игровая клавиатура) помнятся и после обработки
+        self.used_keys = deque(maxlen=used_keys)
+
+
+class UserActors:
+    """Последовательная обработка обновлений каждого пользователя.
+
+    У каждого пользователя своя очередь и своя задача-обработчик, поэтому
+    его обновления выполняются строго по порядку, а разные пользователи -
+    параллельно, без общей блокировки. Все вызовы происходят в потоке
+    event loop, синхронизация не нужна.
+    """
+
+    def __init__(self, max_pending: int = 4, used_keys: int = 32, max_idle_actors: int = 10000):
+        self.max_pending = max_pending
+        self.used_keys = used_keys
+        self.max_idle_actors = max_idle_actors
+        self._actors: Dict[str, _UserActor] = {}
+        # Пользователи без задач в порядке освобождения, самые давние - в начале
+        self._idle: "OrderedDict[str, None]" = OrderedDict()
+        self.accepted = 0
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._actors)
+
+    def submit(self, user_id: str, key: Optional[Hashable], job: Callable[[], Awaitable],
+               one_shot: bool = False) -> bool:
+        """Поставить задачу в очередь пользователя.
+
+        Возвращает False, если обновление с таким ключом уже ждет
+        обработки (двойное нажатие), одноразовый ключ уже был принят
+        или очередь пользователя переполнена.
+        """
+        actor = self._actors.get(user_id)
+        if actor is None:
+            actor = _UserActor(self.used_keys)
+            self._actors[user_id] = actor
+
+        duplicate = key is not None and (key in actor.pending_keys or key in actor.used_keys)
+        if duplicate or len(actor.jobs) >= self.max_pending:
+            self.rejected += 1
+            if actor.task is None:
+                self._set_idle(user_id)
+            return False
+
+        if key is not None:
+            actor.pending_keys.add(key)
+            if one_shot:
+                actor.used_keys.append(key)
+        actor.jobs.append((key, job))
+        self.accepted += 1
+        if actor.task is None:
+            self._idle.pop(user_id, None)
+            actor.task = asyncio.get_running_loop().create_task(self._run(user_id, actor))
+        return True
+
+    async def _run(self, user_id: str, actor: _UserActor):
+        """Выполнить задачи пользователя по очереди"""
+        try:
+            while actor.jobs:
+                key, job = actor.jobs.popleft()
+                try:
+                    await job()
+                except Exception as e:
+                    logger.error(f"Ошибка обработки обновления пользователя {user_id}: {e}")
+                finally:
+                    actor.pending_keys.discard(key)
+        finally:
+            actor.task = None
+            self._set_idle(user_id)
+
+    def _set_idle(self, user_id: str):
+        """Отметить пользователя свободным и забыть самых давних свободных сверх лимита"""
+        self._idle[user_id] = None
+        self._idle.move_to_end(user_id)
+        while len(self._idle) > self.max_idle_actors:
+            idle_user, _ = self._idle.popitem(last=False)
+            del self._actors[idle_user]
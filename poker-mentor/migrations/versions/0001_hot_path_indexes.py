@@ -0,0 +1,50 @@
+"""Индексы для горячих запросов
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 12:00:00
+
+Базовая схема - таблицы, созданные Database.init_db и DataPipeline.
+Индексы создаются с IF NOT EXISTS: новые базы получают их уже при
+init_db, миграция нужна для баз, созданных раньше.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (индекс, таблица, колонки)
+INDEXES = (
+    # Database.save_hands: последняя сессия пользователя против AI
+    ('ix_game_sessions_user_ai', 'game_sessions', ['user_id', 'ai_opponent_type', 'id']),
+    ('ix_hand_histories_session_hand', 'hand_histories', ['session_id', 'hand_number']),
+    # DataPipeline.get_training_data: ORDER BY timestamp DESC LIMIT ?
+    ('ix_ml_training_data_timestamp', 'ml_training_data', ['timestamp']),
+)
+
+
+def _existing_tables():
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade() -> None:
+    tables = _existing_tables()
+    for name, table, columns in INDEXES:
+        # ml_training_data создает DataPipeline вместе с индексом
+        if table in tables:
+            op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade() -> None:
+    tables = _existing_tables()
+    for name, table, _ in reversed(INDEXES):
+        if table in tables:
+            op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,44 @@
+"""Раздачи и результат по типам AI в user_stats
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 14:00:00
+
+Колонки для инкрементального winrate (StatsAggregator).
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = tuple(f"vs_{ai_type}_{kind}" for ai_type in ('fish', 'nit', 'tag', 'lag')
+                for kind in ('hands', 'profit'))
+
+
+def _existing_columns():
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns('user_stats')}
+
+
+def upgrade() -> None:
+    # Database.init_db мог уже добавить колонки
+    existing = _existing_columns()
+    with op.batch_alter_table('user_stats') as batch_op:
+        for name in COLUMNS:
+            if name not in existing:
+                batch_op.add_column(sa.Column(name, sa.Integer(), server_default='0'))
+
+
+def downgrade() -> None:
+    existing = _existing_columns()
+    with op.batch_alter_table('user_stats') as batch_op:
+        for name in reversed(COLUMNS):
+            if name in existing:
+                batch_op.drop_column(name)
@@ -0,0 +1,42 @@
+"""Дневные итоги пользователей
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 16:00:00
+
+Таблица user_daily_stats (app.rollups). После миграции заполнить ее
+по существующей истории: python -m app.rollups
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COUNTER_COLUMNS = ('hands', 'net', 'sessions', 'session_seconds') + tuple(
+    f"{ai_type}_{kind}" for ai_type in ('fish', 'nit', 'tag', 'lag') for kind in ('hands', 'net'))
+
+
+def upgrade() -> None:
+    if 'user_daily_stats' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'user_daily_stats',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('day', sa.Date(), nullable=False),
+            *[sa.Column(name, sa.Integer(), server_default='0') for name in COUNTER_COLUMNS],
+        )
+    op.create_index('ux_user_daily_stats_user_day', 'user_daily_stats', ['user_id', 'day'],
+                    unique=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ux_user_daily_stats_user_day', table_name='user_daily_stats', if_exists=True)
+    op.drop_table('user_daily_stats')
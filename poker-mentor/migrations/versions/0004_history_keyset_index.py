@@ -0,0 +1,28 @@
+"""Индекс keyset-пагинации истории сессий
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 18:00:00
+
+HistoryManager листает сессии по (user_id, created_at, id).
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_game_sessions_user_created', 'game_sessions', ['user_id', 'created_at', 'id'],
+                    if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_game_sessions_user_created', table_name='game_sessions', if_exists=True)
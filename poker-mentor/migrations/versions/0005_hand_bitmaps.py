@@ -0,0 +1,42 @@
+"""Битовый индекс раздач
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 20:00:00
+
+Таблица hand_bitmaps (app.hand_index). После миграции построить индекс
+по существующей истории: python -m app.hand_index
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if 'hand_bitmaps' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'hand_bitmaps',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('attribute', sa.String(20), nullable=False),
+            sa.Column('value', sa.String(20), nullable=False),
+            sa.Column('segment', sa.Integer(), nullable=False),
+            sa.Column('cardinality', sa.Integer()),
+            sa.Column('data', sa.LargeBinary()),
+        )
+    op.create_index('ux_hand_bitmaps_key', 'hand_bitmaps', ['user_id', 'attribute', 'value', 'segment'],
+                    unique=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ux_hand_bitmaps_key', table_name='hand_bitmaps', if_exists=True)
+    op.drop_table('hand_bitmaps')
@@ -0,0 +1,27 @@
+"""Индекс выборки месяца для архива раздач
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 22:00:00
+
+app.hand_archive выбирает раздачи месяца по created_at.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_hand_histories_created', 'hand_histories', ['created_at'], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_hand_histories_created', table_name='hand_histories', if_exists=True)
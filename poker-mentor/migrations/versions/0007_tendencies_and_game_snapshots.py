@@ -0,0 +1,64 @@
+"""Счетчики стиля игры в user_stats и снимки игр
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-20 10:00:00
+
+Колонки OpponentTracker в user_stats и таблица game_snapshots (GameStore).
+Раньше их создавал только Database.init_db, поэтому база, обновленная
+одной миграцией, расходилась с app/models.py.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COUNTER_COLUMNS = (
+    'tracked_hands',
+    'vpip_hands',
+    'pfr_hands',
+    'three_bet_opportunities',
+    'three_bets',
+    'aggressive_actions',
+    'passive_actions',
+    'cbets_faced',
+    'folds_to_cbet',
+)
+
+
+def _existing_columns():
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns('user_stats')}
+
+
+def upgrade() -> None:
+    # Database.init_db мог уже добавить колонки и таблицу
+    existing = _existing_columns()
+    with op.batch_alter_table('user_stats') as batch_op:
+        for name in COUNTER_COLUMNS:
+            if name not in existing:
+                batch_op.add_column(sa.Column(name, sa.Integer(), server_default='0'))
+
+    if 'game_snapshots' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'game_snapshots',
+            sa.Column('user_id', sa.String(50), primary_key=True),
+            sa.Column('data', sa.LargeBinary(), nullable=False),
+            sa.Column('updated_at', sa.DateTime()),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('game_snapshots')
+    existing = _existing_columns()
+    with op.batch_alter_table('user_stats') as batch_op:
+        for name in reversed(COUNTER_COLUMNS):
+            if name in existing:
+                batch_op.drop_column(name)
@@ -0,0 +1,68 @@
+"""Итоги против Equity AI в user_stats и user_daily_stats
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-20 11:00:00
+
+Колонки vs_equity_* и equity_* для типа AI 'equity'. Итоги в user_stats
+заполняются из game_sessions; дневные итоги пересобрать после миграции:
+python -m app.rollups
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (таблица, колонка, тип)
+COLUMNS = (
+    ('user_stats', 'vs_equity_winrate', sa.Float()),
+    ('user_stats', 'vs_equity_hands', sa.Integer()),
+    ('user_stats', 'vs_equity_profit', sa.Integer()),
+    ('user_daily_stats', 'equity_hands', sa.Integer()),
+    ('user_daily_stats', 'equity_net', sa.Integer()),
+)
+
+
+def _existing_columns(table):
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    # Database.init_db мог уже добавить колонки
+    for table in ('user_stats', 'user_daily_stats'):
+        existing = _existing_columns(table)
+        with op.batch_alter_table(table) as batch_op:
+            for column_table, name, column_type in COLUMNS:
+                if column_table == table and name not in existing:
+                    batch_op.add_column(sa.Column(name, column_type, server_default='0'))
+
+    op.execute("""
+        UPDATE user_stats SET
+            vs_equity_hands = (SELECT COALESCE(SUM(hands_played), 0) FROM game_sessions
+                               WHERE game_sessions.user_id = user_stats.user_id
+                               AND game_sessions.ai_opponent_type = 'equity'),
+            vs_equity_profit = (SELECT COALESCE(SUM(net_profit), 0) FROM game_sessions
+                                WHERE game_sessions.user_id = user_stats.user_id
+                                AND game_sessions.ai_opponent_type = 'equity')
+    """)
+    op.execute("""
+        UPDATE user_stats SET vs_equity_winrate = vs_equity_profit * 100.0 / vs_equity_hands
+        WHERE vs_equity_hands > 0
+    """)
+
+
+def downgrade() -> None:
+    for table in ('user_daily_stats', 'user_stats'):
+        existing = _existing_columns(table)
+        with op.batch_alter_table(table) as batch_op:
+            for column_table, name, _ in reversed(COLUMNS):
+                if column_table == table and name in existing:
+                    batch_op.drop_column(name)
@@ -0,0 +1,43 @@
+"""Винрейты user_stats в BB/100
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-20 12:00:00
+
+Итоги хранятся в фишках (big blind = 2 фишки), а винрейты считались как
+фишки на 100 раздач. Пересчитать их в BB/100 по сохраненным итогам.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BIG_BLIND = 2
+
+# (винрейт, раздачи, результат в фишках)
+WINRATES = (('cash_winrate', 'total_hands_played', 'total_profit'),) + tuple(
+    (f"vs_{ai_type}_winrate", f"vs_{ai_type}_hands", f"vs_{ai_type}_profit")
+    for ai_type in ('fish', 'nit', 'tag', 'lag', 'equity'))
+
+
+def _recompute(chips_per_unit: int) -> None:
+    for winrate, hands, profit in WINRATES:
+        op.execute(f"""
+            UPDATE user_stats SET {winrate} = {profit} * 100.0 / {chips_per_unit} / {hands}
+            WHERE {hands} > 0
+        """)
+
+
+def upgrade() -> None:
+    _recompute(BIG_BLIND)
+
+
+def downgrade() -> None:
+    _recompute(1)
@@ -0,0 +1,46 @@
+"""Таблица ml_training_data
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-21 10:00:00
+
+Таблицу решений для ML раньше создавал только DataPipeline при старте,
+поэтому база, обновленная одной миграцией, не проходила проверку
+планов (python -m app.query_plans). Схема - как в DataPipeline._init_database.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010'
+down_revision: Union[str, None] = '0009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # DataPipeline мог уже создать таблицу и индекс
+    if 'ml_training_data' not in inspector.get_table_names():
+        op.create_table(
+            'ml_training_data',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column('features', sa.Text(), nullable=False),
+            sa.Column('action', sa.Integer(), nullable=False),
+            sa.Column('result', sa.Float(), nullable=False),
+            sa.Column('timestamp', sa.DateTime(), server_default=sa.func.current_timestamp()),
+            sa.Column('user_id', sa.Integer()),
+            sa.Column('game_context', sa.Text()),
+        )
+    indexes = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('ml_training_data')}
+    if 'ix_ml_training_data_timestamp' not in indexes:
+        op.create_index('ix_ml_training_data_timestamp', 'ml_training_data', ['timestamp'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_ml_training_data_timestamp', table_name='ml_training_data')
+    op.drop_table('ml_training_data')
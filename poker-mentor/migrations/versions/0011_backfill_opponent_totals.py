@@ -0,0 +1,48 @@
+"""Итоги против fish/nit/tag/lag в user_stats по истории сессий
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-21 11:00:00
+
+Миграция 0002 добавила колонки vs_<тип>_hands/profit нулями, и
+StatsAggregator копит в них только раздачи, сыгранные после нее.
+Заполнить итоги из game_sessions (как 0008 для equity) и пересчитать
+винрейты в BB/100. game_sessions пишется вместе с user_stats, поэтому
+повторный запуск дает тот же результат.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0011'
+down_revision: Union[str, None] = '0010'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BIG_BLIND = 2
+AI_TYPES = ('fish', 'nit', 'tag', 'lag')
+
+
+def upgrade() -> None:
+    for ai_type in AI_TYPES:
+        op.execute(f"""
+            UPDATE user_stats SET
+                vs_{ai_type}_hands = (SELECT COALESCE(SUM(hands_played), 0) FROM game_sessions
+                                      WHERE game_sessions.user_id = user_stats.user_id
+                                      AND game_sessions.ai_opponent_type = '{ai_type}'),
+                vs_{ai_type}_profit = (SELECT COALESCE(SUM(net_profit), 0) FROM game_sessions
+                                       WHERE game_sessions.user_id = user_stats.user_id
+                                       AND game_sessions.ai_opponent_type = '{ai_type}')
+        """)
+        op.execute(f"""
+            UPDATE user_stats SET vs_{ai_type}_winrate = vs_{ai_type}_profit * 100.0 / {BIG_BLIND} / vs_{ai_type}_hands
+            WHERE vs_{ai_type}_hands > 0
+        """)
+
+
+def downgrade() -> None:
+    # Заполненные итоги совпадают с историей сессий, откатывать нечего
+    pass
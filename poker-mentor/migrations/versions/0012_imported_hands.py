@@ -0,0 +1,37 @@
+"""Таблица imported_hands
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-21 12:00:00
+
+Номера импортированных раздач (hh_import) с уникальным ключом
+(user_id, source_id): повторный импорт файла пропускает записанные
+раздачи. Раздачи, импортированные до миграции, ключей не имеют.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0012'
+down_revision: Union[str, None] = '0011'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Database.init_db мог уже создать таблицу
+    if 'imported_hands' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'imported_hands',
+            sa.Column('user_id', sa.Integer(), primary_key=True),
+            sa.Column('source_id', sa.String(64), primary_key=True),
+            sa.Column('hand_id', sa.Integer(), nullable=False),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('imported_hands')